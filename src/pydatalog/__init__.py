@@ -7,7 +7,10 @@ from .nodes import (
     Term,
     Variable,
     Constant,
+    Aggregate,
+    aggregate,
     atom,
+    negate,
     rule,
     fact,
     program,
@@ -20,7 +23,10 @@ __all__ = [
     "Term",
     "Variable",
     "Constant",
+    "Aggregate",
+    "aggregate",
     "atom",
+    "negate",
     "rule",
     "fact",
     "program",
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import math
+from typing import Iterable, List, Sequence, Tuple, Union
+
+from .symbols import Value
+
+Number = Union[int, float]
+
+# Aggregates whose value only moves one way as tuples are added, so they may
+# be computed through recursion by keeping the best value per group.
+LATTICE = ("min", "max")
+
+
+def numeric(value: Value) -> Union[Number, str]:
+    # A value is a number when it is the canonical text of one ("3", "2.5" but
+    # not "007" or "1_000"); everything else stays a string.
+    if not isinstance(value, str):
+        return value
+    try:
+        number: Number = int(value)
+    except ValueError:
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if not math.isfinite(number):
+            return value
+    return number if str(number) == value else value
+
+
+def order_key(value: Value) -> Tuple[int, Union[Number, str]]:
+    # numbers order numerically and before strings, as in SQLite
+    converted = numeric(value)
+    return (1, converted) if isinstance(converted, str) else (0, converted)
+
+
+def aggregate(function: str, values: Sequence[Value]) -> Value:
+    # `values` holds the aggregated variable once per distinct binding of the group
+    match function:
+        case "count":
+            return str(len(values))
+        case "sum":
+            total: Number = 0
+            for value in values:
+                converted = numeric(value)
+                # values that are not numbers do not contribute to a sum
+                if not isinstance(converted, str):
+                    total += converted
+            return str(total)
+        case "min":
+            return min(values, key=order_key)
+        case "max":
+            return max(values, key=order_key)
+    raise ValueError(f"unknown aggregate '{function}'")
+
+
+def combine(aggregates: Iterable[Tuple[int, str]], current: Sequence[Value], candidate: Sequence[Value]) -> Tuple[Value, ...]:
+    # the least upper bound of two rows of the same group of a min/max relation
+    merged: List[Value] = list(current)
+    for position, function in aggregates:
+        merged[position] = aggregate(function, [current[position], candidate[position]])
+    return tuple(merged)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+
+from . import nodes
+from .aggregates import LATTICE
+from .seminaive import _AtomSpec, _Const
+
+Adornment = Tuple[int, ...]
+
+"""
+Stratum is one strongly connected component of the predicate dependency
+graph. Strata are listed so that every relation a stratum depends on is
+computed by an earlier stratum; only recursive strata need a fixpoint.
+level is the negation stratum: the number of negations below it.
+"""
+@dataclass(frozen=True, slots=True)
+class Stratum:
+    relations: FrozenSet[str]
+    recursive: bool
+    level: int
+
+
+# head relation -> {(body relation, negated)}; a count or sum in the head
+# makes every body relation a negative dependency, as it needs them complete
+def dependency_graph(program: nodes.Program) -> Dict[str, Set[Tuple[str, bool]]]:
+    graph: Dict[str, Set[Tuple[str, bool]]] = {}
+    for rule in program.rules:
+        edges = graph.setdefault(rule.head.relation, set())
+        counted = any(f not in LATTICE for f in aggregate_functions(rule))
+        for atom in rule.body:
+            edges.add((atom.relation, atom.negated or counted))
+            graph.setdefault(atom.relation, set())
+    return graph
+
+
+def aggregate_functions(rule: nodes.Rule) -> Tuple[str, ...]:
+    return tuple(term.function for term in rule.head.terms if isinstance(term, nodes.Aggregate))
+
+
+# relation -> the aggregate functions in the heads of its rules
+def aggregated_relations(program: nodes.Program) -> Dict[str, Tuple[str, ...]]:
+    return {rule.head.relation: functions for rule in program.rules if (functions := aggregate_functions(rule))}
+
+
+# Tarjan's algorithm without recursion; components come out dependencies first.
+def strongly_connected_components(graph: Dict[str, Set[Tuple[str, bool]]]) -> List[FrozenSet[str]]:
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack: Set[str] = set()
+    stack: List[str] = []
+    components: List[FrozenSet[str]] = []
+    for root in graph:
+        if root in index:
+            continue
+        work: List[Tuple[str, List[str]]] = []
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work.append((root, sorted({dep for dep, _ in graph[root]})))
+        while work:
+            node, successors = work[-1]
+            if successors:
+                succ = successors.pop()
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, sorted({dep for dep, _ in graph[succ]})))
+                elif succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component: Set[str] = set()
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.add(member)
+                    if member == node:
+                        break
+                components.append(frozenset(component))
+    return components
+
+
+def stratify(program: nodes.Program) -> List[Stratum]:
+    graph = dependency_graph(program)
+    heads = {rule.head.relation for rule in program.rules}
+    aggregated = aggregated_relations(program)
+    strata: List[Stratum] = []
+    level: Dict[str, int] = {}
+    for component in strongly_connected_components(graph):
+        component_level = 0
+        recursive = False
+        for relation in component:
+            for dep, negated in graph[relation]:
+                if dep in component:
+                    recursive = True
+                    if negated and relation in aggregated:
+                        raise ValueError(f"program is not stratifiable: '{relation}' counts or sums over '{dep}' through recursion")
+                    if negated:
+                        raise ValueError(f"program is not stratifiable: '{relation}' depends negatively on '{dep}' through recursion")
+                else:
+                    component_level = max(component_level, level.get(dep, 0) + (1 if negated else 0))
+        # min and max keep one best tuple per group, which only holds through
+        # recursion when every relation of the component keeps best tuples
+        if recursive and component & aggregated.keys() and not component <= aggregated.keys():
+            plain = sorted(component - aggregated.keys())
+            raise ValueError(f"program is not stratifiable: '{plain[0]}' is recursive with min/max aggregates but aggregates nothing")
+        for relation in component:
+            level[relation] = component_level
+        # relations without rules are EDB and need no evaluation
+        if component & heads:
+            strata.append(Stratum(component, recursive, component_level))
+    return strata
+
+
+# Relations whose contents may change when `relation` changes, and whether
+# any of those changes pass through a negation or an aggregate.
+def dependents(program: nodes.Program, relation: str) -> Tuple[Set[str], bool]:
+    reverse: Dict[str, Set[Tuple[str, bool]]] = {}
+    for head, edges in dependency_graph(program).items():
+        for dep, negated in edges:
+            reverse.setdefault(dep, set()).add((head, negated))
+    affected: Set[str] = set()
+    through_negation = False
+    pending = [relation]
+    while pending:
+        current = pending.pop()
+        for head, negated in reverse.get(current, ()):
+            through_negation = through_negation or negated
+            if head not in affected:
+                affected.add(head)
+                pending.append(head)
+    if not through_negation and affected:
+        through_negation = not affected.isdisjoint(aggregated_relations(program))
+    return affected, through_negation
+
+
+# Columns each body atom is probed on when the body is joined in `order`
+# with the canonical slots in `bound` already known.
+def binding_patterns(body: Sequence[_AtomSpec], order: Iterable[int], bound: Iterable[int] = ()) -> List[Tuple[int, Adornment]]:
+    known: Set[int] = set(bound)
+    patterns: List[Tuple[int, Adornment]] = []
+    for atom_idx in order:
+        atom = body[atom_idx]
+        pattern = tuple(
+            col for col, column in enumerate(atom.columns)
+            if isinstance(column, _Const) or column in known
+        )
+        patterns.append((atom_idx, pattern))
+        known.update(c for c in atom.columns if isinstance(c, int))
+    return patterns
+
+
+# Adornments of every atom when the join is driven by a new tuple of each
+# body position in turn, the remaining atoms joined in source order.
+def trigger_adornments(body: Sequence[_AtomSpec]) -> Dict[str, Set[Adornment]]:
+    adornments: Dict[str, Set[Adornment]] = {}
+    for trigger_idx, trigger in enumerate(body):
+        if trigger.negated:
+            continue
+        order = sorted((i for i in range(len(body)) if i != trigger_idx), key=lambda i: body[i].negated)
+        bound = [c for c in trigger.columns if isinstance(c, int)]
+        for atom_idx, pattern in binding_patterns(body, order, bound):
+            adornments.setdefault(body[atom_idx].relation, set()).add(pattern)
+    return adornments
@@ -0,0 +1,288 @@
+from __future__ import annotations
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from . import memory
+from .__about__ import __version__
+from .execution import RulesPlan
+from .nodes import Atom, Program, Rule, Variable
+from .symbols import SymbolTable
+
+Row = Tuple[str, ...]
+
+"""
+Workload is one benchmark input: a program without facts and the rows of
+each of its base relations, loaded through RulesPlan.load_facts.
+"""
+@dataclass(frozen=True, slots=True)
+class Workload:
+    name: str
+    size: int
+    program: Program
+    facts: Dict[str, List[Row]]
+
+
+"""
+BenchmarkResult is the measurement of one workload evaluated by one strategy:
+wall-clock seconds of loading and of evaluation (the best of the timed runs;
+evaluation is execute() followed by counting every derived relation, which
+is where the tuple strategy derives), the peak of Python allocations over
+both (tracemalloc, so memory held by SQLite itself is not included), the
+base tuples loaded, the tuples in the derived relations, and the SQL
+statements issued (None for backends that are not SQLite).
+"""
+@dataclass(frozen=True, slots=True)
+class BenchmarkResult:
+    workload: str
+    size: int
+    strategy: str
+    backend: str
+    load_seconds: float
+    evaluate_seconds: float
+    peak_memory: int
+    base_tuples: int
+    derived_tuples: int
+    statements: Optional[int]
+
+
+# the measurements of one run of a workload
+@dataclass(frozen=True, slots=True)
+class _Measurement:
+    load_seconds: float
+    evaluate_seconds: float
+    peak_memory: int
+    derived_tuples: int
+    statements: Optional[int]
+
+
+def _atom(relation: str, *variables: str) -> Atom:
+    return Atom(relation, tuple(Variable(v) for v in variables))
+
+
+def _transitive_closure() -> Program:
+    return Program((
+        Rule(_atom("path", "X", "Y"), (_atom("edge", "X", "Y"),)),
+        Rule(_atom("path", "X", "Z"), (_atom("edge", "X", "Y"), _atom("path", "Y", "Z"))),
+    ))
+
+
+def chain(size: int) -> Workload:
+    # n0 -> n1 -> ... -> n<size>: size * (size + 1) / 2 paths
+    edges: List[Row] = [(f"n{i}", f"n{i + 1}") for i in range(size)]
+    return Workload("tc_chain", size, _transitive_closure(), {"edge": edges})
+
+
+def grid(size: int) -> Workload:
+    # a size x size grid with edges to the right and downwards
+    edges: List[Row] = []
+    for i in range(size):
+        for j in range(size):
+            if j + 1 < size:
+                edges.append((f"n{i}_{j}", f"n{i}_{j + 1}"))
+            if i + 1 < size:
+                edges.append((f"n{i}_{j}", f"n{i + 1}_{j}"))
+    return Workload("tc_grid", size, _transitive_closure(), {"edge": edges})
+
+
+def random_graph(size: int, degree: int = 2, seed: int = 0) -> Workload:
+    # size nodes with degree * size distinct edges drawn uniformly
+    rng = random.Random(seed)
+    edges: Set[Row] = set()
+    while len(edges) < min(degree * size, size * size):
+        edges.add((f"n{rng.randrange(size)}", f"n{rng.randrange(size)}"))
+    return Workload("tc_random", size, _transitive_closure(), {"edge": sorted(edges)})
+
+
+def same_generation(size: int) -> Workload:
+    # a binary tree of size nodes; sg holds the pairs of nodes at the same depth
+    program = Program((
+        Rule(_atom("sg", "X", "Y"), (_atom("parent", "X", "P"), _atom("parent", "Y", "P"))),
+        Rule(_atom("sg", "X", "Y"), (_atom("parent", "X", "A"), _atom("sg", "A", "B"), _atom("parent", "Y", "B"))),
+    ))
+    parents: List[Row] = [(f"n{i}", f"n{(i - 1) // 2}") for i in range(1, size)]
+    return Workload("same_generation", size, program, {"parent": parents})
+
+
+def points_to(size: int, seed: int = 0) -> Workload:
+    # Andersen-style points-to analysis over size pointer variables, with
+    # statements p = &a, p = q, p = *q and *p = q drawn at random
+    program = Program((
+        Rule(_atom("points_to", "P", "A"), (_atom("address_of", "P", "A"),)),
+        Rule(_atom("points_to", "P", "A"), (_atom("assign", "P", "Q"), _atom("points_to", "Q", "A"))),
+        Rule(_atom("points_to", "P", "A"), (
+            _atom("load", "P", "Q"), _atom("points_to", "Q", "R"), _atom("points_to", "R", "A"),
+        )),
+        Rule(_atom("points_to", "S", "A"), (
+            _atom("store", "Q", "R"), _atom("points_to", "Q", "S"), _atom("points_to", "R", "A"),
+        )),
+    ))
+    rng = random.Random(seed)
+
+    def pairs(count: int) -> List[Row]:
+        return sorted({(f"v{rng.randrange(size)}", f"v{rng.randrange(size)}") for _ in range(count)})
+
+    facts = {
+        "address_of": pairs(size),
+        "assign": pairs(size),
+        "load": pairs(size // 4),
+        "store": pairs(size // 4),
+    }
+    return Workload("points_to", size, program, facts)
+
+
+def multi_join(size: int, seed: int = 0) -> Workload:
+    # a non-recursive four-way chain join over relations of size rows each,
+    # with values drawn from size // 2 keys
+    program = Program((
+        Rule(_atom("q", "A", "E"), (
+            _atom("r1", "A", "B"), _atom("r2", "B", "C"), _atom("r3", "C", "D"), _atom("r4", "D", "E"),
+        )),
+    ))
+    rng = random.Random(seed)
+    keys = max(size // 2, 1)
+    facts: Dict[str, List[Row]] = {
+        relation: sorted({(f"k{rng.randrange(keys)}", f"k{rng.randrange(keys)}") for _ in range(size)})
+        for relation in ("r1", "r2", "r3", "r4")
+    }
+    return Workload("multi_join", size, program, facts)
+
+
+# every workload generator with its size at scale 1
+WORKLOADS: Dict[str, Tuple[Callable[[int], Workload], int]] = {
+    "tc_chain": (chain, 100),
+    "tc_grid": (grid, 8),
+    "tc_random": (random_graph, 100),
+    "same_generation": (same_generation, 128),
+    "points_to": (points_to, 100),
+    "multi_join": (multi_join, 200),
+}
+
+
+def _plan(workload: Workload, strategy: str, backend: str) -> Tuple[RulesPlan, Optional[sqlite3.Connection]]:
+    symbols = SymbolTable() if strategy == "columnar" else None
+    if backend == "sqlite":
+        conn = sqlite3.connect(":memory:")
+        return RulesPlan(workload.program, conn, conn, strategy=strategy, symbols=symbols), conn
+    if backend == "memory":
+        store = memory.MemoryStore()
+        return RulesPlan(workload.program, store, store, strategy=strategy, symbols=symbols), None
+    raise ValueError(f"unknown backend '{backend}', expected 'sqlite' or 'memory'")
+
+
+def _run(workload: Workload, strategy: str, backend: str, traced: bool) -> _Measurement:
+    plan, conn = _plan(workload, strategy, backend)
+    derived_relations = {rule.head.relation for rule in workload.program.rules if rule.body}
+    statements = 0
+
+    def count(_: str) -> None:
+        nonlocal statements
+        statements += 1
+
+    if traced:
+        tracemalloc.start()
+        if conn is not None:
+            conn.set_trace_callback(count)
+    try:
+        started = time.perf_counter()
+        for relation, rows in workload.facts.items():
+            plan.load_facts(relation, rows)
+        loaded = time.perf_counter()
+        plan.execute()
+        derived = sum(plan.count(relation) for relation in derived_relations)
+        evaluated = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1] if traced else 0
+    finally:
+        if traced:
+            tracemalloc.stop()
+            if conn is not None:
+                conn.set_trace_callback(None)
+    return _Measurement(loaded - started, evaluated - loaded, peak, derived, statements if conn is not None else None)
+
+
+def run_benchmark(workload: Workload, strategy: str, backend: str = "sqlite", repeat: int = 1) -> BenchmarkResult:
+    # Times `repeat` runs of the workload, each on a fresh plan and database,
+    # then makes one more run with tracemalloc and SQLite tracing on to measure
+    # memory and statements, so tracing does not distort the timings.
+    if repeat < 1:
+        raise ValueError(f"repeat must be at least 1, got {repeat}")
+    timings = [_run(workload, strategy, backend, traced=False) for _ in range(repeat)]
+    traced = _run(workload, strategy, backend, traced=True)
+    return BenchmarkResult(
+        workload=workload.name,
+        size=workload.size,
+        strategy=strategy,
+        backend=backend,
+        load_seconds=min(timing.load_seconds for timing in timings),
+        evaluate_seconds=min(timing.evaluate_seconds for timing in timings),
+        peak_memory=traced.peak_memory,
+        base_tuples=sum(len(rows) for rows in workload.facts.values()),
+        derived_tuples=traced.derived_tuples,
+        statements=traced.statements,
+    )
+
+
+def run_suite(
+    workloads: Sequence[str] = tuple(WORKLOADS),
+    strategies: Sequence[str] = ("tuple", "seminaive", "sql"),
+    scales: Sequence[int] = (1, 2, 4),
+    backend: str = "sqlite",
+    repeat: int = 1,
+) -> List[BenchmarkResult]:
+    results = []
+    for name in workloads:
+        if name not in WORKLOADS:
+            raise ValueError(f"unknown workload '{name}', expected one of {', '.join(WORKLOADS)}")
+        generate, base = WORKLOADS[name]
+        for scale in scales:
+            workload = generate(base * scale)
+            for strategy in strategies:
+                results.append(run_benchmark(workload, strategy, backend, repeat))
+    return results
+
+
+def report(results: Sequence[BenchmarkResult]) -> Dict[str, object]:
+    # the JSON document written by the command line: environment and results
+    return {
+        "pydatalog": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "results": [asdict(result) for result in results],
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m pydatalog.benchmarks", description="Benchmark RulesPlan on standard Datalog workloads.")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--strategies", nargs="+", default=["tuple", "seminaive", "sql"])
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--backend", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    results = run_suite(args.workloads, args.strategies, args.scales, args.backend, args.repeat)
+    document = json.dumps(report(results), indent=2)
+    if args.output is None:
+        print(document)
+        return
+    with open(args.output, "w") as f:
+        f.write(document + "\n")
+    for result in results:
+        print(
+            f"{result.workload:>16} {result.size:>6} {result.strategy:>10} "
+            f"{result.evaluate_seconds:>9.4f}s {result.derived_tuples:>9} tuples",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .seminaive import Orders, _AtomSpec, _Const, _RuleSpec, _delta_order, _rule_spec
+from .symbols import Value
+
+if TYPE_CHECKING:
+    from .analysis import Stratum
+    from .execution import _RuleHeadPlan
+    from .profiling import Profiler, RuleProfile
+
+# A relation is an (rows, arity) int64 array of symbol ids; bindings map each
+# bound canonical slot to one column, all columns of a binding being aligned.
+Relation = np.ndarray
+Bindings = Tuple[int, Dict[int, np.ndarray]]
+
+
+def _empty(arity: int) -> Relation:
+    return np.empty((0, arity), dtype=np.int64)
+
+
+def _relation(rows: Iterable[Tuple[Value, ...]], arity: int) -> Relation:
+    listed = list(rows)
+    if not listed or arity == 0:
+        return np.empty((min(len(listed), 1), arity), dtype=np.int64)
+    return np.array(listed, dtype=np.int64)
+
+
+def _keys(columns: Sequence[Sequence[np.ndarray]]) -> List[np.ndarray]:
+    # Maps rows made of the given (at least one) columns to one int64 key per
+    # row, consistently across every group of columns passed in. Rows are packed
+    # arithmetically when the values fit, and numbered through np.unique otherwise.
+    lengths = [len(group[0]) for group in columns]
+    width = len(columns[0])
+    if width == 1:
+        return [np.asarray(group[0], dtype=np.int64) for group in columns]
+    base = 1 + max((int(col.max()) for group in columns for col in group if len(col)), default=0)
+    if base ** width < 2 ** 62:
+        packed = []
+        for group in columns:
+            key = np.zeros(len(group[0]), dtype=np.int64)
+            for col in group:
+                key = key * base + col
+            packed.append(key)
+        return packed
+    stacked = np.concatenate([np.stack(group, axis=1) for group in columns])
+    _, codes = np.unique(stacked, axis=0, return_inverse=True)
+    codes = codes.reshape(-1).astype(np.int64)
+    return list(np.split(codes, np.cumsum(lengths)[:-1]))
+
+
+def _merge_join(left: np.ndarray, right: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # sort-merge equi-join of two key columns, returning matching row indexes
+    order = np.argsort(right, kind="stable")
+    ordered = right[order]
+    lo = np.searchsorted(ordered, left, side="left")
+    hi = np.searchsorted(ordered, left, side="right")
+    counts = hi - lo
+    left_idx = np.repeat(np.arange(len(left)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    right_idx = order[starts + np.arange(len(left_idx))]
+    return left_idx, right_idx
+
+
+def _select(atom: _AtomSpec, relation: Relation) -> Tuple[Relation, Dict[int, int]]:
+    # selection on constant positions and on variables repeated within the atom
+    mask = np.ones(len(relation), dtype=bool)
+    first_col: Dict[int, int] = {}
+    for col, column in enumerate(atom.columns):
+        if isinstance(column, _Const):
+            mask &= relation[:, col] == column.value
+        elif column in first_col:
+            mask &= relation[:, col] == relation[:, first_col[column]]
+        else:
+            first_col[column] = col
+    return (relation if mask.all() else relation[mask]), first_col
+
+
+def _join_atom(atom: _AtomSpec, bindings: Bindings, relation: Relation) -> Bindings:
+    size, slots = bindings
+    selected, first_col = _select(atom, relation)
+    key_slots = [slot for slot in first_col if slot in slots]
+    if key_slots:
+        left_key, right_key = _keys([[slots[s] for s in key_slots], [selected[:, first_col[s]] for s in key_slots]])
+        left_idx, right_idx = _merge_join(left_key, right_key)
+    else:
+        left_idx = np.repeat(np.arange(size), len(selected))
+        right_idx = np.tile(np.arange(len(selected)), size)
+    joined = {slot: column[left_idx] for slot, column in slots.items()}
+    for slot, col in first_col.items():
+        if slot not in joined:
+            joined[slot] = selected[right_idx, col]
+    return len(left_idx), joined
+
+
+def _anti_join(atom: _AtomSpec, bindings: Bindings, relation: Relation) -> Bindings:
+    size, slots = bindings
+    if not atom.columns:
+        keep = np.full(size, len(relation) == 0)
+        return int(keep.sum()), {slot: column[keep] for slot, column in slots.items()}
+    ground = [
+        np.full(size, column.value, dtype=np.int64) if isinstance(column, _Const) else slots[column]
+        for column in atom.columns
+    ]
+    probe, present = _keys([ground, [relation[:, c] for c in range(relation.shape[1])]])
+    keep = ~np.isin(probe, present)
+    return int(keep.sum()), {slot: column[keep] for slot, column in slots.items()}
+
+
+def _join(
+    spec: _RuleSpec,
+    order: Iterable[int],
+    bindings: Bindings,
+    relations: Dict[str, Relation],
+    profile: Optional[RuleProfile] = None,
+) -> Bindings:
+    for atom_idx in sorted(order, key=lambda i: spec.body[i].negated):
+        if bindings[0] == 0:
+            break
+        atom = spec.body[atom_idx]
+        if profile is not None:
+            profile.probes += bindings[0]
+        if atom.negated:
+            bindings = _anti_join(atom, bindings, relations[atom.relation])
+        else:
+            bindings = _join_atom(atom, bindings, relations[atom.relation])
+    return bindings
+
+
+def _project(spec: _RuleSpec, bindings: Bindings) -> Relation:
+    size, slots = bindings
+    if size == 0:
+        return _empty(len(spec.head_columns))
+    columns = [
+        np.full(size, column.value, dtype=np.int64) if isinstance(column, _Const) else slots[column]
+        for column in spec.head_columns
+    ]
+    return np.stack(columns, axis=1) if columns else np.empty((size, 0), dtype=np.int64)
+
+
+def _new_rows(candidates: Relation, existing: Relation) -> Relation:
+    # deduplicate the candidates and drop the rows already in the relation
+    if len(candidates) == 0:
+        return candidates
+    arity = candidates.shape[1]
+    if arity == 0:
+        return candidates[:0] if len(existing) else candidates[:1]
+    cand_key, existing_key = _keys([
+        [candidates[:, c] for c in range(arity)],
+        [existing[:, c] for c in range(arity)],
+    ])
+    _, first = np.unique(cand_key, return_index=True)
+    first = first[~np.isin(cand_key[first], existing_key)]
+    return candidates[np.sort(first)]
+
+
+"""
+ColumnarEvaluator is the set-at-a-time evaluator behind the columnar strategy.
+Relations are held as int64 arrays of symbol ids (the plan must intern its
+values) and every rule body runs as vectorized operations: selections on
+constant positions, sort-merge joins on the bound slots, anti-joins for
+negated atoms and projection to the head, with new tuples deduplicated
+against the full relation. Strata, join orders and semi-naive deltas follow
+SemiNaiveEvaluator; only the new tuples are written back to storage.
+Given a Profiler, duplicates are counted per rule evaluation against the
+relation as it was before the round.
+"""
+class ColumnarEvaluator:
+    _heads: Dict[str, _RuleHeadPlan]
+    _rules: List[Tuple[int, _RuleSpec]]
+    _orders: Orders
+    _strata: Optional[List[Stratum]]
+    _relations: Dict[str, Relation]
+    _profiler: Optional[Profiler]
+
+    def __init__(
+        self,
+        heads: Dict[str, _RuleHeadPlan],
+        orders: Optional[Orders] = None,
+        strata: Optional[List[Stratum]] = None,
+        profiler: Optional[Profiler] = None,
+    ) -> None:
+        self._heads = heads
+        self._rules = [(body._rule_idx, _rule_spec(body)) for head in heads.values() for body in head._lower]
+        self._orders = orders or {}
+        self._strata = strata
+        self._relations = {}
+        self._profiler = profiler
+
+    def load(self) -> None:
+        for relation, head_plan in self._heads.items():
+            self._relations[relation] = _relation(head_plan._storage.load(), head_plan._storage.arity)
+
+    def relation(self, relation: str) -> Relation:
+        return self._relations[relation]
+
+    def run(self) -> None:
+        self.load()
+        if self._strata is None:
+            self._evaluate_stratum(self._rules, True)
+            return
+        for stratum in self._strata:
+            rules = [(rule_idx, spec) for rule_idx, spec in self._rules if spec.head_relation in stratum.relations]
+            self._evaluate_stratum(rules, stratum.recursive)
+
+    def _evaluate_stratum(self, rules: List[Tuple[int, _RuleSpec]], recursive: bool) -> None:
+        derived: Dict[str, List[Relation]] = {}
+        for rule_idx, spec in rules:
+            order: Iterable[int] = self._orders.get((rule_idx, None), range(len(spec.body)))
+            bindings = _join(spec, order, (1, {}), self._relations, self._profile(rule_idx))
+            self._collect(derived, rule_idx, spec, _project(spec, bindings))
+        delta = self._store(derived)
+        while recursive and delta:
+            derived = {}
+            for rule_idx, spec in rules:
+                for delta_idx, atom in enumerate(spec.body):
+                    delta_rows = delta.get(atom.relation)
+                    if delta_rows is None or atom.negated:
+                        continue
+                    seeds = _join_atom(atom, (1, {}), delta_rows)
+                    order = _delta_order(rule_idx, spec, self._orders, delta_idx)
+                    bindings = _join(spec, order, seeds, self._relations, self._profile(rule_idx))
+                    self._collect(derived, rule_idx, spec, _project(spec, bindings))
+            delta = self._store(derived)
+
+    def _profile(self, rule_idx: int) -> Optional[RuleProfile]:
+        return self._profiler.rule(rule_idx) if self._profiler is not None else None
+
+    def _collect(self, derived: Dict[str, List[Relation]], rule_idx: int, spec: _RuleSpec, rows: Relation) -> None:
+        if self._profiler is not None:
+            profile = self._profiler.rule(rule_idx)
+            profile.firings += 1
+            profile.produced += len(rows)
+            profile.duplicates += len(rows) - len(_new_rows(rows, self._relations[spec.head_relation]))
+        derived.setdefault(spec.head_relation, []).append(rows)
+
+    def _store(self, derived: Dict[str, List[Relation]]) -> Dict[str, Relation]:
+        delta: Dict[str, Relation] = {}
+        for relation, parts in derived.items():
+            added = _new_rows(np.concatenate(parts), self._relations[relation])
+            if len(added) == 0:
+                continue
+            self._relations[relation] = np.concatenate([self._relations[relation], added])
+            self._heads[relation]._storage.store_many(map(tuple, added.tolist()))
+            delta[relation] = added
+        if self._profiler is not None and delta:
+            self._profiler.iteration({relation: len(rows) for relation, rows in delta.items()})
+        return delta
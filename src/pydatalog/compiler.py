@@ -0,0 +1,535 @@
+from __future__ import annotations
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Collection, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from . import aggregates
+from . import db
+from .seminaive import _Const, _RuleSpec, _rule_spec
+from .symbols import Value
+
+if TYPE_CHECKING:
+    from .analysis import Stratum
+    from .execution import _RuleHeadPlan
+    from .profiling import Profiler
+
+Row = Tuple[Value, ...]
+
+"""
+CompiledRule is a rule body translated into a single INSERT ... SELECT statement.
+Delta variants restrict one body atom to the rows stored in the rowid range
+(:lo, :hi], which is exactly the set of tuples derived in the previous iteration.
+Negated atoms become NOT EXISTS subqueries over the already bound columns.
+The rules of a relation aggregating with count or sum compile together into
+one grouped statement over the distinct bindings of each body. query is the
+SELECT whose rows the statement inserts.
+"""
+@dataclass(frozen=True, slots=True)
+class CompiledRule:
+    spec: _RuleSpec
+    delta_idx: Optional[int]
+    sql: str
+    params: Dict[str, Value]
+    query: str
+
+
+def _param(params: Dict[str, Value], value: Value) -> str:
+    name = f"c{len(params)}"
+    params[name] = value
+    return f":{name}"
+
+
+def compile_rule(
+    spec: _RuleSpec,
+    delta_idx: Optional[int] = None,
+    order: Optional[Sequence[int]] = None,
+) -> CompiledRule:
+    params: Dict[str, Value] = {}
+    source, where, slot_columns = _body(spec, delta_idx, order, params)
+    select = _head(spec, slot_columns, params)
+    # SQLite requires a WHERE clause on INSERT ... SELECT to disambiguate the upsert clause
+    query = f"SELECT {', '.join(select)} {source}WHERE {' AND '.join(where) or '1'}"
+    sql = f"INSERT INTO {spec.head_relation} {query} ON CONFLICT DO NOTHING"
+    return CompiledRule(spec, delta_idx, sql, params, query)
+
+
+def compile_overdelete(spec: _RuleSpec, delta_idx: int, order: Optional[Sequence[int]] = None) -> CompiledRule:
+    # The over-deletion of DRed: the head tuples still stored that have a
+    # derivation using a tuple over-deleted from the delta atom's relation, in
+    # the rowid range (:lo, :hi] of its deleted table. They are added to the
+    # deleted table of the head relation.
+    params: Dict[str, Value] = {}
+    deleted = {delta_idx: deleted_table(spec.body[delta_idx].relation)}
+    source, where, slot_columns = _body(spec, delta_idx, order, params, deleted)
+    select = _head(spec, slot_columns, params)
+    stored = ' AND '.join(f"h.col{k} = {ref}" for k, ref in enumerate(select))
+    where.append(f"EXISTS (SELECT 1 FROM {spec.head_relation} AS h WHERE {stored})")
+    query = f"SELECT {', '.join(select)} {source}WHERE {' AND '.join(where)}"
+    sql = f"INSERT INTO {deleted_table(spec.head_relation)} {query} ON CONFLICT DO NOTHING"
+    return CompiledRule(spec, delta_idx, sql, params, query)
+
+
+def compile_rederive(spec: _RuleSpec, order: Optional[Sequence[int]] = None) -> CompiledRule:
+    # The re-derivation of DRed: the tuples of the head relation's deleted
+    # table past rowid :skip that still have a derivation are stored again.
+    params: Dict[str, Value] = {}
+    source, where, slot_columns = _body(spec, None, order, params)
+    select = _head(spec, slot_columns, params)
+    columns = ', '.join(f"col{k}" for k in range(len(select)))
+    where.append(
+        f"({', '.join(select)}) IN (SELECT {columns} FROM {deleted_table(spec.head_relation)} WHERE rowid > :skip)"
+    )
+    query = f"SELECT {', '.join(select)} {source}WHERE {' AND '.join(where)}"
+    sql = f"INSERT INTO {spec.head_relation} {query} ON CONFLICT DO NOTHING"
+    return CompiledRule(spec, None, sql, params, query)
+
+
+def deleted_table(relation: str) -> str:
+    # the temporary table of the tuples DRed over-deletes from a relation
+    return f"pydatalog_deleted_{relation}"
+
+
+def compile_aggregate(specs: Sequence[_RuleSpec], orders: Sequence[Optional[Sequence[int]]]) -> CompiledRule:
+    # every rule contributes the head values of its distinct bindings; groups
+    # are formed over all of them
+    params: Dict[str, Value] = {}
+    head = specs[0]
+    functions = dict(head.aggregates)
+    branches: List[str] = []
+    for spec, order in zip(specs, orders):
+        source, where, slot_columns = _body(spec, None, order, params)
+        bindings = ', '.join(f'{ref} AS s{slot}' for slot, ref in slot_columns.items())
+        values: List[str] = []
+        for k, column in enumerate(spec.head_columns):
+            match column:
+                case _Const(value=const_val):
+                    values.append(f"{_param(params, const_val)} AS a{k}")
+                case int() as slot:
+                    values.append(f"s{slot} AS a{k}")
+        branches.append(
+            f"SELECT {', '.join(values)} FROM (SELECT DISTINCT {bindings} {source}WHERE {' AND '.join(where) or '1'})"
+        )
+    select: List[str] = []
+    for k in range(len(head.head_columns)):
+        function = functions.get(k)
+        value = _numeric(f"a{k}")
+        match function:
+            case None:
+                select.append(f"a{k}")
+            case "count":
+                select.append("COUNT(*)")
+            case "sum":
+                select.append(f"COALESCE(SUM(CASE WHEN typeof({value}) = 'text' THEN NULL ELSE {value} END), 0)")
+            case _:
+                select.append(f"{function.upper()}({value})")
+    group = [f"a{k}" for k in range(len(head.head_columns)) if k not in functions]
+    grouping = f"GROUP BY {', '.join(group)} " if group else ""
+    query = (
+        f"SELECT {', '.join(select)} FROM ({' UNION ALL '.join(branches)}) "
+        f"WHERE 1 {grouping}HAVING COUNT(*) > 0"
+    )
+    sql = f"INSERT INTO {head.head_relation} {query} ON CONFLICT DO NOTHING"
+    return CompiledRule(head, None, sql, params, query)
+
+
+def compile_merge(relation: str, arity: int, functions: Sequence[Tuple[int, str]]) -> Tuple[str, str]:
+    # Two statements keeping one tuple per group of a min/max relation, for the
+    # groups that received tuples past rowid :lo. The first stores each group's
+    # best values as one tuple, the second deletes every other tuple of the group.
+    positions = dict(functions)
+    group = [f"col{k}" for k in range(arity) if k not in positions]
+    if group:
+        touched = f"({', '.join(group)}) IN (SELECT {', '.join(group)} FROM {relation} WHERE rowid > :lo)"
+    else:
+        touched = f"EXISTS (SELECT 1 FROM {relation} WHERE rowid > :lo)"
+    grouping = f"GROUP BY {', '.join(group)} " if group else ""
+    best = [
+        f"{positions[k].upper()}({_numeric(f'col{k}')})" if k in positions else f"col{k}"
+        for k in range(arity)
+    ]
+    merge = (
+        f"INSERT INTO {relation} SELECT {', '.join(best)} FROM {relation} "
+        f"WHERE {touched} {grouping}HAVING COUNT(*) > 0 ON CONFLICT DO NOTHING"
+    )
+    named = [f"{expr} AS b{k}" if k in positions else f"col{k}" for k, expr in enumerate(best)]
+    joined = ' AND '.join(f"a.{col} = best.{col}" for col in group) or '1'
+    kept = ' AND '.join(f"{_numeric(f'a.col{k}')} = best.b{k}" for k in positions)
+    prune = (
+        f"DELETE FROM {relation} WHERE rowid IN ("
+        f"SELECT a.rowid FROM {relation} AS a JOIN ("
+        f"SELECT {', '.join(named)} FROM {relation} WHERE {touched} {grouping}HAVING COUNT(*) > 0"
+        f") AS best ON {joined} WHERE NOT ({kept}))"
+    )
+    return merge, prune
+
+
+def _numeric(ref: str) -> str:
+    # the value as a number when it is the canonical text of one, as in
+    # aggregates.numeric; numbers sort before text in SQLite as well
+    return (
+        f"(CASE WHEN CAST(CAST({ref} AS INTEGER) AS TEXT) = {ref} THEN CAST({ref} AS INTEGER) "
+        f"WHEN CAST(CAST({ref} AS REAL) AS TEXT) = {ref} THEN CAST({ref} AS REAL) ELSE {ref} END)"
+    )
+
+
+def _head(spec: _RuleSpec, slot_columns: Dict[int, str], params: Dict[str, Value]) -> List[str]:
+    # the expression of every head column
+    select: List[str] = []
+    for column in spec.head_columns:
+        match column:
+            case _Const(value=const_val):
+                select.append(_param(params, const_val))
+            case int() as slot:
+                select.append(slot_columns[slot])
+    return select
+
+
+def _body(
+    spec: _RuleSpec,
+    delta_idx: Optional[int],
+    order: Optional[Sequence[int]],
+    params: Dict[str, Value],
+    tables: Optional[Dict[int, str]] = None,
+) -> Tuple[str, List[str], Dict[int, str]]:
+    # the FROM clause and WHERE conditions of a rule body, and the column
+    # reference binding each slot; `tables` reads some atoms from other tables
+    slot_columns: Dict[int, str] = {}
+
+    def param(value: Value) -> str:
+        return _param(params, value)
+
+    from_clause: List[str] = []
+    where: List[str] = []
+    body_order = list(order if order is not None else range(len(spec.body)))
+    negated = [i for i in body_order if spec.body[i].negated]
+    # atoms are listed in the planned order; SQLite's planner may still reorder them
+    for position, atom_idx in enumerate(i for i in body_order if not spec.body[i].negated):
+        atom = spec.body[atom_idx]
+        alias = f"t{atom_idx}"
+        on: List[str] = []
+        for col, column in enumerate(atom.columns):
+            ref = f"{alias}.col{col}"
+            match column:
+                case _Const(value=const_val):
+                    on.append(f"{ref} = {param(const_val)}")
+                case int() as slot:
+                    if slot in slot_columns:
+                        on.append(f"{ref} = {slot_columns[slot]}")
+                    else:
+                        slot_columns[slot] = ref
+        if atom_idx == delta_idx:
+            on.append(f"{alias}.rowid > :lo AND {alias}.rowid <= :hi")
+        table = (tables or {}).get(atom_idx, atom.relation)
+        if position == 0:
+            from_clause.append(f"{table} AS {alias}")
+            where.extend(on)
+        else:
+            from_clause.append(f"JOIN {table} AS {alias} ON {' AND '.join(on) or '1'}")
+    for atom_idx in negated:
+        atom = spec.body[atom_idx]
+        alias = f"t{atom_idx}"
+        conditions: List[str] = []
+        for col, column in enumerate(atom.columns):
+            match column:
+                case _Const(value=const_val):
+                    conditions.append(f"{alias}.col{col} = {param(const_val)}")
+                case int() as slot:
+                    conditions.append(f"{alias}.col{col} = {slot_columns[slot]}")
+        where.append(
+            f"NOT EXISTS (SELECT 1 FROM {atom.relation} AS {alias} WHERE {' AND '.join(conditions) or '1'})"
+        )
+    source = f"FROM {' '.join(from_clause)} " if from_clause else ""
+    return source, where, slot_columns
+
+
+"""
+SqlEvaluator runs semi-naive evaluation entirely inside SQLite using the
+statements produced by compile_rule. All relations must share one connection.
+Strata are evaluated in order; only recursive strata run delta statements.
+Relations aggregating with min/max are settled after every round with the
+statements of compile_merge, so they can take part in recursion.
+
+Given a Profiler, every statement run counts as a firing of its rule; the
+rows its SELECT produces are counted with an extra COUNT(*) query, and those
+not inserted are the duplicates rejected by ON CONFLICT. The insert itself is
+recorded as a store into the head relation, and each round of propagation
+as an iteration.
+
+The evaluator never commits: every round runs inside a savepoint, released
+once the round is complete and rolled back if it fails, within a transaction
+the caller commits (RulesPlan does so when its batch exits).
+"""
+class SqlEvaluator:
+    _heads: Dict[str, _RuleHeadPlan]
+    _tables: Dict[str, db.Db]
+    _orders: Dict[Tuple[int, Optional[int]], Tuple[int, ...]]
+    _conn: Optional[sqlite3.Connection]
+    _full: List[CompiledRule]
+    _delta: Dict[str, List[CompiledRule]]
+    _strata: Optional[List[Stratum]]
+    _merges: Dict[str, Tuple[str, str]]
+    _rule_indexes: Dict[int, int]
+    _profiler: Optional[Profiler]
+
+    def __init__(
+        self,
+        heads: Dict[str, _RuleHeadPlan],
+        orders: Optional[Dict[Tuple[int, Optional[int]], Tuple[int, ...]]] = None,
+        strata: Optional[List[Stratum]] = None,
+        profiler: Optional[Profiler] = None,
+    ) -> None:
+        self._heads = heads
+        self._strata = strata
+        self._profiler = profiler
+        # rule index of every compiled statement, by id of its spec
+        self._rule_indexes = {}
+        orders = self._orders = orders or {}
+        self._tables = {}
+        connections: Dict[int, sqlite3.Connection] = {}
+        for relation, head in heads.items():
+            if not isinstance(head._storage, db.Db):
+                raise ValueError("the sql strategy requires every relation to be stored in sqlite3")
+            self._tables[relation] = head._storage
+            connections[id(head._storage._db_connection)] = head._storage._db_connection
+        if len(connections) > 1:
+            raise ValueError("the sql strategy requires idb and edb relations to share one sqlite3 connection")
+        self._full = []
+        self._delta = {}
+        self._merges = {}
+        for relation, head in heads.items():
+            specs = [_rule_spec(body) for body in head._lower]
+            if specs and specs[0].aggregates:
+                if all(f in aggregates.LATTICE for _, f in specs[0].aggregates):
+                    self._merges[relation] = compile_merge(relation, head._storage.arity, specs[0].aggregates)
+                else:
+                    # count and sum are never recursive: one statement computes them
+                    full_orders = [orders.get((body._rule_idx, None)) for body in head._lower]
+                    self._full.append(compile_aggregate(specs, full_orders))
+                    self._rule_indexes[id(specs[0])] = head._lower[0]._rule_idx
+                    continue
+            for body, spec in zip(head._lower, specs):
+                self._rule_indexes[id(spec)] = body._rule_idx
+                self._full.append(compile_rule(spec, None, orders.get((body._rule_idx, None))))
+                for delta_idx, atom in enumerate(spec.body):
+                    if atom.negated:
+                        continue
+                    order = orders.get((body._rule_idx, delta_idx))
+                    self._delta.setdefault(atom.relation, []).append(compile_rule(spec, delta_idx, order))
+        self._conn = next(iter(connections.values()), None)
+
+    @property
+    def statements(self) -> List[CompiledRule]:
+        return self._full + [rule for rules in self._delta.values() for rule in rules]
+
+    def run(self) -> None:
+        if self._conn is None:
+            return
+        if self._strata is None:
+            marks = self.marks()
+            with self._round():
+                for rule in self._full:
+                    self._execute(rule, rule.params)
+                self._settle(marks)
+                self._iteration(marks)
+            self.propagate(marks)
+            return
+        for stratum in self._strata:
+            marks = self.marks()
+            with self._round():
+                for rule in self._full:
+                    if rule.spec.head_relation in stratum.relations:
+                        self._execute(rule, rule.params)
+                self._settle(marks, stratum.relations)
+                self._iteration(marks)
+            if stratum.recursive:
+                self.propagate(marks, stratum.relations)
+
+    def propagate(self, marks: Dict[str, int], relations: Optional[Collection[str]] = None) -> None:
+        # run delta variants until no relation grows past its mark
+        if self._conn is None:
+            return
+        while True:
+            current = self.marks()
+            ranges = {rel: (marks[rel], hi) for rel, hi in current.items() if hi > marks[rel]}
+            if not ranges:
+                break
+            with self._round():
+                for relation, (lo, hi) in ranges.items():
+                    for rule in self._delta.get(relation, []):
+                        if relations is not None and rule.spec.head_relation not in relations:
+                            continue
+                        self._execute(rule, {**rule.params, "lo": lo, "hi": hi})
+                self._settle(current, relations)
+                self._iteration(current)
+            marks = current
+
+    def retract(self, relation: str, rows: Sequence[Row], facts: Dict[str, List[Row]]) -> int:
+        # Deletes rows from a relation and maintains the derived relations with
+        # DRed, in SQL: over-delete into a temporary table per relation whatever
+        # has a derivation using a deleted tuple, delete those tuples, store
+        # again the ones that are facts or still have a derivation, and
+        # propagate them. Relations defined through negation or aggregates are
+        # to be evaluated again instead. Returns the number of rows deleted
+        # that were not stored again.
+        if self._conn is None:
+            return 0
+        conn = self._conn
+        try:
+            with self._round():
+                for name, table in self._tables.items():
+                    columns = ', '.join(f"col{i}" for i in range(table.arity))
+                    conn.execute(f"DROP TABLE IF EXISTS temp.{deleted_table(name)}")
+                    conn.execute(f"CREATE TEMP TABLE {deleted_table(name)} ({columns}, UNIQUE ({columns}))")
+                table = self._tables[relation]
+                columns = ', '.join(f"col{i}" for i in range(table.arity))
+                conditions = ' AND '.join(f"col{i} = ?" for i in range(table.arity))
+                conn.executemany(
+                    f"INSERT INTO {deleted_table(relation)} SELECT {columns} FROM {relation} "
+                    f"WHERE {conditions} ON CONFLICT DO NOTHING",
+                    rows,
+                )
+                removed = self._deleted_marks()[relation]
+                if not removed:
+                    return 0
+                self._overdelete()
+                for name, table in self._tables.items():
+                    columns = ', '.join(f"col{i}" for i in range(table.arity))
+                    conn.execute(f"DELETE FROM {name} WHERE ({columns}) IN (SELECT {columns} FROM {deleted_table(name)})")
+                marks = self.marks()
+                self._rederive(relation, removed, facts, set(rows))
+            self.propagate(marks)
+            table = self._tables[relation]
+            columns = ', '.join(f"col{i}" for i in range(table.arity))
+            (kept,) = conn.execute(
+                f"SELECT COUNT(*) FROM {deleted_table(relation)} "
+                f"WHERE rowid <= ? AND ({columns}) IN (SELECT {columns} FROM {relation})",
+                (removed,),
+            ).fetchone()
+            return removed - kept
+        finally:
+            for name in self._tables:
+                conn.execute(f"DROP TABLE IF EXISTS temp.{deleted_table(name)}")
+
+    def _overdelete(self) -> None:
+        # runs the over-deletion statements until no deleted table grows
+        assert self._conn is not None
+        statements: Dict[str, List[CompiledRule]] = {}
+        for head in self._heads.values():
+            for body in head._lower:
+                spec = _rule_spec(body)
+                if spec.aggregates:
+                    continue
+                for delta_idx, atom in enumerate(spec.body):
+                    if not atom.negated:
+                        order = self._orders.get((body._rule_idx, delta_idx))
+                        statements.setdefault(atom.relation, []).append(compile_overdelete(spec, delta_idx, order))
+        marks = {name: 0 for name in self._tables}
+        while True:
+            current = self._deleted_marks()
+            ranges = {name: (marks[name], hi) for name, hi in current.items() if hi > marks[name]}
+            if not ranges:
+                return
+            for name, (lo, hi) in ranges.items():
+                for rule in statements.get(name, []):
+                    self._conn.execute(rule.sql, {**rule.params, "lo": lo, "hi": hi})
+            marks = current
+
+    def _rederive(self, relation: str, removed: int, facts: Dict[str, List[Row]], rows: Set[Row]) -> None:
+        # stores again the over-deleted tuples that are facts or have a
+        # derivation from the tuples left; those of `relation` up to rowid
+        # `removed` are the rows deleted, only derivations may bring them back
+        assert self._conn is not None
+        deleted = self._deleted_marks()
+        for name, head in self._heads.items():
+            if not deleted[name]:
+                continue
+            placeholders = ', '.join('?' * self._tables[name].arity)
+            self._conn.executemany(
+                f"INSERT INTO {name} VALUES ({placeholders}) ON CONFLICT DO NOTHING",
+                [row for row in facts.get(name, []) if name != relation or row not in rows],
+            )
+            for body in head._lower:
+                spec = _rule_spec(body)
+                if spec.aggregates:
+                    continue
+                self._rule_indexes[id(spec)] = body._rule_idx
+                rule = compile_rederive(spec, self._orders.get((body._rule_idx, None)))
+                self._execute(rule, {**rule.params, "skip": removed if name == relation else 0})
+
+    def _deleted_marks(self) -> Dict[str, int]:
+        assert self._conn is not None
+        return {
+            name: self._conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {deleted_table(name)}").fetchone()[0]
+            for name in self._tables
+        }
+
+    def explain(self) -> Dict[Tuple[int, Optional[int]], List[str]]:
+        # EXPLAIN QUERY PLAN of every statement, by (rule index, delta position)
+        plans: Dict[Tuple[int, Optional[int]], List[str]] = {}
+        if self._conn is None:
+            return plans
+        for rule in self.statements:
+            cursor = self._conn.execute(f"EXPLAIN QUERY PLAN {rule.query}", {**rule.params, "lo": 0, "hi": 0})
+            plans[(self._rule_indexes[id(rule.spec)], rule.delta_idx)] = [row[3] for row in cursor]
+        return plans
+
+    @contextmanager
+    def _round(self) -> Iterator[None]:
+        # Released into the caller's transaction, which is opened here if need
+        # be: releasing the outermost savepoint would commit otherwise.
+        # Connections in autocommit mode commit every round.
+        assert self._conn is not None
+        if not self._conn.in_transaction and self._conn.isolation_level is not None:
+            self._conn.execute("BEGIN")
+        self._conn.execute("SAVEPOINT pydatalog_round")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK TO pydatalog_round")
+            self._conn.execute("RELEASE pydatalog_round")
+            raise
+        self._conn.execute("RELEASE pydatalog_round")
+
+    def _execute(self, rule: CompiledRule, params: Dict[str, Value]) -> None:
+        assert self._conn is not None
+        if self._profiler is None:
+            self._conn.execute(rule.sql, params)
+            return
+        profile = self._profiler.rule(self._rule_indexes[id(rule.spec)])
+        (produced,) = self._conn.execute(f"SELECT COUNT(*) FROM ({rule.query})", params).fetchone()
+        started = time.perf_counter()
+        inserted = max(self._conn.execute(rule.sql, params).rowcount, 0)
+        # the statement's insert is a store into the head relation
+        self._profiler.stored(rule.spec.head_relation, inserted, 0, time.perf_counter() - started)
+        profile.firings += 1
+        profile.produced += produced
+        profile.duplicates += produced - inserted
+
+    def _iteration(self, marks: Dict[str, int]) -> None:
+        # the tuples stored past the marks form the round's delta
+        if self._profiler is None:
+            return
+        assert self._conn is not None
+        delta = {}
+        for relation, head in self._heads.items():
+            if head._storage.watermark() > marks[relation]:
+                (delta[relation],) = self._conn.execute(
+                    f"SELECT COUNT(*) FROM {relation} WHERE rowid > ?", (marks[relation],)
+                ).fetchone()
+        if delta:
+            self._profiler.iteration(delta)
+
+    def _settle(self, marks: Dict[str, int], relations: Optional[Collection[str]] = None) -> None:
+        # keep one tuple per group in the min/max relations that grew past their mark
+        assert self._conn is not None
+        for relation, (merge, prune) in self._merges.items():
+            if relations is not None and relation not in relations:
+                continue
+            if self._heads[relation]._storage.watermark() > marks[relation]:
+                self._conn.execute(merge, {"lo": marks[relation]})
+                self._conn.execute(prune, {"lo": marks[relation]})
+
+    def marks(self) -> Dict[str, int]:
+        return {relation: head._storage.watermark() for relation, head in self._heads.items()}
@@ -1,15 +1,37 @@
 import sqlite3
-from typing import Iterator, Tuple
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Sequence, Set, Tuple
+
+from .planner import RelationStats
+from .symbols import Value
+
+Row = Tuple[Value, ...]
 
 class Db:
     relation: str
     arity: int
-    def __init__(self, conn: sqlite3.Connection, relation: str, arity: int) -> None:
+    column_type: str
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        relation: str,
+        arity: int,
+        column_type: str = "TEXT",
+        create: bool = True,
+        temporary: bool = False,
+    ) -> None:
         self._db_connection = conn
         self.arity = arity
         self.relation = relation
-        self._create_table_if_not_exists(relation)
-    def store(self, tuple_data: Tuple[str, ...]) -> bool:
+        # INTEGER columns hold the symbol ids of an interned plan
+        self.column_type = column_type
+        self._batch_depth = 0
+        self._indexes: Set[Tuple[int, ...]] = set()
+        self._stats: Optional[Tuple[int, RelationStats]] = None
+        # a read-only connection opens the existing table without creating it
+        if create:
+            self._create_table_if_not_exists(relation, temporary)
+    def store(self, tuple_data: Row) -> bool:
         if len(tuple_data) != self.arity:
             raise ValueError(f"Tuple arity {len(tuple_data)} does not match expected arity {self.arity}")
         cursor = self._db_connection.cursor()
@@ -19,10 +41,58 @@ class Db:
             ON CONFLICT DO NOTHING
         ''', tuple_data)
         rows_inserted = cursor.rowcount
-        self._db_connection.commit()
+        self._commit()
         return rows_inserted > 0
 
-    def load(self, *keys: Tuple[int, str]) -> Iterator[Tuple[str, ...]]:
+    def store_many(self, tuples: Iterable[Row]) -> int:
+        cursor = self._db_connection.cursor()
+        placeholders = ', '.join(['?'] * self.arity)
+        cursor.executemany(f'''
+            INSERT INTO {self.relation} VALUES ({placeholders})
+            ON CONFLICT DO NOTHING
+        ''', self._checked(tuples))
+        rows_inserted = cursor.rowcount
+        self._commit()
+        return max(rows_inserted, 0)
+
+    def delete_many(self, tuples: Iterable[Row]) -> int:
+        cursor = self._db_connection.cursor()
+        conditions = ' AND '.join(f'col{i} = ?' for i in range(self.arity))
+        cursor.executemany(f'DELETE FROM {self.relation} WHERE {conditions}', self._checked(tuples))
+        rows_deleted = cursor.rowcount
+        self._commit()
+        return max(rows_deleted, 0)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # commits of store/store_many are deferred until the outermost batch exits
+        self._batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._db_connection.rollback()
+            raise
+        self._batch_depth -= 1
+        self._commit()
+
+    def _commit(self) -> None:
+        if self._batch_depth == 0:
+            self._db_connection.commit()
+
+    def version(self) -> int:
+        # changes with every write through this connection, to any relation and
+        # by raw SQL too, like the token statistics() are cached for
+        return self._db_connection.total_changes
+
+    def _checked(self, tuples: Iterable[Row]) -> Iterator[Row]:
+        for tuple_data in tuples:
+            if len(tuple_data) != self.arity:
+                raise ValueError(f"Tuple arity {len(tuple_data)} does not match expected arity {self.arity}")
+            yield tuple_data
+
+    def load(self, *keys: Tuple[int, Value]) -> Iterator[Row]:
         cursor = self._db_connection.cursor()
         if not keys:
             cursor.execute(f'SELECT * FROM {self.relation}')
@@ -42,11 +112,119 @@ class Db:
         for row in cursor:
             yield row
 
-    def _create_table_if_not_exists(self, relation: str) -> None:
+    def select(
+        self,
+        keys: Sequence[Tuple[int, Value]] = (),
+        columns: Optional[Sequence[int]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Row] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Row]:
+        cols = self._projection(columns, distinct, after)
+        projection = ', '.join(f'col{c}' for c in cols) or '1'
+        conditions = [f'col{index} = ?' for index, _ in keys]
+        values = [value for _, value in keys]
+        if after is not None:
+            # keyset pagination: resume right after the last row of the previous page
+            conditions.append(f'({projection}) > ({", ".join(["?"] * len(after))})')
+            values.extend(after)
+        query = f"SELECT {'DISTINCT ' if distinct else ''}{projection} FROM {self.relation}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        # pages need a stable order, which is the order of the selected columns
+        if limit is not None or offset or after is not None:
+            query += f' ORDER BY {projection} LIMIT ? OFFSET ?'
+            values.extend([-1 if limit is None else limit, offset])
+        cursor = self._db_connection.cursor()
+        cursor.execute(query, values)
+        while rows := cursor.fetchmany(batch_size):
+            yield from rows if cols else [()] * len(rows)
+
+    def count(self, *keys: Tuple[int, Value], columns: Optional[Sequence[int]] = None) -> int:
+        # the number of rows, or of distinct values of `columns`, matching the keys
+        cursor = self._db_connection.cursor()
+        conditions = [f'col{index} = ?' for index, _ in keys]
+        where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        source = self.relation
+        if columns is not None:
+            projection = ', '.join(f'col{c}' for c in self._projection(columns, True, None)) or '1'
+            source = f'(SELECT DISTINCT {projection} FROM {self.relation}{where_clause})'
+            where_clause = ''
+        cursor.execute(f'SELECT COUNT(*) FROM {source}{where_clause}', [value for _, value in keys])
+        return cursor.fetchone()[0]
+
+    def _projection(
+        self,
+        columns: Optional[Sequence[int]],
+        distinct: bool,
+        after: Optional[Row],
+    ) -> Tuple[int, ...]:
+        if columns is None:
+            return tuple(range(self.arity))
+        for c in columns:
+            if not 0 <= c < self.arity:
+                raise ValueError(f"Column {c} out of range for relation {self.relation} of arity {self.arity}")
+        if after is not None and not distinct:
+            raise ValueError("keyset pagination over a projection requires distinct=True")
+        return tuple(columns)
+
+    def statistics(self) -> RelationStats:
+        # cached until anything is written through this connection
+        token = self._db_connection.total_changes
+        if self._stats is None or self._stats[0] != token:
+            cursor = self._db_connection.cursor()
+            columns = ''.join(f', COUNT(DISTINCT col{i})' for i in range(self.arity))
+            cursor.execute(f'SELECT COUNT(*){columns} FROM {self.relation}')
+            row = cursor.fetchone()
+            self._stats = (token, RelationStats(row[0], tuple(row[1:])))
+        return self._stats[1]
+
+    def watermark(self) -> int:
+        cursor = self._db_connection.cursor()
+        cursor.execute(f'SELECT max(rowid) FROM {self.relation}')
+        return cursor.fetchone()[0] or 0
+
+    def load_since(self, watermark: int) -> Iterator[Row]:
+        cursor = self._db_connection.cursor()
+        cursor.execute(f'SELECT * FROM {self.relation} WHERE rowid > ? ORDER BY rowid', (watermark,))
+        for row in cursor:
+            yield row
+
+    def explain(self, columns: Iterable[int]) -> str:
+        # how SQLite answers a load() bound on `columns`, from EXPLAIN QUERY PLAN
+        cols = list(columns)
+        conditions = ' AND '.join(f'col{c} = ?' for c in cols)
+        where = f' WHERE {conditions}' if conditions else ''
+        cursor = self._db_connection.cursor()
+        cursor.execute(f'EXPLAIN QUERY PLAN SELECT * FROM {self.relation}{where}', [None] * len(cols))
+        return '; '.join(row[3] for row in cursor)
+
+    def ensure_index(self, columns: Iterable[int]) -> bool:
+        cols = tuple(sorted(set(columns)))
+        for c in cols:
+            if not 0 <= c < self.arity:
+                raise ValueError(f"Column {c} out of range for relation {self.relation} of arity {self.arity}")
+        # the UNIQUE index already serves lookups on any prefix col0..colK
+        if not cols or cols == tuple(range(len(cols))) or cols in self._indexes:
+            return False
+        cursor = self._db_connection.cursor()
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS {self.relation}_idx_{'_'.join(str(c) for c in cols)}
+            ON {self.relation} ({', '.join(f'col{c}' for c in cols)})
+        ''')
+        self._commit()
+        self._indexes.add(cols)
+        return True
+
+    def _create_table_if_not_exists(self, relation: str, temporary: bool = False) -> None:
+        # a temporary table lives as long as the connection and hides a table
+        # of the same name; its indexes are temporary as well
         cursor = self._db_connection.cursor()
         cursor.execute(f'''
-            CREATE TABLE IF NOT EXISTS {relation} (
-                {' ,'.join([f'col{i} TEXT' for i in range(self.arity)])},
+            CREATE {'TEMP ' if temporary else ''}TABLE IF NOT EXISTS {relation} (
+                {' ,'.join([f'col{i} {self.column_type}' for i in range(self.arity)])},
                 UNIQUE ({', '.join([f'col{i}' for i in range(self.arity)])})
             )
         ''')
@@ -1,41 +1,147 @@
 from __future__ import annotations
-import sqlite3
-from typing import Dict, Iterator, List, Optional, Tuple, Set
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Set
 
+from . import analysis
+from . import compiler
 from . import db
+from . import explain
+from . import loaders
+from . import magic
+from . import memory
 from . import nodes
+from . import parallel
+from . import persistence
+from . import planner
+from . import profiling
+from . import seminaive
+from . import serving
+from . import storage
+from .subgoals import Keys, Row, SubgoalStats, SubgoalTable
+from .symbols import SymbolTable, Value
+
+_STRATEGIES = ("tuple", "seminaive", "sql", "columnar")
+_BOTTOM_UP = ("seminaive", "sql", "columnar")
 
 """
 RulesPlan represents the execution plan for a set of Datalog-like rules.
 """
 class RulesPlan:
     _heads: Dict[str, _RuleHeadPlan]
-    _to_be_inserted: List[Tuple[str, Dict[int, str]]]
+    _to_be_inserted: List[Tuple[str, Dict[int, Value]]]
+    _strategy: str
+    _executed: bool
+    _adornments: Dict[str, Set[analysis.Adornment]]
+    _program: nodes.Program
+    _join_plans: Optional[List[planner.JoinPlan]]
+    _evaluator: Optional[seminaive.SemiNaiveEvaluator]
+    _strata: List[analysis.Stratum]
+    _negation: bool
+    _aggregates: bool
+    _workers: int
+    _symbols: Optional[SymbolTable]
+    _profiler: Optional[profiling.Profiler]
+    _subgoals: SubgoalTable
+    _sources: Dict[str, Set[str]]
+    _versions: Dict[str, int]
+    _derived: Set[str]
+    _state: Optional[persistence.PlanState]
+    _fingerprint: str
+    _snapshot: Optional[persistence.Snapshot]
+    _frozen: bool
+    _auto_index: bool
+    # watermarks of the relations when the tuple strategy's evaluator last saw them
+    _synced: Dict[str, int]
 
-    def __init__(self, program: nodes.Program, idb_storage: sqlite3.Connection, edb_storage: sqlite3.Connection) -> None:
+    def __init__(
+        self,
+        program: nodes.Program,
+        idb_storage: storage.Backend,
+        edb_storage: storage.Backend,
+        strategy: str = "tuple",
+        auto_index: bool = True,
+        reorder_joins: bool = True,
+        workers: int = 1,
+        symbols: Optional[SymbolTable] = None,
+        max_subgoals: Optional[int] = 10_000,
+        max_subgoal_rows: Optional[int] = 1_000_000,
+        max_answer_rows: Optional[int] = 100_000,
+        join_plans: Optional[Sequence[planner.JoinPlan]] = None,
+        profiler: Optional[profiling.Profiler] = None,
+        state: Optional[persistence.PlanState] = None,
+        edb_relations: Optional[Dict[str, int]] = None,
+    ) -> None:
+        if strategy not in _STRATEGIES:
+            raise ValueError(f"unknown strategy '{strategy}', expected one of {', '.join(_STRATEGIES)}")
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        if workers > 1 and strategy != "seminaive":
+            raise ValueError("parallel evaluation requires the seminaive strategy")
+        if strategy == "columnar" and symbols is None:
+            raise ValueError("the columnar strategy works on symbol ids, pass symbols=SymbolTable()")
+        self._negation = any(atom.negated for rule in program.rules for atom in rule.body)
+        if self._negation and strategy == "tuple":
+            raise ValueError("the tuple strategy does not support negation, use 'seminaive' or 'sql'")
+        self._aggregates = bool(analysis.aggregated_relations(program))
+        if self._aggregates and strategy == "tuple":
+            raise ValueError("the tuple strategy does not support aggregates, use 'seminaive' or 'sql'")
+        if self._aggregates and symbols is not None:
+            # aggregates compute new values and order them by value, not by symbol id
+            raise ValueError("aggregates are not supported on interned plans")
+        if state is not None and strategy not in _BOTTOM_UP:
+            raise ValueError("persistent state requires a bottom-up strategy, the tuple strategy derives lazily")
+        if state is not None and symbols is not None and symbols._conn is None:
+            raise ValueError("an interned plan with persistent state needs its symbols kept in the database, pass SymbolTable(conn)")
+        self._strata = analysis.stratify(program)
         self._heads = {}
         self._to_be_inserted = []
+        self._strategy = strategy
+        self._executed = False
+        self._frozen = False
+        self._adornments = {}
+        self._program = program
+        self._reorder_joins = reorder_joins
+        self._auto_index = auto_index and strategy not in ("seminaive", "columnar")
+        self._join_plans = None
+        self._evaluator = None
+        self._synced = {}
+        self._workers = workers
+        self._symbols = symbols
+        self._subgoals = SubgoalTable(max_subgoals, max_subgoal_rows, max_answer_rows)
+        self._profiler = profiler
+        # an interned plan stores symbol ids and compares integers everywhere
+        encode = symbols.intern if symbols is not None else str
+        idb_factory = storage.factory(idb_storage, interned=symbols is not None)
+        edb_factory = storage.factory(edb_storage, interned=symbols is not None)
+        if profiler is not None:
+            idb_factory = profiling.instrumented(idb_factory, profiler)
+            edb_factory = profiling.instrumented(edb_factory, profiler)
         idb_relations = set()
         # handling idb relations
         for rule in program.rules:
             head_relation = rule.head.relation
             if head_relation not in self._heads:
-                self._heads[head_relation] = _RuleHeadPlan(db.Db(idb_storage, head_relation, rule.head.arity))
+                self._heads[head_relation] = _RuleHeadPlan(idb_factory(head_relation, rule.head.arity), self._subgoals, profiler)
             if head_relation not in idb_relations:
                 idb_relations.add(head_relation)
+        # relations without rules that are queried even if no rule reads them
+        for relation, arity in (edb_relations or {}).items():
+            if relation not in self._heads:
+                self._heads[relation] = _RuleHeadPlan(edb_factory(relation, arity), self._subgoals, profiler)
         # handling edb relations and building the plan
-        for rule in program.rules:
+        for rule_idx, rule in enumerate(program.rules):
             head_relation = rule.head.relation
             head_plan = self._heads[head_relation]
             # handle fact rules
             if len(rule.body) == 0:
-                fact_values: Dict[int, str] = {}
+                fact_values: Dict[int, Value] = {}
                 for k, term in enumerate(rule.head.terms):
                     assert isinstance(term, nodes.Constant)
-                    fact_values[k] = term.value
+                    fact_values[k] = encode(term.value)
                 self._to_be_inserted.append((head_relation, fact_values))
                 continue
-            body_plan = _RuleBodyPlan(head_plan)
+            body_plan = _RuleBodyPlan(head_plan, rule_idx, profiler.rule(rule_idx) if profiler is not None else None)
             head_plan._add_lower(body_plan)
             cur_cannonical_var = len(rule.head.terms)
             # cannonicalize head variables
@@ -43,21 +149,36 @@ class RulesPlan:
             for var_idx, term in enumerate(rule.head.terms):
                 match term:
                     case nodes.Constant(value=value):
-                        body_plan._head_spec[var_idx] = value
+                        body_plan._head_spec[var_idx] = encode(value)
                     case nodes.Variable():
                         var_mapping[term] = var_idx
+                    case nodes.Aggregate(function=function, variable=variable):
+                        # the aggregated variable takes the slot of its head position
+                        body_plan._aggregates[var_idx] = function
+                        var_mapping[variable] = var_idx
+            # variables of a negated atom must be bound by the positive atoms
+            positive = {term for atom in rule.body if not atom.negated for term in atom.terms}
+            for atom in rule.body:
+                for term in atom.terms:
+                    if atom.negated and isinstance(term, nodes.Variable) and term not in positive:
+                        raise ValueError(
+                            f"variable '{term.name}' of negated atom '{atom.relation}' is not bound by a positive atom "
+                            f"in a rule for '{head_relation}'"
+                        )
             # process body atoms
             for atom_idx, atom in enumerate(rule.body):
+                if atom.negated:
+                    body_plan._negated.add(atom_idx)
                 body_relation = atom.relation
                 if body_relation not in self._heads and body_relation not in idb_relations:
-                    self._heads[body_relation] = _RuleHeadPlan(db.Db(edb_storage, body_relation, atom.arity))
+                    self._heads[body_relation] = _RuleHeadPlan(edb_factory(body_relation, atom.arity), self._subgoals, profiler)
                 body_head_plan = self._heads[body_relation]
                 body_plan._add_lower(body_head_plan)
                 body_head_plan._add_upper(body_plan, atom_idx)
                 for var_idx, term in enumerate(atom.terms):
                     match term:
                         case nodes.Constant(value=value):
-                            body_plan._mapping_from_idx[(atom_idx, var_idx)] = value
+                            body_plan._mapping_from_idx[(atom_idx, var_idx)] = seminaive._Const(encode(value))
                         case nodes.Variable():
                             if term in var_mapping:
                                 body_plan._mapping_from_idx[(atom_idx, var_idx)] = var_mapping[term]
@@ -65,19 +186,652 @@ class RulesPlan:
                                 var_mapping[term] = cur_cannonical_var
                                 body_plan._mapping_from_idx[(atom_idx, var_idx)] = cur_cannonical_var
                                 cur_cannonical_var += 1
+            for relation, patterns in analysis.trigger_adornments(seminaive._body_specs(body_plan)).items():
+                self._adornments.setdefault(relation, set()).update(patterns)
+        # the seminaive strategy joins in memory and never probes storage by column
+        if self._auto_index:
+            for relation, patterns in self._adornments.items():
+                for pattern in patterns:
+                    self._heads[relation]._storage.ensure_index(pattern)
+        # join plans made earlier, e.g. cached by pydatalog.parser.ProgramCache,
+        # are used as they are instead of planning from statistics
+        if join_plans is not None:
+            self._apply_join_plans(list(join_plans))
+            self._reorder_joins = False
+        # tuple-at-a-time joins are planned once, against the data present now
+        if strategy == "tuple" and self._reorder_joins:
+            self._apply_join_plans(self._plan_joins())
+        # subgoals are forgotten when a relation without rules they depend on is
+        # written, whoever writes it
+        self._sources = {
+            relation: analysis.dependents(program, relation)[0] | {relation}
+            for relation, head_plan in self._heads.items()
+            if not head_plan._lower
+        }
+        self._versions = {relation: self._heads[relation]._storage.version() for relation in self._sources}
+        self._derived = idb_relations
+        self._state = state
+        self._fingerprint = persistence.fingerprint(program, interned=symbols is not None)
+        self._snapshot = None
+        if state is not None:
+            self._restore(state)
+
+    def _restore(self, state: persistence.PlanState) -> None:
+        # A saved state is used when it is for this program and every derived
+        # relation is complete; if the base relations have not changed since,
+        # the plan starts out executed, otherwise execute() only catches up.
+        for relation in self._derived:
+            relation_storage = self._heads[relation]._storage
+            if not isinstance(relation_storage, db.Db) or relation_storage._db_connection is not state.connection:
+                raise ValueError("persistent state must be kept in the sqlite3 connection holding the idb relations")
+        snapshot = state.load()
+        if snapshot is None or snapshot.fingerprint != self._fingerprint or not self._derived <= snapshot.complete:
+            return
+        self._snapshot = snapshot
+        if self._marks() == snapshot.marks:
+            if self._reorder_joins:
+                self._apply_join_plans(self._plan_joins())
+            self._executed = True
+
+    def _marks(self, digests: Optional[Dict[str, str]] = None) -> Dict[str, persistence.RelationMark]:
+        # base relations in the state's database are tracked by its triggers,
+        # any other is remembered by a digest of its content, scanned unless
+        # given in `digests`
+        assert self._state is not None
+        marks: Dict[str, persistence.RelationMark] = {}
+        for relation, head in self._heads.items():
+            if relation in self._derived:
+                continue
+            relation_storage = head._storage
+            watermark, cardinality = relation_storage.watermark(), relation_storage.count()
+            if isinstance(relation_storage, db.Db) and relation_storage._db_connection is self._state.connection:
+                marks[relation] = persistence.RelationMark(watermark, cardinality, self._state.changes(relation))
+            else:
+                digest = digests.get(relation) if digests is not None else None
+                if digest is None:
+                    digest = persistence.content_digest(relation_storage.load())
+                marks[relation] = persistence.RelationMark(watermark, cardinality, digest=digest)
+        return marks
+
+    def _save_state(self, digests: Optional[Dict[str, str]] = None) -> None:
+        # the derived relations are complete for the base relations as they are now
+        if self._state is not None:
+            self._snapshot = self._state.save(self._fingerprint, self._derived, self._marks(digests))
+
+    def _written_digests(self, relation: str, rows: List[Row], written: int, removed: bool) -> Optional[Dict[str, str]]:
+        # The saved digests after `rows` were written to `relation`, so a small
+        # update does not scan the base relations; the digest of `relation` is
+        # left to be scanned unless every row given was added (or removed).
+        if self._snapshot is None:
+            return None
+        digests = {name: mark.digest for name, mark in self._snapshot.marks.items() if mark.digest is not None}
+        distinct = set(rows)
+        if relation in digests:
+            if written == len(distinct):
+                digests[relation] = persistence.update_digest(digests[relation], distinct, removed)
+            else:
+                del digests[relation]
+        return digests
+
+    def join_plans(self) -> List[planner.JoinPlan]:
+        if self._join_plans is None:
+            return self._plan_joins()
+        return list(self._join_plans)
+
+    def _plan_joins(self, reorder: bool = True) -> List[planner.JoinPlan]:
+        # planned from statistics, or the source orders used without reordering
+        stats = {relation: head._storage.statistics() for relation, head in self._heads.items()}
+        plans: List[planner.JoinPlan] = []
+        for head in self._heads.values():
+            for body in head._lower:
+                specs = seminaive._body_specs(body)
+                firsts: List[Optional[int]] = [] if self._strategy == "tuple" else [None]
+                firsts.extend(i for i, spec in enumerate(specs) if not spec.negated)
+                for first in firsts:
+                    relation = head._storage.relation
+                    if reorder:
+                        plans.append(planner.plan_body(relation, body._rule_idx, specs, stats, first))
+                    else:
+                        order = planner.source_order(specs, first)
+                        plans.append(planner.plan_order(relation, body._rule_idx, specs, stats, order, first))
+        return sorted(plans, key=lambda p: (p.rule_idx, -1 if p.delta_idx is None else p.delta_idx))
 
-    def query(self, relation: str, *keys: Tuple[int, str]) -> Iterator[Tuple[str, ...]]:
+    def _apply_join_plans(self, plans: List[planner.JoinPlan]) -> Dict[Tuple[int, Optional[int]], Tuple[int, ...]]:
+        self._join_plans = plans
+        orders = {(p.rule_idx, p.delta_idx): p.order for p in plans}
+        specs: Dict[int, Tuple[seminaive._AtomSpec, ...]] = {}
+        for head in self._heads.values():
+            for body in head._lower:
+                specs[body._rule_idx] = seminaive._body_specs(body)
+                for trigger in range(len(body._lower)):
+                    planned = orders.get((body._rule_idx, trigger))
+                    if planned is not None:
+                        body._orders[trigger] = list(planned[1:])
+                body._compiled.clear()
+        # joins probe in the planned order, which may bind other columns than
+        # the source order the indexes of __init__ were chosen for
+        if self._auto_index:
+            for join_plan in plans:
+                steps = zip(join_plan.order, join_plan.patterns)
+                if join_plan.delta_idx is not None:
+                    next(steps)
+                for atom_idx, pattern in steps:
+                    self._heads[specs[join_plan.rule_idx][atom_idx].relation]._storage.ensure_index(pattern)
+        return orders
+
+    def explain(self) -> explain.Explanation:
+        return explain.explain_plan(self)
+
+    def adornments(self) -> Dict[str, Set[analysis.Adornment]]:
+        return {relation: set(patterns) for relation, patterns in self._adornments.items()}
+
+    def subgoal_stats(self) -> SubgoalStats:
+        return self._subgoals.stats()
+
+    def profile_stats(self) -> Optional[profiling.ProfileStats]:
+        # None unless the plan was created with a profiler
+        return self._profiler.stats() if self._profiler is not None else None
+
+    def query(
+        self,
+        relation: str,
+        *keys: Tuple[int, str],
+        columns: Optional[Sequence[int]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Tuple[str, ...]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Tuple[str, ...]]:
         if relation not in self._heads:
             return
-        head_plan = self._heads[relation]
-        mapping: Dict[int, str] = {idx: value for idx, value in keys}
-        head_plan._propagate_down(mapping)
-        yield from head_plan._storage.load(*keys)
+        encoded = self._encode_keys(keys)
+        if encoded is None:
+            return
+        encoded_after = self._encode_after(relation, after)
+        answers = self._subgoal_answers(relation, keys, encoded)
+        rows: Iterable[Row]
+        if answers is None:
+            # answers are streamed from storage, batch_size rows at a time
+            self._derive(relation, encoded)
+            self._record_versions()
+            rows = self._heads[relation]._storage.select(
+                encoded, columns, distinct, limit, offset, encoded_after, batch_size
+            )
+        else:
+            rows = memory.select_rows(answers, columns, distinct, limit, offset, encoded_after)
+        yield from self._decode(rows)
+
+    def count(self, relation: str, *keys: Tuple[int, str], columns: Optional[Sequence[int]] = None) -> int:
+        # the number of answers, or of distinct values of `columns` among them
+        if relation not in self._heads:
+            return 0
+        encoded = self._encode_keys(keys)
+        if encoded is None:
+            return 0
+        rows = self._subgoal_answers(relation, keys, encoded)
+        if rows is None:
+            self._derive(relation, encoded)
+            self._record_versions()
+            return self._heads[relation]._storage.count(*encoded, columns=columns)
+        return len(rows) if columns is None else len({tuple(row[c] for c in columns) for row in rows})
+
+    def _subgoal_answers(
+        self,
+        relation: str,
+        keys: Tuple[Tuple[int, str], ...],
+        encoded: List[Tuple[int, Value]],
+    ) -> Optional[List[Row]]:
+        # The answers of a subgoal only goal-directed evaluation can produce,
+        # from the subgoal table or computed and kept there when small enough;
+        # None means they are to be read from storage. Subgoals depending on
+        # relations written behind the plan's back are forgotten first.
+        self._sync_subgoals()
+        if not self._goal_directed(relation, keys):
+            return None
+        subgoal = tuple(sorted(encoded))
+        rows = self._subgoals.answers(relation, subgoal)
+        if rows is None:
+            rows = self._query_magic(relation, keys, encoded)
+            self._record_versions()
+            if rows is None:
+                return None
+            self._subgoals.complete(relation, subgoal, rows)
+            self._subgoals.trim()
+        return rows
+
+    def _goal_directed(self, relation: str, keys: Tuple[Tuple[int, str], ...]) -> bool:
+        # magic sets rewriting is only applied to programs without negation or
+        # aggregates, which need the full relations they read
+        return (
+            self._strategy in _BOTTOM_UP
+            and not self._executed
+            and bool(keys)
+            and bool(self._heads[relation]._lower)
+            and not self._negation
+            and not self._aggregates
+        )
+
+    def _derive(self, relation: str, encoded: List[Tuple[int, Value]]) -> None:
+        # makes storage hold every answer of the subgoal
+        if self._strategy in _BOTTOM_UP:
+            if not self._executed:
+                self.execute()
+            return
+        mapping: Dict[int, Value] = {idx: value for idx, value in encoded}
+        with self.batch():
+            self._heads[relation]._propagate_down(mapping)
+
+    def _sync_subgoals(self) -> None:
+        for relation, affected in self._sources.items():
+            version = self._heads[relation]._storage.version()
+            if version != self._versions[relation]:
+                self._versions[relation] = version
+                self._subgoals.invalidate(affected)
+
+    def _record_versions(self) -> None:
+        # Versions of sqlite3 relations follow every write to their connection:
+        # once the plan wrote what it derived itself, the current versions are
+        # the ones subgoals are valid for.
+        self._versions = {relation: self._heads[relation]._storage.version() for relation in self._sources}
+
+    def _encode_keys(self, keys: Tuple[Tuple[int, str], ...]) -> Optional[List[Tuple[int, Value]]]:
+        if self._symbols is None:
+            return list(keys)
+        encoded: List[Tuple[int, Value]] = []
+        for idx, value in keys:
+            symbol_id = self._symbols.lookup(value)
+            if symbol_id is None:
+                # a value that was never interned cannot occur in any relation
+                return None
+            encoded.append((idx, symbol_id))
+        return encoded
+
+    def _decode(self, rows: Iterable[Row]) -> Iterator[Tuple[str, ...]]:
+        # values are decoded only here, on their way out of the plan
+        if self._symbols is None:
+            return iter(rows)  # type: ignore[arg-type]
+        return self._symbols.decode_all(rows)  # type: ignore[arg-type]
+
+    def _encode_after(self, relation: str, after: Optional[Tuple[str, ...]]) -> Optional[Row]:
+        if after is None:
+            return None
+        encoded = self._encode_rows([after], intern=False)
+        if not encoded:
+            raise ValueError(f"{after!r} is not a row of relation '{relation}'")
+        return encoded[0]
+
+    def _encode_rows(self, rows: Iterable[Tuple[str, ...]], intern: bool) -> List[Tuple[Value, ...]]:
+        if self._symbols is None:
+            return [tuple(row) for row in rows]
+        if intern:
+            return [self._symbols.encode(row) for row in rows]
+        encoded: List[Tuple[Value, ...]] = []
+        for row in rows:
+            ids = tuple(self._symbols.lookup(value) for value in row)
+            if None not in ids:
+                encoded.append(ids)  # type: ignore[arg-type]
+        return encoded
+
+    def _query_magic(
+        self, relation: str, keys: Tuple[Tuple[int, str], ...], encoded: List[Tuple[int, Value]]
+    ) -> Optional[List[Row]]:
+        # Goal-directed evaluation: derives only the facts relevant to the bound
+        # keys, with the plan's own strategy. The sql strategy keeps the
+        # rewritten relations in temporary tables on the connection of the base
+        # relations, so the joins stay in SQLite; they are dropped afterwards.
+        # None when the rewriting cannot express the query, which is then
+        # answered by full evaluation.
+        try:
+            rewritten = magic.magic_program(self._program, relation, keys)
+        except ValueError:
+            return None
+        idb_storage: storage.Backend = memory.MemoryStore()
+        temporary: List[str] = []
+        relation_storage = self._heads[relation]._storage
+        if self._strategy == "sql":
+            if not isinstance(relation_storage, db.Db):
+                raise ValueError("the sql strategy requires every relation to be stored in sqlite3")
+            conn = relation_storage._db_connection
+
+            def idb_storage(name: str, arity: int) -> db.Db:
+                temporary.append(name)
+                return db.Db(conn, name, arity, relation_storage.column_type, temporary=True)
+        sub_plan = RulesPlan(
+            rewritten.program,
+            idb_storage=idb_storage,
+            edb_storage=lambda name, arity: self._heads[name]._storage,
+            strategy=self._strategy,
+            workers=self._workers,
+            symbols=self._symbols,
+        )
+        try:
+            sub_plan.execute()
+            return list(sub_plan._heads[rewritten.answer]._storage.load(*encoded))
+        finally:
+            for name in temporary:
+                conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        with ExitStack() as stack:
+            for head_plan in self._heads.values():
+                stack.enter_context(head_plan._storage.batch())
+            yield
+
+    def serve(self) -> serving.QueryServer:
+        # Derives every relation in full, then freezes the plan: until the
+        # server is closed, the plan refuses writes and queries are answered
+        # concurrently by the server.
+        self._writable()
+        if not self._executed:
+            self.execute()
+        if self._strategy == "tuple":
+            with self.batch():
+                for head_plan in self._heads.values():
+                    if head_plan._lower:
+                        head_plan._propagate_down({})
+        self._frozen = True
+        return serving.QueryServer(self)
+
+    def _writable(self) -> None:
+        if self._frozen:
+            raise ValueError("the plan is frozen while a QueryServer serves it, close the server first")
 
     def execute(self) -> None:
+        self._writable()
+        with self.batch():
+            if self._snapshot is None:
+                self._execute()
+            else:
+                self._catch_up(self._snapshot)
+            self._save_state()
+        self._executed = True
+        self._subgoals.clear()
+        self._record_versions()
+
+    def insert_facts(self, relation: str, rows: Iterable[Tuple[str, ...]]) -> int:
+        self._writable()
+        given = [tuple(row) for row in rows]
+        head_plan = self._relation_plan(relation, given)
+        encoded = self._encode_rows(given, intern=True)
+        self._sync_subgoals()
+        with self.batch():
+            inserted = self._insert(relation, head_plan, encoded)
+            if self._executed:
+                self._save_state(self._written_digests(relation, encoded, inserted, removed=False))
+        self._forget_subgoals(relation)
+        return inserted
+
+    def _insert(self, relation: str, head_plan: _RuleHeadPlan, rows: List[Row]) -> int:
+        if self._strategy == "tuple":
+            return sum(1 for row in rows if head_plan._propagate_up(dict(enumerate(row))))
+        if not self._executed:
+            return head_plan._storage.store_many(rows)
+        affected, through_negation = analysis.dependents(self._program, relation)
+        if through_negation or self._strategy == "columnar":
+            inserted = head_plan._storage.store_many(rows)
+            self._recompute(affected)
+            return inserted
+        if self._strategy == "sql":
+            evaluator = compiler.SqlEvaluator(self._heads, self._orders(), profiler=self._profiler)
+            marks = evaluator.marks()
+            inserted = head_plan._storage.store_many(rows)
+            evaluator.propagate(marks)
+            return inserted
+        # a plan restored from persistent state loads its relations on first use
+        return self._retraction_evaluator().insert(relation, rows)
+
+    def retract_facts(self, relation: str, rows: Iterable[Tuple[str, ...]]) -> int:
+        self._writable()
+        given = [tuple(row) for row in rows]
+        head_plan = self._relation_plan(relation, given)
+        encoded = self._encode_rows(given, intern=False)
+        self._sync_subgoals()
+        with self.batch():
+            removed = self._retract(relation, head_plan, encoded)
+            if self._executed:
+                self._save_state(self._written_digests(relation, encoded, removed, removed=True))
+        self._forget_subgoals(relation)
+        return removed
+
+    def _retract(self, relation: str, head_plan: _RuleHeadPlan, rows: List[Row]) -> int:
+        if self._strategy in _BOTTOM_UP and not self._executed:
+            return head_plan._storage.delete_many(rows)
+        affected, through_negation = analysis.dependents(self._program, relation)
+        if through_negation or self._strategy == "columnar":
+            removed = head_plan._storage.delete_many(rows)
+            self._recompute(affected)
+            return removed
+        if self._strategy == "sql":
+            evaluator = compiler.SqlEvaluator(self._heads, self._orders(), profiler=self._profiler)
+            return evaluator.retract(relation, rows, self._facts())
+        facts = {(fact_relation, row) for fact_relation, rows in self._facts().items() for row in rows}
+        removed = self._retraction_evaluator().retract(relation, rows, facts)
+        if self._strategy == "tuple":
+            self._synced = {name: head._storage.watermark() for name, head in self._heads.items()}
+        return removed
+
+    def _retraction_evaluator(self) -> seminaive.SemiNaiveEvaluator:
+        # The in-memory relations retraction runs on, loaded once. The tuple
+        # strategy keeps writing to storage without the evaluator, so the
+        # tuples stored since the last retraction are added to it first.
+        if self._evaluator is None:
+            self._evaluator = self._seminaive_evaluator(self._orders(), self._strata)
+            self._evaluator.load()
+        elif self._strategy == "tuple":
+            self._evaluator.observe({
+                relation: head._storage.load_since(self._synced[relation]) for relation, head in self._heads.items()
+            })
+        return self._evaluator
+
+    def _forget_subgoals(self, relation: str) -> None:
+        # answers of the subgoals depending on `relation` may have changed, and
+        # only those: writes made behind the plan's back were synced beforehand
+        self._subgoals.invalidate(analysis.dependents(self._program, relation)[0] | {relation})
+        self._record_versions()
+
+    def load_facts(self, relation: str, rows: Iterable[Tuple[str, ...]], chunk_size: int = loaders.CHUNK_SIZE) -> int:
+        # Bulk loads rows into a relation in chunks, without fact rules. Once the
+        # plan holds derived tuples, every chunk is maintained like insert_facts.
+        self._writable()
+        head_plan = self._relation_plan(relation, [])
+        if self._executed:
+            return sum(self.insert_facts(relation, chunk) for chunk in loaders.chunked(rows, chunk_size))
+        encode = self._symbols.encode if self._symbols is not None else None
+        return loaders.load_rows(head_plan._storage, rows, chunk_size, encode)
+
+    def load_csv(self, relation: str, path: loaders.Path, chunk_size: int = loaders.CHUNK_SIZE, **options) -> int:
+        return self.load_facts(relation, loaders.read_csv(path, **options), chunk_size)
+
+    def load_parquet(self, relation: str, path: loaders.Path, chunk_size: int = loaders.CHUNK_SIZE, **options) -> int:
+        return self.load_facts(relation, loaders.read_parquet(path, chunk_size=chunk_size, **options), chunk_size)
+
+    def _relation_plan(self, relation: str, rows: List[Tuple[str, ...]]) -> _RuleHeadPlan:
+        if relation not in self._heads:
+            raise ValueError(f"unknown relation '{relation}'")
+        head_plan = self._heads[relation]
+        for row in rows:
+            if len(row) != head_plan._storage.arity:
+                raise ValueError(f"Tuple arity {len(row)} does not match expected arity {head_plan._storage.arity}")
+        return head_plan
+
+    def _facts(self) -> Dict[str, List[Row]]:
+        facts: Dict[str, List[Row]] = {}
         for relation, fact_values in self._to_be_inserted:
-            head_plan = self._heads[relation]
-            head_plan._propagate_up(fact_values)
+            facts.setdefault(relation, []).append(tuple(fact_values[k] for k in range(len(fact_values))))
+        return facts
+
+    def _recompute(self, relations: Set[str]) -> None:
+        # a change seen through a negation or an aggregate can remove derived
+        # tuples anywhere above it, so the affected strata are cleared and
+        # evaluated again; the columnar strategy always updates this way, in bulk
+        self._clear(relations)
+        for relation, rows in self._facts().items():
+            if relation in relations:
+                self._heads[relation]._storage.store_many(rows)
+        self._evaluate(self._orders(), [stratum for stratum in self._strata if stratum.relations & relations])
+
+    def _clear(self, relations: Set[str]) -> None:
+        if self._state is not None:
+            self._state.invalidate(relations)
+        for relation in relations:
+            relation_storage = self._heads[relation]._storage
+            relation_storage.delete_many(list(relation_storage.load()))
+
+    def _catch_up(self, snapshot: persistence.Snapshot) -> None:
+        # Brings derived relations that were complete for `snapshot` up to date:
+        # tuples appended to base relations since are propagated like inserts,
+        # and relations depending on a base relation changed in any other way
+        # are evaluated again.
+        appended: Dict[str, List[Row]] = {}
+        changed: Set[str] = set()
+        for relation, mark in self._marks().items():
+            saved = snapshot.marks.get(relation)
+            if saved == mark:
+                continue
+            # only a tracked relation without deletions or updates can have been appended to
+            if saved is not None and saved.changes is not None and saved.changes == mark.changes:
+                rows = list(self._heads[relation]._storage.load_since(saved.watermark))
+                if mark.cardinality == saved.cardinality + len(rows):
+                    appended[relation] = rows
+                    continue
+            changed.add(relation)
+        orders = self._apply_join_plans(self._plan_joins()) if self._reorder_joins else self._orders()
+        affected: Set[str] = set()
+        recompute = bool(changed) or self._strategy == "columnar"
+        for relation in changed | appended.keys():
+            dependents, through_negation = analysis.dependents(self._program, relation)
+            affected |= dependents
+            recompute = recompute or through_negation
+        if not affected:
+            return
+        if recompute:
+            self._recompute(affected)
+        elif self._strategy == "sql":
+            evaluator = compiler.SqlEvaluator(self._heads, orders, profiler=self._profiler)
+            marks = evaluator.marks()
+            marks.update({relation: snapshot.marks[relation].watermark for relation in appended})
+            evaluator.propagate(marks)
+        else:
+            self._evaluator = self._seminaive_evaluator(orders, self._strata)
+            self._evaluator.load()
+            self._evaluator.catch_up(appended)
+
+    def _evaluate(
+        self,
+        orders: Dict[Tuple[int, Optional[int]], Tuple[int, ...]],
+        strata: List[analysis.Stratum],
+    ) -> None:
+        if self._strategy == "sql":
+            compiler.SqlEvaluator(self._heads, orders, strata, self._profiler).run()
+        elif self._strategy == "columnar":
+            # numpy is an optional dependency, only needed by this strategy
+            from . import columnar
+            columnar.ColumnarEvaluator(self._heads, orders, strata, self._profiler).run()
+        else:
+            self._evaluator = self._seminaive_evaluator(orders, strata)
+            self._evaluator.run()
+
+    def _seminaive_evaluator(
+        self,
+        orders: Dict[Tuple[int, Optional[int]], Tuple[int, ...]],
+        strata: List[analysis.Stratum],
+    ) -> seminaive.SemiNaiveEvaluator:
+        if self._workers > 1:
+            return parallel.ParallelEvaluator(self._heads, orders, strata, self._workers, self._profiler)
+        return seminaive.SemiNaiveEvaluator(self._heads, orders, strata, self._profiler)
+
+    def _orders(self) -> Dict[Tuple[int, Optional[int]], Tuple[int, ...]]:
+        return {(p.rule_idx, p.delta_idx): p.order for p in self._join_plans or []}
+
+    def _execute(self) -> None:
+        if self._strategy in _BOTTOM_UP:
+            if self._state is not None:
+                # tuples left in derived relations by an earlier run are not trusted
+                self._clear(self._derived)
+            for relation, rows in self._facts().items():
+                self._heads[relation]._storage.store_many(rows)
+            orders = self._apply_join_plans(self._plan_joins()) if self._reorder_joins else self._orders()
+            self._evaluate(orders, self._strata)
+        else:
+            worklist = _Worklist() if self._profiler is None else _ProfiledWorklist()
+            for relation, fact_values in self._to_be_inserted:
+                worklist.derive(self._heads[relation], tuple(fact_values[k] for k in range(len(fact_values))))
+            worklist.run()
+
+"""
+Worklist schedules tuple-at-a-time evaluation without recursion. Derived
+tuples are queued per relation and stored as one batch before the rules
+reading that relation fire; subgoals wait in a FIFO queue and are only
+expanded once no derived tuple is pending.
+"""
+class _Worklist:
+    _derived: Dict[int, Tuple[_RuleHeadPlan, List[Row]]]
+    _fired: Deque[Tuple[_RuleBodyPlan, int, Row]]
+    _demanded: Deque[Tuple[_RuleHeadPlan, Keys]]
+
+    def __init__(self) -> None:
+        self._derived = {}
+        self._fired = deque()
+        self._demanded = deque()
+
+    def derive(self, head: _RuleHeadPlan, row: Row) -> None:
+        self._derived.setdefault(id(head), (head, []))[1].append(row)
+
+    def insert(self, head: _RuleHeadPlan, row: Row) -> bool:
+        if not head._storage.store(row):
+            return False
+        self.notify(head, row)
+        return True
+
+    def notify(self, head: _RuleHeadPlan, row: Row) -> None:
+        for body, idx in head._upper:
+            self._fired.append((body, idx, row))
+
+    def demand(self, head: _RuleHeadPlan, keys: Keys) -> None:
+        self._demanded.append((head, keys))
+
+    def run(self) -> None:
+        while True:
+            if self._fired:
+                body, idx, row = self._fired.popleft()
+                body._fire(idx, row, self)
+            elif self._derived:
+                # oldest relation batch first
+                head, rows = self._derived.pop(next(iter(self._derived)))
+                for row in dict.fromkeys(rows):
+                    self.insert(head, row)
+            elif self._demanded:
+                head, keys = self._demanded.popleft()
+                head._expand(keys, self)
+            else:
+                break
+
+"""
+ProfiledWorklist is the worklist of a profiled plan. Compiled rules derive
+through derive_from, so tuples rejected when stored are counted as
+duplicates of the rules that produced them.
+"""
+class _ProfiledWorklist(_Worklist):
+    _origins: Dict[Tuple[int, Row], List[profiling.RuleProfile]]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._origins = {}
+
+    def derive_from(self, profile: profiling.RuleProfile, head: _RuleHeadPlan, row: Row) -> None:
+        profile.produced += 1
+        self._origins.setdefault((id(head), row), []).append(profile)
+        self.derive(head, row)
+
+    def insert(self, head: _RuleHeadPlan, row: Row) -> bool:
+        inserted = super().insert(head, row)
+        origins = self._origins.pop((id(head), row), ())
+        for n, profile in enumerate(origins):
+            if n > 0 or not inserted:
+                profile.duplicates += 1
+        return inserted
 
 """
 RuleHeadPlan represents the intermediate representation of a rule head in a Datalog-like system.
@@ -85,14 +839,24 @@ RuleHeadPlan represents the intermediate representation of a rule head in a Data
 class _RuleHeadPlan:
     _lower: List[_RuleBodyPlan]
     _upper: List[Tuple[_RuleBodyPlan, int]]
-    _storage: db.Db
-    _explored_mappings: Set[Tuple[Tuple[int, str], ...]]
+    _storage: storage.Storage
+    _subgoals: SubgoalTable
+    _profiler: Optional[profiling.Profiler]
 
-    def __init__(self, storage: db.Db) -> None:
+    def __init__(
+        self,
+        relation_storage: storage.Storage,
+        subgoals: Optional[SubgoalTable] = None,
+        profiler: Optional[profiling.Profiler] = None,
+    ) -> None:
         self._lower = []
         self._upper = []
-        self._storage = storage
-        self._explored_mappings = set()
+        self._storage = relation_storage
+        self._subgoals = subgoals if subgoals is not None else SubgoalTable()
+        self._profiler = profiler
+
+    def _worklist(self) -> _Worklist:
+        return _Worklist() if self._profiler is None else _ProfiledWorklist()
 
     def _add_lower(self, body: _RuleBodyPlan) -> None:
         self._lower.append(body)
@@ -100,133 +864,149 @@ class _RuleHeadPlan:
     def _add_upper(self, body: _RuleBodyPlan, index: int) -> None:
         self._upper.append((body, index))
 
-    def _propagate_up(self, mapping: Dict[int, str]) -> None:
+    def _propagate_up(self, mapping: Dict[int, Value]) -> bool:
         # Build the head row using constants and canonical variables
-        head_row: List[str] = []
+        head_row: List[Value] = []
         for k in range(self._storage.arity):
             assert k in mapping
             head_row.append(mapping[k])
-        if not self._storage.store(tuple(head_row)):
-            return
-        for body, idx in self._upper:
-            body._propagate_up(idx, mapping)
+        worklist = self._worklist()
+        inserted = worklist.insert(self, tuple(head_row))
+        worklist.run()
+        self._subgoals.trim()
+        return inserted
+
+    def _propagate_down(self, mapping: Dict[int, Value]) -> None:
+        worklist = self._worklist()
+        worklist.demand(self, tuple(sorted(mapping.items())))
+        worklist.run()
+        self._subgoals.trim()
 
-    def _propagate_down(self, mapping: Dict[int, str]) -> None:
-        mapping_key = tuple(sorted(mapping.items()))
-        if mapping_key in self._explored_mappings:
+    def _expand(self, keys: Keys, worklist: _Worklist) -> None:
+        if self._subgoals.explore(self._storage.relation, keys):
             return
-        self._explored_mappings.add(mapping_key)
         if len(self._lower) == 0:
-            for e in self._storage.load(*mapping.items()):
-                current_mapping: Dict[int, str] = {(i): v for i, v in enumerate(e)}
-                for upper, idx in self._upper:
-                    upper._propagate_up(idx, current_mapping)
+            for e in self._storage.load(*keys):
+                worklist.notify(self, e)
         for body in self._lower:
-            body._propagate_down(mapping)
+            body._demand(keys, worklist)
 
 class _RuleBodyPlan:
     _lower: List[_RuleHeadPlan]
-    _mapping_from_idx: Dict[Tuple[int, int], int | str]
+    _mapping_from_idx: Dict[Tuple[int, int], int | seminaive._Const]
     _upper: _RuleHeadPlan
-    _head_spec: Dict[int, str]
-    
-    def __init__(self, upper: _RuleHeadPlan) -> None:
+    _head_spec: Dict[int, Value]
+    _rule_idx: int
+    _orders: Dict[int, List[int]]
+    _negated: Set[int]
+    _aggregates: Dict[int, str]
+    _compiled: Dict[int, Callable[[Row, _Worklist], None]]
+    _profile: Optional[profiling.RuleProfile]
+
+    def __init__(self, upper: _RuleHeadPlan, rule_idx: int = 0, profile: Optional[profiling.RuleProfile] = None) -> None:
         self._lower = []
         self._mapping_from_idx = {}
         self._upper = upper
         self._head_spec = {}
+        self._rule_idx = rule_idx
+        self._orders = {}
+        self._negated = set()
+        self._aggregates = {}
+        self._compiled = {}
+        self._profile = profile
 
     def _add_lower(self, head: _RuleHeadPlan) -> None:
         self._lower.append(head)
 
-    def _from_lower_mapping(self, atom_idx: int, mapping: Dict[int, str]) -> Optional[Dict[int, str]]:
-        result: Dict[int, str] = {}
-        # Iterate expected positions for this atom
-        for (a_idx, var_idx), expected_var in self._mapping_from_idx.items():
-            if a_idx != atom_idx:
-                continue
-            match expected_var:
-                case str() as const_val:
-                    # If a constant is expected, ensure any provided lower/canonical mapping agrees
-                    if var_idx in mapping and mapping[var_idx] != const_val:
-                        return None
-                    # constants don't contribute to canonical mapping
-                case int() as canon_idx:
-                    # Prefer lower var index value if present, else canonical mapping
-                    if var_idx in mapping:
-                        result[canon_idx] = mapping[var_idx]
-                    elif canon_idx in mapping:
-                        result[canon_idx] = mapping[canon_idx]
-                    else:
-                        # insufficient info to map
-                        return None
-        return result
-
-    def _to_lower_mapping(self, atom_idx: int, mapping: Dict[int, str]) -> Dict[int, str]:
-        result: Dict[int, str] = {}
-        keys = filter(lambda k: k[0] == atom_idx, self._mapping_from_idx.keys())
-        for key in keys:
-            m = self._mapping_from_idx[key]
-            match m:
-                case str() as const_val:
-                    result[key[1]] = const_val
-                case int() as canon_idx:
-                    if canon_idx in mapping:
-                        result[key[1]] = mapping[canon_idx]
-        return result
-
-    def _propagate_up(self, atom_idx: int, mapping: Dict[int, str]) -> None:
-        shared_mapping = self._from_lower_mapping(atom_idx, mapping)
-        if shared_mapping is None:
-            return
-        for join_mapping in self._join(0, shared_mapping, atom_idx):
-            combined_mapping = _union(join_mapping, self._head_spec)
-            if combined_mapping is None:
-                continue
-            # Propagate only variable mappings upstream
-            filtered_mapping = {k: v for k, v in combined_mapping.items()}
-            self._upper._propagate_up(filtered_mapping)
+    def _fire(self, atom_idx: int, row: Row, worklist: _Worklist) -> None:
+        fire = self._compiled.get(atom_idx)
+        if fire is None:
+            fire = self._compiled[atom_idx] = self._compile(atom_idx)
+        fire(row, worklist)
 
-    def _join(self, cur_idx: int, mapping: Dict[int, str], skip_idx: int) -> Iterator[Dict[int, str]]:
-        if cur_idx >= len(self._lower):
-            yield mapping
-            return
-        if cur_idx == skip_idx:
-            yield from self._join(cur_idx + 1, mapping, skip_idx)
-            return
-        atom = self._lower[cur_idx]
-        atom_mapping = self._to_lower_mapping(cur_idx, mapping)
-        for e in atom._storage.load(*atom_mapping.items()):
-            lower_mapping: Dict[int, str] = {i: v for i, v in enumerate(e)}
-            converted_lower_mapping = self._from_lower_mapping(cur_idx, lower_mapping)
-            if converted_lower_mapping is None:
-                continue
-            new_mapping = _union(mapping, converted_lower_mapping)
-            if new_mapping is None:
-                continue
-            yield from self._join(cur_idx + 1, new_mapping, skip_idx)
-        self._propagate_down(atom_mapping)
+    def _columns(self, atom_idx: int) -> List[int | seminaive._Const]:
+        return [self._mapping_from_idx[(atom_idx, col)] for col in range(self._lower[atom_idx]._storage.arity)]
 
-    def _propagate_down(self, mapping: Dict[int, str]) -> None:
+    def _compile(self, atom_idx: int) -> Callable[[Row, _Worklist], None]:
+        # Generates the join for tuples of body atom `atom_idx` as straight-line
+        # Python: one local per canonical slot, one nested loop per joined atom,
+        # constants bound by name. Each joined atom is demanded with its probe
+        # keys once its loop is done, as tuples it derives later fire the rule again.
+        order = self._orders.get(atom_idx)
+        if order is None:
+            order = [i for i in range(len(self._lower)) if i != atom_idx]
+        namespace: Dict[str, object] = {"upper": self._upper, "profile": self._profile}
+        lines = ["def fire(row, worklist):"]
+        bound: Set[int] = set()
+        # counters are only compiled into the joins of a profiled plan
+        profiled = self._profile is not None
+        if profiled:
+            lines.append("    profile.firings += 1")
+
+        def const(value: Value) -> str:
+            name = f"c{len(namespace)}"
+            namespace[name] = value
+            return name
+
+        def bind(indent: str, source: str, columns: List[Tuple[int, int | seminaive._Const]], skip: str) -> None:
+            for col, column in columns:
+                match column:
+                    case seminaive._Const(value=value):
+                        lines.append(f"{indent}if {source}[{col}] != {const(value)}: {skip}")
+                    case int() as slot if slot in bound:
+                        lines.append(f"{indent}if {source}[{col}] != v{slot}: {skip}")
+                    case int() as slot:
+                        lines.append(f"{indent}v{slot} = {source}[{col}]")
+                        bound.add(slot)
+
+        bind("    ", "row", list(enumerate(self._columns(atom_idx))), "return")
+        depth_indent = "    "
+        epilogue: List[str] = []
+        for depth, cur_idx in enumerate(order):
+            namespace[f"atom{depth}"] = self._lower[cur_idx]
+            probed = [
+                (col, column) for col, column in enumerate(self._columns(cur_idx))
+                if isinstance(column, seminaive._Const) or column in bound
+            ]
+            probe = [
+                f"({col}, {const(column.value)})" if isinstance(column, seminaive._Const) else f"({col}, v{column})"
+                for col, column in probed
+            ]
+            lines.append(f"{depth_indent}keys{depth} = ({', '.join(probe)}{',' if len(probe) == 1 else ''})")
+            if profiled:
+                lines.append(f"{depth_indent}profile.probes += 1")
+            lines.append(f"{depth_indent}for r{depth} in atom{depth}._storage.load(*keys{depth}):")
+            epilogue.append(f"{depth_indent}worklist.demand(atom{depth}, keys{depth})")
+            depth_indent += "    "
+            # columns probed on are already equal; the rest bind or check slots
+            rest = [(col, column) for col, column in enumerate(self._columns(cur_idx)) if (col, column) not in probed]
+            bind(depth_indent, f"r{depth}", rest, "continue")
+        head: List[str] = []
+        for k in range(self._upper._storage.arity):
+            if k in self._head_spec:
+                head.append(const(self._head_spec[k]))
+            elif k in bound:
+                head.append(f"v{k}")
+            else:
+                raise ValueError(
+                    f"head position {k} of relation '{self._upper._storage.relation}' is not bound by the rule body"
+                )
+        derive = "worklist.derive_from(profile, upper, " if profiled else "worklist.derive(upper, "
+        lines.append(f"{depth_indent}{derive}({', '.join(head)}{',' if len(head) == 1 else ''}))")
+        lines.extend(reversed(epilogue))
+        source = "\n".join(lines)
+        exec(compile(source, f"<rule {self._rule_idx} atom {atom_idx}>", "exec"), namespace)
+        return namespace["fire"]  # type: ignore[return-value]
+
+    def _demand(self, keys: Keys, worklist: _Worklist) -> None:
         assert len(self._lower) > 0
-        atom_mapping: Dict[int, str] = {}
-        for atom_idx, atom in enumerate(self._lower):
-            for var_idx in range(atom._storage.arity):
-                key = (atom_idx, var_idx)
-                assert key in self._mapping_from_idx
-                var = self._mapping_from_idx[key]
-                match var:
-                    case str():
-                        atom_mapping[var_idx] = var
-                    case int() as v_idx:
-                        if v_idx in mapping:
-                            atom_mapping[var_idx] = mapping[v_idx]
-        # Propagate down to the first atom only; others will be joined in _join
-        self._lower[0]._propagate_down(atom_mapping)
-
-def _union(l: Dict[int, str], r: Dict[int, str]) -> Optional[Dict[int, str]]:
-    result = l | r
-    for k, v in l.items():
-        if k in r and r[k] != v:
-            return None
-    return result
+        # Demand the first atom only; others are demanded as they are joined in _fire
+        bound = dict(keys)
+        probe: List[Tuple[int, Value]] = []
+        for col, column in enumerate(self._columns(0)):
+            match column:
+                case seminaive._Const(value=value):
+                    probe.append((col, value))
+                case int() as slot if slot in bound:
+                    probe.append((col, bound[slot]))
+        worklist.demand(self._lower[0], tuple(probe))
@@ -0,0 +1,168 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from . import compiler
+from . import planner
+from .analysis import Adornment, Stratum, dependency_graph
+from .printer import print_rule
+from .seminaive import _AtomSpec, _body_specs
+
+if TYPE_CHECKING:
+    from .execution import RulesPlan
+
+"""
+JoinStep is one body atom of a join, in join order: its binding pattern when
+it is joined ('b' for bound columns, 'f' for free ones), the rows the planner
+expects per probe, and how the probe is answered. For strategies probing
+storage, access is SQLite's EXPLAIN QUERY PLAN of the lookup.
+"""
+@dataclass(frozen=True, slots=True)
+class JoinStep:
+    atom_idx: int
+    relation: str
+    negated: bool
+    binding: str
+    estimate: float
+    access: str
+
+
+"""
+JoinExplanation is the join of one rule, either evaluated in full (delta_idx
+None) or driven by new tuples of the body atom at delta_idx. estimate is the
+number of bindings the planner expects, per driving tuple for a driven join.
+sql holds the EXPLAIN QUERY PLAN of the compiled statement (sql strategy).
+"""
+@dataclass(frozen=True, slots=True)
+class JoinExplanation:
+    delta_idx: Optional[int]
+    steps: Tuple[JoinStep, ...]
+    estimate: float
+    sql: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class RuleExplanation:
+    rule_idx: int
+    rule: str
+    joins: Tuple[JoinExplanation, ...]
+
+
+"""
+Explanation is what RulesPlan.explain() returns: the predicate dependency
+graph (relation -> (body relation, negated) pairs), the strata in evaluation
+order, the current cardinality of every relation and the joins of every
+rule with a body. str() renders it as text.
+"""
+@dataclass(frozen=True, slots=True)
+class Explanation:
+    strategy: str
+    dependencies: Dict[str, Tuple[Tuple[str, bool], ...]]
+    strata: Tuple[Stratum, ...]
+    cardinalities: Dict[str, int]
+    rules: Tuple[RuleExplanation, ...]
+
+    def __str__(self) -> str:
+        lines = [f"strategy: {self.strategy}", "dependency graph:"]
+        for relation, edges in self.dependencies.items():
+            if edges:
+                lines.append(f"  {relation} <- {', '.join(('not ' if negated else '') + dep for dep, negated in edges)}")
+        lines.append("strata:")
+        for n, stratum in enumerate(self.strata, 1):
+            recursive = " (recursive)" if stratum.recursive else ""
+            lines.append(f"  {n}. {', '.join(sorted(stratum.relations))}{recursive}")
+        lines.append("relations:")
+        for relation, cardinality in self.cardinalities.items():
+            lines.append(f"  {relation}: {cardinality} tuples")
+        for rule in self.rules:
+            lines.append(f"rule {rule.rule_idx}: {rule.rule}")
+            for join in rule.joins:
+                if join.delta_idx is None:
+                    lines.append(f"  full evaluation, ~{_rows(join.estimate)} bindings")
+                else:
+                    driver = join.steps[0].relation
+                    lines.append(
+                        f"  driven by {driver} (atom {join.delta_idx}), ~{_rows(join.estimate)} bindings per tuple"
+                    )
+                for step in join.steps:
+                    name = ("not " if step.negated else "") + step.relation
+                    lines.append(f"    {name}({step.binding})  ~{_rows(step.estimate)} rows  {step.access}")
+                for detail in join.sql:
+                    lines.append(f"    sql: {detail}")
+        return "\n".join(lines)
+
+
+def _rows(estimate: float) -> str:
+    return f"{estimate:.0f}" if estimate >= 10 else f"{estimate:.2g}"
+
+
+def _binding(arity: int, pattern: Adornment) -> str:
+    return "".join("b" if col in pattern else "f" for col in range(arity))
+
+
+def _access(plan: RulesPlan, atom: _AtomSpec, pattern: Adornment, driving: bool) -> str:
+    if driving:
+        return "driving tuple" if plan._strategy == "tuple" else "delta of the previous iteration"
+    cols = ", ".join(f"col{c}" for c in pattern)
+    match plan._strategy:
+        case "seminaive":
+            if atom.negated:
+                return "anti-join: membership test of the ground tuple"
+            return f"in-memory hash index on ({cols})" if pattern else "in-memory scan"
+        case "columnar":
+            if atom.negated:
+                return "anti-join on every column"
+            return f"sort-merge join on ({cols})" if pattern else "cross product"
+    storage = plan._heads[atom.relation]._storage
+    return ("NOT EXISTS: " if atom.negated else "") + storage.explain(pattern)
+
+
+def _join(plan: RulesPlan, specs: Tuple[_AtomSpec, ...], join_plan: planner.JoinPlan, sql: List[str]) -> JoinExplanation:
+    steps: List[JoinStep] = []
+    estimate = 1.0
+    for position, (atom_idx, pattern, rows) in enumerate(zip(join_plan.order, join_plan.patterns, join_plan.estimates)):
+        atom = specs[atom_idx]
+        driving = position == 0 and join_plan.delta_idx is not None
+        if not driving and not atom.negated:
+            estimate *= rows
+        steps.append(JoinStep(
+            atom_idx,
+            atom.relation,
+            atom.negated,
+            _binding(len(atom.columns), pattern),
+            rows,
+            _access(plan, atom, pattern, driving),
+        ))
+    return JoinExplanation(join_plan.delta_idx, tuple(steps), estimate, tuple(sql))
+
+
+def explain_plan(plan: RulesPlan) -> Explanation:
+    # Join plans are the ones the plan runs with when it has them; otherwise
+    # they are planned now, from current statistics, as execute() would.
+    if plan._join_plans is not None:
+        join_plans = list(plan._join_plans)
+    else:
+        join_plans = plan._plan_joins(plan._reorder_joins)
+    sql: Dict[Tuple[int, Optional[int]], List[str]] = {}
+    if plan._strategy == "sql":
+        orders = {(p.rule_idx, p.delta_idx): p.order for p in join_plans}
+        sql = compiler.SqlEvaluator(plan._heads, orders).explain()
+    specs = {body._rule_idx: _body_specs(body) for head in plan._heads.values() for body in head._lower}
+    joins: Dict[int, List[JoinExplanation]] = {}
+    for join_plan in join_plans:
+        rule_specs = specs[join_plan.rule_idx]
+        joins.setdefault(join_plan.rule_idx, []).append(
+            _join(plan, rule_specs, join_plan, sql.get((join_plan.rule_idx, join_plan.delta_idx), []))
+        )
+    rules = tuple(
+        RuleExplanation(rule_idx, print_rule(plan._program.rules[rule_idx]), tuple(rule_joins))
+        for rule_idx, rule_joins in sorted(joins.items())
+    )
+    graph = dependency_graph(plan._program)
+    return Explanation(
+        plan._strategy,
+        {relation: tuple(sorted(edges)) for relation, edges in graph.items()},
+        tuple(plan._strata),
+        {relation: head._storage.statistics().cardinality for relation, head in plan._heads.items()},
+        rules,
+    )
@@ -0,0 +1,118 @@
+from __future__ import annotations
+import csv
+import mmap
+import os
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .storage import Storage
+from .symbols import Value
+
+Row = Tuple[str, ...]
+Path = Union[str, "os.PathLike[str]"]
+# turns a row read from a file into the row stored, e.g. SymbolTable.encode
+Encoder = Callable[[Row], Tuple[Value, ...]]
+
+# rows per store_many call
+CHUNK_SIZE = 50_000
+
+
+def read_lines(path: Path, use_mmap: bool = True, encoding: str = "utf-8") -> Iterator[str]:
+    with open(path, "rb") as f:
+        # an empty file cannot be mapped
+        if not use_mmap or os.fstat(f.fileno()).st_size == 0:
+            for line in f:
+                yield line.decode(encoding)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                yield line.decode(encoding)
+
+
+def read_csv(
+    path: Path,
+    delimiter: str = ",",
+    header: bool = False,
+    columns: Optional[Sequence[int]] = None,
+    use_mmap: bool = True,
+    encoding: str = "utf-8",
+) -> Iterator[Row]:
+    # Yields the rows of a delimited file one at a time, never holding the file
+    # in memory. `columns` picks (and orders) the file columns kept per row.
+    reader = csv.reader(read_lines(path, use_mmap, encoding), delimiter=delimiter)
+    if header:
+        next(reader, None)
+    for record in reader:
+        if not record:
+            continue
+        yield tuple(record) if columns is None else tuple(record[c] for c in columns)
+
+
+def read_parquet(
+    path: Path,
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    use_mmap: bool = True,
+) -> Iterator[Row]:
+    # pyarrow is an optional dependency, only needed to read Parquet files
+    import pyarrow.parquet as pq  # type: ignore[import-untyped]
+
+    parquet = pq.ParquetFile(path, memory_map=use_mmap)
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=list(columns) if columns else None):
+        for record in zip(*(column.to_pylist() for column in batch.columns)):
+            # rows with missing values hold no fact
+            if None not in record:
+                yield tuple(str(value) for value in record)
+
+
+def chunked(rows: Iterable[Row], chunk_size: int = CHUNK_SIZE) -> Iterator[List[Row]]:
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def load_rows(
+    relation: Storage,
+    rows: Iterable[Row],
+    chunk_size: int = CHUNK_SIZE,
+    encode: Optional[Encoder] = None,
+) -> int:
+    # Stores rows in chunks of bulk inserts committed once, at the end.
+    # Returns the number of rows that were new.
+    inserted = 0
+    with relation.batch():
+        for chunk in chunked(rows, chunk_size):
+            inserted += relation.store_many(chunk if encode is None else [encode(row) for row in chunk])
+    return inserted
+
+
+def load_csv(
+    relation: Storage,
+    path: Path,
+    delimiter: str = ",",
+    header: bool = False,
+    columns: Optional[Sequence[int]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    use_mmap: bool = True,
+    encoding: str = "utf-8",
+    encode: Optional[Encoder] = None,
+) -> int:
+    rows = read_csv(path, delimiter, header, columns, use_mmap, encoding)
+    return load_rows(relation, rows, chunk_size, encode)
+
+
+def load_tsv(relation: Storage, path: Path, **options) -> int:
+    return load_csv(relation, path, delimiter="\t", **options)
+
+
+def load_parquet(
+    relation: Storage,
+    path: Path,
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    use_mmap: bool = True,
+    encode: Optional[Encoder] = None,
+) -> int:
+    return load_rows(relation, read_parquet(path, columns, chunk_size, use_mmap), chunk_size, encode)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set, Tuple
+
+from . import nodes
+
+"""
+MagicProgram is the result of the magic-sets transformation of a program for
+one query: `program` only derives facts relevant to the bound query arguments
+and `answer` is the adorned relation holding the query's answers.
+"""
+@dataclass(frozen=True, slots=True)
+class MagicProgram:
+    program: nodes.Program
+    answer: str
+
+
+def adorned_name(relation: str, adornment: str) -> str:
+    return f"{relation}__{adornment}"
+
+
+def magic_name(relation: str, adornment: str) -> str:
+    return f"magic__{relation}__{adornment}"
+
+
+def adornment_of(atom: nodes.Atom, bound: Set[nodes.Variable]) -> str:
+    return "".join(
+        "f" if isinstance(term, nodes.Variable) and term not in bound else "b"
+        for term in atom.terms
+    )
+
+
+def _magic_atom(relation: str, adornment: str, atom: nodes.Atom) -> nodes.Atom:
+    terms = tuple(term for term, a in zip(atom.terms, adornment) if a == "b")
+    # a magic atom is the head of a rule, where a variable may only appear once
+    variables = [term for term in terms if isinstance(term, nodes.Variable)]
+    if len(set(variables)) != len(variables):
+        raise ValueError(f"atom of relation '{atom.relation}' repeats a bound variable, which magic sets cannot pass on")
+    return nodes.Atom(magic_name(relation, adornment), terms)
+
+
+def magic_program(program: nodes.Program, relation: str, keys: Iterable[Tuple[int, str]]) -> MagicProgram:
+    bound_values: Dict[int, str] = dict(keys)
+    idb = {r.head.relation for r in program.rules}
+    arity = next((r.head.arity for r in program.rules if r.head.relation == relation), None)
+    if arity is None:
+        raise ValueError(f"relation '{relation}' is not derived by any rule")
+    query_adornment = "".join("b" if i in bound_values else "f" for i in range(arity))
+    rules: List[nodes.Rule] = []
+    seen: Set[Tuple[str, str]] = {(relation, query_adornment)}
+    pending: List[Tuple[str, str]] = [(relation, query_adornment)]
+    while pending:
+        head_relation, adornment = pending.pop()
+        guarded = "b" in adornment
+        for rule in program.rules:
+            if rule.head.relation != head_relation:
+                continue
+            head = nodes.Atom(adorned_name(head_relation, adornment), rule.head.terms)
+            guard: List[nodes.Atom] = [_magic_atom(head_relation, adornment, rule.head)] if guarded else []
+            bound: Set[nodes.Variable] = {
+                term for term, a in zip(rule.head.terms, adornment)
+                if a == "b" and isinstance(term, nodes.Variable)
+            }
+            body: List[nodes.Atom] = []
+            for atom in rule.body:
+                if atom.relation in idb:
+                    body_adornment = adornment_of(atom, bound)
+                    if "b" in body_adornment:
+                        # sideways information passing: bindings flow left to right
+                        rules.append(nodes.Rule(
+                            _magic_atom(atom.relation, body_adornment, atom),
+                            tuple(guard + body),
+                        ))
+                    if (atom.relation, body_adornment) not in seen:
+                        seen.add((atom.relation, body_adornment))
+                        pending.append((atom.relation, body_adornment))
+                    body.append(nodes.Atom(adorned_name(atom.relation, body_adornment), atom.terms))
+                else:
+                    body.append(atom)
+                bound.update(term for term in atom.terms if isinstance(term, nodes.Variable))
+            rules.append(nodes.Rule(head, tuple(guard + body)))
+    if "b" in query_adornment:
+        seed = tuple(nodes.Constant(bound_values[i]) for i in sorted(bound_values))
+        rules.append(nodes.Rule(nodes.Atom(magic_name(relation, query_adornment), seed), ()))
+    return MagicProgram(nodes.Program(tuple(rules)), adorned_name(relation, query_adornment))
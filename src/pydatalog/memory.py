@@ -0,0 +1,231 @@
+import heapq
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .planner import RelationStats
+from .symbols import Value
+
+Row = Tuple[Value, ...]
+
+
+def select_rows(
+    rows: Iterable[Row],
+    columns: Optional[Sequence[int]] = None,
+    distinct: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    after: Optional[Row] = None,
+) -> Iterator[Row]:
+    # Projection, DISTINCT and pagination of rows held in memory, ordered like
+    # Db.select: by the selected columns whenever a page is asked for.
+    if columns is not None and after is not None and not distinct:
+        raise ValueError("keyset pagination over a projection requires distinct=True")
+    selected: Iterable[Row] = rows if columns is None else (tuple(row[c] for c in columns) for row in rows)
+    if distinct:
+        selected = dict.fromkeys(selected)
+    if limit is None and not offset and after is None:
+        yield from selected
+        return
+    if after is not None:
+        selected = (row for row in selected if row > after)
+    if limit is None:
+        yield from sorted(selected)[offset:]
+    else:
+        yield from heapq.nsmallest(offset + limit, selected)[offset:]
+
+"""
+MemoryRelation keeps the tuples of one relation in a dict used as a set, plus
+hash indexes keyed by bound-column patterns. Every row maps to its position in
+insertion order, which is what watermarks refer to; the log maps the positions
+of the rows present back to them, in order, so removed rows leave nothing
+behind in it.
+"""
+class _MemoryRelation:
+    arity: int
+    rows: Dict[Row, int]
+    log: Dict[int, Row]
+    end: int
+    indexes: Dict[Tuple[int, ...], Dict[Row, Dict[Row, None]]]
+
+    def __init__(self, arity: int) -> None:
+        self.arity = arity
+        self.rows = {}
+        self.log = {}
+        self.end = 0
+        self.indexes = {}
+        self.version = 0
+        self.stats: Optional[Tuple[int, RelationStats]] = None
+
+    def add(self, row: Row) -> bool:
+        if row in self.rows:
+            return False
+        self.rows[row] = self.end
+        self.log[self.end] = row
+        self.end += 1
+        self.version += 1
+        for cols, index in self.indexes.items():
+            index.setdefault(tuple(row[c] for c in cols), {})[row] = None
+        return True
+
+    def remove(self, row: Row) -> bool:
+        position = self.rows.pop(row, None)
+        if position is None:
+            return False
+        del self.log[position]
+        self.version += 1
+        for cols, index in self.indexes.items():
+            key = tuple(row[c] for c in cols)
+            bucket = index[key]
+            del bucket[row]
+            if not bucket:
+                del index[key]
+        return True
+
+    def index(self, cols: Tuple[int, ...]) -> Dict[Row, Dict[Row, None]]:
+        index = self.indexes.get(cols)
+        if index is None:
+            index = {}
+            for row in self.rows:
+                index.setdefault(tuple(row[c] for c in cols), {})[row] = None
+            self.indexes[cols] = index
+        return index
+
+
+"""
+MemoryStore plays the role of a sqlite3.Connection for MemoryDb: every
+MemoryDb opened on the same store and relation name shares its tuples.
+"""
+class MemoryStore:
+    _relations: Dict[str, _MemoryRelation]
+
+    def __init__(self) -> None:
+        self._relations = {}
+
+    def _open(self, relation: str, arity: int) -> _MemoryRelation:
+        existing = self._relations.get(relation)
+        if existing is None:
+            existing = self._relations[relation] = _MemoryRelation(arity)
+        elif existing.arity != arity:
+            raise ValueError(f"Relation {relation} already exists with arity {existing.arity}, not {arity}")
+        return existing
+
+
+"""
+MemoryDb is a drop-in replacement for db.Db that never touches SQLite.
+"""
+class MemoryDb:
+    relation: str
+    arity: int
+
+    def __init__(self, store: MemoryStore, relation: str, arity: int) -> None:
+        self.relation = relation
+        self.arity = arity
+        self._data = store._open(relation, arity)
+
+    def store(self, tuple_data: Row) -> bool:
+        if len(tuple_data) != self.arity:
+            raise ValueError(f"Tuple arity {len(tuple_data)} does not match expected arity {self.arity}")
+        return self._data.add(tuple(tuple_data))
+
+    def store_many(self, tuples: Iterable[Row]) -> int:
+        inserted = 0
+        for tuple_data in tuples:
+            if self.store(tuple_data):
+                inserted += 1
+        return inserted
+
+    def load(self, *keys: Tuple[int, Value]) -> Iterator[Row]:
+        if not keys:
+            rows: List[Row] = list(self._data.rows)
+        else:
+            bound: Dict[int, Value] = {}
+            for index, value in keys:
+                if bound.setdefault(index, value) != value:
+                    return
+            cols = tuple(sorted(bound))
+            bucket = self._data.index(cols).get(tuple(bound[c] for c in cols))
+            if bucket is None:
+                return
+            rows = list(bucket)
+        yield from rows
+
+    def delete_many(self, tuples: Iterable[Row]) -> int:
+        deleted = 0
+        for tuple_data in tuples:
+            if len(tuple_data) != self.arity:
+                raise ValueError(f"Tuple arity {len(tuple_data)} does not match expected arity {self.arity}")
+            if self._data.remove(tuple(tuple_data)):
+                deleted += 1
+        return deleted
+
+    def select(
+        self,
+        keys: Sequence[Tuple[int, Value]] = (),
+        columns: Optional[Sequence[int]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Row] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Row]:
+        # batch_size is accepted for parity with Db; rows are already in memory
+        self._check_columns(columns or ())
+        return select_rows(self.load(*keys), columns, distinct, limit, offset, after)
+
+    def count(self, *keys: Tuple[int, Value], columns: Optional[Sequence[int]] = None) -> int:
+        if columns is not None:
+            self._check_columns(columns)
+            return len({tuple(row[c] for c in columns) for row in self.load(*keys)})
+        if not keys:
+            return len(self._data.rows)
+        return sum(1 for _ in self.load(*keys))
+
+    def _check_columns(self, columns: Iterable[int]) -> None:
+        for c in columns:
+            if not 0 <= c < self.arity:
+                raise ValueError(f"Column {c} out of range for relation {self.relation} of arity {self.arity}")
+
+    def statistics(self) -> RelationStats:
+        token = self._data.version
+        if self._data.stats is None or self._data.stats[0] != token:
+            rows = self._data.rows
+            distinct = tuple(len({row[c] for row in rows}) for c in range(self.arity))
+            self._data.stats = (token, RelationStats(len(rows), distinct))
+        return self._data.stats[1]
+
+    def watermark(self) -> int:
+        return self._data.end
+
+    def load_since(self, watermark: int) -> Iterator[Row]:
+        # the rows past the watermark are the last ones of the log
+        since: List[Row] = []
+        for position, row in reversed(self._data.log.items()):
+            if position < watermark:
+                break
+            since.append(row)
+        yield from reversed(since)
+
+    def version(self) -> int:
+        return self._data.version
+
+    def explain(self, columns: Iterable[int]) -> str:
+        # worded like SQLite's EXPLAIN QUERY PLAN; hash indexes are built on first use
+        cols = sorted(set(columns))
+        if not cols:
+            return f"SCAN {self.relation}"
+        return f"SEARCH {self.relation} USING HASH INDEX ({' AND '.join(f'col{c}=?' for c in cols)})"
+
+    def ensure_index(self, columns: Iterable[int]) -> bool:
+        cols = tuple(sorted(set(columns)))
+        for c in cols:
+            if not 0 <= c < self.arity:
+                raise ValueError(f"Column {c} out of range for relation {self.relation} of arity {self.arity}")
+        if not cols or cols in self._data.indexes:
+            return False
+        self._data.index(cols)
+        return True
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # there is nothing to commit: writes are visible immediately
+        yield
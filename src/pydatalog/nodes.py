@@ -11,10 +11,22 @@ class Variable:
 class Constant:
     value: str
 
+# aggregate functions allowed in rule heads
+AGGREGATES = ("count", "sum", "min", "max")
+
+# An aggregate head term: one value per group of the other head terms,
+# computed over the distinct bindings of the rule body.
+@dataclass(frozen=True, slots=True)
+class Aggregate:
+    function: str
+    variable: Variable
+
 @dataclass(frozen=True, slots=True)
 class Atom:
     relation: str
     terms: Tuple[Term, ...] = ()
+    # a negated atom may only appear in a rule body
+    negated: bool = False
 
     @property
     def arity(self) -> int:
@@ -33,9 +45,18 @@ class Program:
 
     def __post_init__(self):
         arities: Dict[str, int] = {}
+        # aggregate positions and functions of every relation defined with aggregates
+        signatures: Dict[str, Tuple[Tuple[int, str], ...]] = {}
         for r in self.rules:
+            if r.head.negated:
+                raise ValueError(f"negated atom '{r.head}' cannot be the head of rule '{r}'")
+            signature = _aggregate_signature(r)
+            if signatures.setdefault(r.head.relation, signature) != signature:
+                raise ValueError(f"rules for relation '{r.head.relation}' do not agree on its aggregates, in rule '{r}'")
             atoms = (r.head, *r.body)
             for a in atoms:
+                if a is not r.head and any(isinstance(t, Aggregate) for t in a.terms):
+                    raise ValueError(f"aggregate in body atom '{a}' of rule '{r}'; aggregates may only appear in heads")
                 ar = a.arity
                 prev = arities.get(a.relation)
                 if prev is None:
@@ -46,8 +67,24 @@ class Program:
                         f"previously seen arity {prev}, now seen arity {ar} in atom '{a}' of rule '{r}'"
                     )
 
+
+def _aggregate_signature(r: Rule) -> Tuple[Tuple[int, str], ...]:
+    signature = tuple((k, t.function) for k, t in enumerate(r.head.terms) if isinstance(t, Aggregate))
+    if not signature:
+        return signature
+    if not r.body:
+        raise ValueError(f"fact '{r}' cannot hold an aggregate")
+    grouped = {t for t in r.head.terms if isinstance(t, Variable)}
+    aggregated = [t.variable for t in r.head.terms if isinstance(t, Aggregate)]
+    for t in r.head.terms:
+        if isinstance(t, Aggregate) and t.function not in AGGREGATES:
+            raise ValueError(f"unknown aggregate '{t.function}' in rule '{r}', expected one of {', '.join(AGGREGATES)}")
+    if len(set(aggregated)) != len(aggregated) or grouped & set(aggregated):
+        raise ValueError(f"each aggregate of rule '{r}' needs its own variable, distinct from the grouped ones")
+    return signature
+
 # Term is a union of concrete term node types
-Term = Union[Variable, Constant]
+Term = Union[Variable, Constant, Aggregate]
 
 # Ergonomic factories for strict construction
 
@@ -55,6 +92,14 @@ def atom(relation: str, *terms: Term) -> Atom:
     return Atom(relation=relation, terms=tuple(terms))
 
 
+def aggregate(function: str, variable: Variable) -> Aggregate:
+    return Aggregate(function=function, variable=variable)
+
+
+def negate(a: Atom) -> Atom:
+    return Atom(relation=a.relation, terms=a.terms, negated=not a.negated)
+
+
 def rule(head: Atom, *body: Atom) -> Rule:
     return Rule(head=head, body=tuple(body))
 
@@ -0,0 +1,255 @@
+from __future__ import annotations
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from .seminaive import (
+    Binding,
+    Orders,
+    Row,
+    SemiNaiveEvaluator,
+    _Const,
+    _RelationIndex,
+    _RuleSpec,
+    _delta_order,
+    _delta_seeds,
+    _evaluate_delta,
+    _evaluate_full,
+    _join,
+    _project,
+)
+from .symbols import Value
+
+if TYPE_CHECKING:
+    from .analysis import Stratum
+    from .execution import _RuleHeadPlan
+    from .profiling import Profiler
+
+# deltas smaller than this many rows per worker are not split further
+_MIN_ROWS = 256
+
+
+def _indexes(rows: Dict[str, Set[Row]]) -> Dict[str, _RelationIndex]:
+    return {relation: _RelationIndex(relation_rows) for relation, relation_rows in rows.items()}
+
+
+def _reduce(
+    spec: _RuleSpec,
+    order: Iterable[int],
+    seeds: List[Binding],
+    bound: Set[int],
+    relations: Dict[str, _RelationIndex],
+) -> Dict[str, Set[Row]]:
+    # Semi-join reduction along the join order: of every atom's relation, only
+    # the rows matching values the seeds and the atoms before it can bind.
+    # These are all the rows a task joining `seeds` can read.
+    values: Dict[int, Set[Value]] = {slot: {seed[slot] for seed in seeds} for slot in bound}  # type: ignore[misc]
+    shipped: Dict[str, Set[Row]] = {}
+    for atom_idx in sorted(order, key=lambda i: spec.body[i].negated):
+        atom = spec.body[atom_idx]
+        relation = relations[atom.relation]
+        keys: List[Tuple[int, Set[Value]]] = []
+        for col, column in enumerate(atom.columns):
+            if isinstance(column, _Const):
+                keys.append((col, {column.value}))
+            elif column in values:
+                keys.append((col, values[column]))
+        rows: Iterable[Row] = relation.rows
+        if keys:
+            # probe the column with the fewest candidate values, filter on the rest
+            col, candidates = min(keys, key=lambda key: len(key[1]))
+            rows = (row for value in candidates for row in relation.lookup((col,), (value,)))
+        matched = {row for row in rows if all(row[c] in allowed for c, allowed in keys)}
+        shipped.setdefault(atom.relation, set()).update(matched)
+        if atom.negated:
+            continue
+        for col, column in enumerate(atom.columns):
+            if isinstance(column, int) and column not in values:
+                values[column] = {row[col] for row in matched}
+    return shipped
+
+
+# Worker task: join the seed bindings against the shipped relations.
+def _fire(spec: _RuleSpec, order: List[int], seeds: List[Binding], bound: Set[int], rows: Dict[str, Set[Row]]) -> Set[Row]:
+    return {_project(spec, b) for b in _join(spec, order, seeds, _indexes(rows), bound)}
+
+
+# Worker task: evaluate a whole stratum over a copy of the relations it reads
+# and return the tuples it added to each relation.
+def _solve(
+    rules: List[Tuple[int, _RuleSpec]],
+    orders: Orders,
+    rows: Dict[str, Set[Row]],
+    recursive: bool,
+) -> Dict[str, Set[Row]]:
+    relations = _indexes(rows)
+    added: Dict[str, Set[Row]] = {}
+
+    def store(derived: Dict[str, Set[Row]]) -> Dict[str, Set[Row]]:
+        delta: Dict[str, Set[Row]] = {}
+        for relation, relation_rows in derived.items():
+            new = relations[relation].add(relation_rows)
+            if new:
+                added.setdefault(relation, set()).update(new)
+                delta[relation] = new
+        return delta
+
+    derived: Dict[str, Set[Row]] = {}
+    for rule_idx, spec in rules:
+        derived.setdefault(spec.head_relation, set()).update(_evaluate_full(rule_idx, spec, orders, relations))
+    delta = store(derived)
+    while recursive and delta:
+        derived = {}
+        for rule_idx, spec in rules:
+            for head_rows in _evaluate_delta(rule_idx, spec, orders, relations, delta):
+                derived.setdefault(spec.head_relation, set()).update(head_rows)
+        delta = store(derived)
+    return added
+
+
+def _aggregating(rules: Iterable[Tuple[int, _RuleSpec]]) -> bool:
+    return any(spec.aggregates for _, spec in rules)
+
+
+def _read(rules: Iterable[Tuple[int, _RuleSpec]]) -> Set[str]:
+    relations: Set[str] = set()
+    for _, spec in rules:
+        relations.add(spec.head_relation)
+        relations.update(atom.relation for atom in spec.body)
+    return relations
+
+
+"""
+ParallelEvaluator is a SemiNaiveEvaluator that spreads execute() over a pool
+of worker processes. Strata that do not depend on each other are solved
+concurrently, one worker each. A stratum evaluated alone is split per rule
+and, within every semi-naive iteration, its deltas are partitioned by a hash
+of the columns they join on with the next atom, so each worker only receives
+the matching partition of that atom's relation. Results are merged and
+deduplicated in the parent, which remains the only writer to storage.
+
+A task receives its part of the seeds and, of every relation it joins, only
+the rows reachable from them through a semi-join along the join order; a
+stratum solved in one worker receives the relations it reads. The pool pays
+off when join work dominates the cost of shipping tuples. Incremental updates after
+execute() run serially, as does the first pass of aggregating strata.
+A Profiler sees the tuples each task produced, but not the probes made in
+workers, nor the iterations of strata solved entirely in one worker.
+"""
+class ParallelEvaluator(SemiNaiveEvaluator):
+    _workers: int
+    _pool: Optional[Executor]
+
+    def __init__(
+        self,
+        heads: Dict[str, _RuleHeadPlan],
+        orders: Optional[Orders] = None,
+        strata: Optional[List[Stratum]] = None,
+        workers: int = 2,
+        profiler: Optional[Profiler] = None,
+    ) -> None:
+        super().__init__(heads, orders, strata, profiler)
+        self._workers = workers
+        self._pool = None
+
+    def run(self) -> None:
+        self.load()
+        with ProcessPoolExecutor(self._workers) as pool:
+            self._pool = pool
+            try:
+                if self._strata is None:
+                    self._evaluate_stratum(self._rules, True)
+                    return
+                for wave in self._waves(self._strata):
+                    futures = []
+                    for stratum in wave:
+                        rules = self._stratum_rules(stratum)
+                        if len(wave) == 1 or _aggregating(rules):
+                            self._evaluate_stratum(rules, stratum.recursive)
+                            continue
+                        rows = {relation: self._relations[relation].rows for relation in _read(rules)}
+                        futures.append(pool.submit(_solve, rules, self._orders, rows, stratum.recursive))
+                    for future in futures:
+                        self._store(future.result())
+            finally:
+                self._pool = None
+
+    def _waves(self, strata: List[Stratum]) -> List[List[Stratum]]:
+        # strata are listed dependencies first; a stratum joins the wave after
+        # the latest one holding a relation it reads
+        depth: Dict[str, int] = {}
+        waves: List[List[Stratum]] = []
+        for stratum in strata:
+            reads = _read(self._stratum_rules(stratum)) - stratum.relations
+            level = max((depth[relation] + 1 for relation in reads if relation in depth), default=0)
+            for relation in stratum.relations:
+                depth[relation] = level
+            if level == len(waves):
+                waves.append([])
+            waves[level].append(stratum)
+        return waves
+
+    def _evaluate_stratum(self, rules: List[Tuple[int, _RuleSpec]], recursive: bool) -> None:
+        if self._pool is None or _aggregating(rules):
+            super()._evaluate_stratum(rules, recursive)
+            return
+        pool = self._pool
+        futures: List[Tuple[int, _RuleSpec, Future[Set[Row]]]] = []
+        for rule_idx, spec in rules:
+            order = list(self._orders.get((rule_idx, None), range(len(spec.body))))
+            seeds: List[Binding] = [(None,) * spec.slots]
+            rows = _reduce(spec, order, seeds, set(), self._relations)
+            futures.append((rule_idx, spec, pool.submit(_fire, spec, order, seeds, set(), rows)))
+        derived: Dict[str, Set[Row]] = {}
+        for rule_idx, spec, future in futures:
+            self._collect(derived, rule_idx, spec, future.result())
+        delta = self._store(derived)
+        self._iteration(delta)
+        if recursive:
+            self._fixpoint(delta, rules)
+
+    def _fixpoint(self, delta: Dict[str, Set[Row]], rules: Optional[List[Tuple[int, _RuleSpec]]] = None) -> None:
+        if self._pool is None:
+            super()._fixpoint(delta, rules)
+            return
+        pool = self._pool
+        while delta:
+            futures: List[Tuple[int, _RuleSpec, Future[Set[Row]]]] = []
+            for rule_idx, spec in self._rules if rules is None else rules:
+                for delta_idx, atom in enumerate(spec.body):
+                    delta_rows = delta.get(atom.relation)
+                    if not delta_rows or atom.negated:
+                        continue
+                    for task in self._partition(rule_idx, spec, delta_idx, delta_rows):
+                        futures.append((rule_idx, spec, pool.submit(_fire, *task)))
+            derived: Dict[str, Set[Row]] = {}
+            for rule_idx, spec, future in futures:
+                self._collect(derived, rule_idx, spec, future.result())
+            delta = self._store(derived)
+            self._iteration(delta)
+
+    def _partition(
+        self,
+        rule_idx: int,
+        spec: _RuleSpec,
+        delta_idx: int,
+        delta_rows: Set[Row],
+    ) -> List[Tuple[_RuleSpec, List[int], List[Binding], Set[int], Dict[str, Set[Row]]]]:
+        seeds = _delta_seeds(spec, delta_idx, delta_rows)
+        bound = {c for c in spec.body[delta_idx].columns if isinstance(c, int)}
+        order = _delta_order(rule_idx, spec, self._orders, delta_idx)
+        parts = max(1, min(self._workers, len(seeds) // _MIN_ROWS))
+        # seeds are split by a hash of the slots they share with the next
+        # positive atom, so the rows reachable from each part overlap little
+        following = [i for i in order if not spec.body[i].negated]
+        key_slots: List[int] = []
+        if following:
+            key_slots = [c for c in dict.fromkeys(spec.body[following[0]].columns) if isinstance(c, int) and c in bound]
+        seed_parts: List[List[Binding]] = [[] for _ in range(parts)]
+        for n, seed in enumerate(seeds):
+            target = hash(tuple(seed[slot] for slot in key_slots)) % parts if key_slots else n % parts
+            seed_parts[target].append(seed)
+        return [
+            (spec, order, seed_part, bound, _reduce(spec, order, seed_part, bound, self._relations))
+            for seed_part in seed_parts
+            if seed_part
+        ]
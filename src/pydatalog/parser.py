@@ -0,0 +1,386 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+from contextlib import ExitStack
+from pathlib import Path as FilePath
+from typing import Dict, Iterable, Iterator, List, NoReturn, Optional, Sequence, Tuple, Union
+
+from . import loaders, storage
+from .execution import RulesPlan
+from .nodes import AGGREGATES, Aggregate, Atom, Constant, Program, Rule, Term, Variable
+
+Row = Tuple[str, ...]
+# a ground fact read from the source: its relation and row
+Fact = Tuple[str, Row]
+# program text, or the path of a file holding it
+Source = Union[str, "os.PathLike[str]"]
+
+# bumped whenever parsing changes what a cached entry holds
+_CACHE_FORMAT = 2
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|%[^\n]*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<number>-?[0-9]+(?:\.[0-9]+)?(?![A-Za-z0-9_]))
+  | (?P<name>[a-z0-9][A-Za-z0-9_]*)
+  | (?P<var>[A-Z_][A-Za-z0-9_]*)
+  | (?P<punct>:-|[(),.])
+""", re.VERBOSE)
+
+# a whole line holding one fact of bare constants, read without tokenizing
+_FACT = re.compile(r"\s*([a-z][A-Za-z0-9_]*)\s*(?:\(([^()\"%]*)\))?\s*(?::-\s*)?\.\s*(?:%.*)?")
+_BARE = re.compile(r"\s*([a-z0-9][A-Za-z0-9_]*|-?[0-9]+(?:\.[0-9]+)?)\s*")
+
+
+def _fast_fact(line: str) -> Optional[Fact]:
+    match = _FACT.fullmatch(line)
+    if match is None:
+        return None
+    relation, args = match.groups()
+    if args is None:
+        return relation, ()
+    row = []
+    for arg in args.split(","):
+        bare = _BARE.fullmatch(arg)
+        if bare is None:
+            return None
+        row.append(bare.group(1))
+    return relation, tuple(row)
+
+
+"""
+_Statement parses the tokens of one statement, `head :- body .`, where the
+body is a comma separated list of atoms, each optionally preceded by `not`.
+Errors are reported with the line the statement starts on.
+"""
+class _Statement:
+    _tokens: List[Tuple[str, str]]
+    _pos: int
+    _line: int
+
+    def __init__(self, tokens: List[Tuple[str, str]], line: int) -> None:
+        self._tokens = tokens
+        self._pos = 0
+        self._line = line
+
+    def parse(self) -> Rule:
+        head = self._atom(head=True)
+        body: List[Atom] = []
+        if self._accept(":-"):
+            if not self._peek(".", 0):
+                body.append(self._literal())
+                while self._accept(","):
+                    body.append(self._literal())
+        self._expect(".")
+        if self._pos != len(self._tokens):
+            self._error(f"unexpected '{self._tokens[self._pos][1]}' after the end of the statement")
+        return Rule(head, tuple(body))
+
+    def _literal(self) -> Atom:
+        # `not` is a relation name unless another relation name follows it
+        kind, text = self._current()
+        if kind == "name" and text == "not" and self._kind(1) in ("name", "var"):
+            self._pos += 1
+            return Atom(*self._atom_parts(), negated=True)
+        return self._atom()
+
+    def _atom(self, head: bool = False) -> Atom:
+        return Atom(*self._atom_parts(head))
+
+    def _atom_parts(self, head: bool = False) -> Tuple[str, Tuple[Term, ...]]:
+        kind, relation = self._current()
+        if kind not in ("name", "var"):
+            self._error(f"expected a relation name, found '{relation}'")
+        self._pos += 1
+        terms: List[Term] = []
+        if self._accept("("):
+            terms.append(self._term(head))
+            while self._accept(","):
+                terms.append(self._term(head))
+            self._expect(")")
+        return relation, tuple(terms)
+
+    def _term(self, head: bool) -> Term:
+        kind, text = self._current()
+        self._pos += 1
+        match kind:
+            case "var":
+                return Variable(text)
+            case "string":
+                return Constant(json.loads(text))
+            case "name" | "number":
+                if text in AGGREGATES and self._peek("(", 0):
+                    if not head:
+                        self._error(f"aggregate '{text}' outside a rule head")
+                    self._pos += 1
+                    kind, name = self._current()
+                    if kind != "var":
+                        self._error(f"aggregate '{text}' expects a variable, found '{name}'")
+                    self._pos += 1
+                    self._expect(")")
+                    return Aggregate(text, Variable(name))
+                return Constant(text)
+        self._error(f"expected a term, found '{text}'")
+
+    def _current(self) -> Tuple[str, str]:
+        if self._pos >= len(self._tokens):
+            self._error("unexpected end of input, missing '.'")
+        return self._tokens[self._pos]
+
+    def _kind(self, ahead: int) -> Optional[str]:
+        pos = self._pos + ahead
+        return self._tokens[pos][0] if pos < len(self._tokens) else None
+
+    def _peek(self, punct: str, ahead: int) -> bool:
+        pos = self._pos + ahead
+        return pos < len(self._tokens) and self._tokens[pos] == ("punct", punct)
+
+    def _accept(self, punct: str) -> bool:
+        if self._peek(punct, 0):
+            self._pos += 1
+            return True
+        return False
+
+    def _expect(self, punct: str) -> None:
+        if not self._accept(punct):
+            found = self._tokens[self._pos][1] if self._pos < len(self._tokens) else "end of input"
+            self._error(f"expected '{punct}', found '{found}'")
+
+    def _error(self, message: str) -> NoReturn:
+        raise ValueError(f"line {self._line}: {message}")
+
+
+def _tokens(line: str, number: int) -> Iterator[Tuple[str, str]]:
+    pos = 0
+    while pos < len(line):
+        match = _TOKEN.match(line, pos)
+        if match is None:
+            raise ValueError(f"line {number}: unexpected character '{line[pos]}'")
+        pos = match.end()
+        if match.lastgroup != "space":
+            yield match.lastgroup, match.group()  # type: ignore[misc]
+
+
+def _ground(rule: Rule) -> Optional[Fact]:
+    if rule.body or not all(isinstance(term, Constant) for term in rule.head.terms):
+        return None
+    return rule.head.relation, tuple(term.value for term in rule.head.terms)  # type: ignore[union-attr]
+
+
+def _has_body(tokens: Sequence[Tuple[str, str]]) -> bool:
+    # the tokens of a statement up to its '.' hold a non-empty body
+    for pos, token in enumerate(tokens):
+        if token == ("punct", ":-"):
+            return tokens[pos + 1] != ("punct", ".")
+    return False
+
+
+def parse_statements(lines: Iterable[str], rules: bool = True) -> Iterator[Union[Rule, Fact]]:
+    # Yields every statement of the source in order: ground facts as
+    # (relation, row) pairs, everything else as a Rule. Lines holding one fact
+    # of bare constants, the bulk of a large source, skip the tokenizer. With
+    # rules=False, statements with a body are skipped without being parsed.
+    pending: List[Tuple[str, str]] = []
+    start = 0
+    for number, line in enumerate(lines, 1):
+        if not pending:
+            fact = _fast_fact(line)
+            if fact is not None:
+                yield fact
+                continue
+            start = number
+        for token in _tokens(line, number):
+            pending.append(token)
+            if token == ("punct", "."):
+                if not rules and _has_body(pending):
+                    pending = []
+                    start = number
+                    continue
+                rule = _Statement(pending, start).parse()
+                ground = _ground(rule)
+                if ground is None and not rule.body:
+                    raise ValueError(f"line {start}: fact '{rule.head.relation}' must only hold constants")
+                yield rule if ground is None else ground
+                pending = []
+                start = number
+    if pending:
+        _Statement(pending, start).parse()
+
+
+def _fact_rule(fact: Fact) -> Rule:
+    relation, row = fact
+    return Rule(Atom(relation, tuple(Constant(value) for value in row)))
+
+
+def parse_program(text: str) -> Program:
+    # the inverse of printer.print_program
+    return Program(tuple(
+        statement if isinstance(statement, Rule) else _fact_rule(statement)
+        for statement in parse_statements(text.splitlines())
+    ))
+
+
+def _lines(source: Source, use_mmap: bool) -> Iterator[str]:
+    if isinstance(source, str):
+        return iter(source.splitlines())
+    return loaders.read_lines(source, use_mmap)
+
+
+def _term_json(term: Term) -> Dict[str, str]:
+    match term:
+        case Variable(name=name):
+            return {"var": name}
+        case Constant(value=value):
+            return {"const": value}
+        case Aggregate(function=function, variable=variable):
+            return {"agg": function, "var": variable.name}
+    raise ValueError(f"unknown term {term!r}")
+
+
+def _json_term(value: Dict[str, str]) -> Term:
+    if "agg" in value:
+        return Aggregate(value["agg"], Variable(value["var"]))
+    if "var" in value:
+        return Variable(value["var"])
+    return Constant(value["const"])
+
+
+def _atom_json(atom: Atom) -> List:
+    return [atom.relation, [_term_json(term) for term in atom.terms], atom.negated]
+
+
+def _json_atom(value: List) -> Atom:
+    relation, terms, negated = value
+    return Atom(relation, tuple(_json_term(term) for term in terms), bool(negated))
+
+
+"""
+ProgramCache keeps parsed programs in a directory, keyed by a hash of the
+program source, so a process that loads the same source again skips parsing
+its rules. Entries are plain JSON written atomically, so reading a cache
+directory others can write to never runs code; an unreadable entry counts as
+missing. Join plans are not cached: they depend on the data, and a plan
+always orders its joins from current statistics.
+"""
+class ProgramCache:
+    directory: FilePath
+
+    def __init__(self, directory: Union[str, "os.PathLike[str]"]) -> None:
+        self.directory = FilePath(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(source: Source) -> str:
+        digest = hashlib.sha256(f"pydatalog-{_CACHE_FORMAT}\n".encode())
+        if isinstance(source, str):
+            digest.update(source.encode())
+        else:
+            with open(source, "rb") as f:
+                while block := f.read(1 << 20):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def program(self, key: str) -> Optional[Program]:
+        try:
+            with open(self.directory / f"{key}.program.json", encoding="utf-8") as f:
+                rules = json.load(f)
+            return Program(tuple(
+                Rule(_json_atom(head), tuple(_json_atom(atom) for atom in body)) for head, body in rules
+            ))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def store_program(self, key: str, program: Program) -> None:
+        rules = [[_atom_json(rule.head), [_atom_json(atom) for atom in rule.body]] for rule in program.rules]
+        path = self.directory / f"{key}.program.json"
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(rules, f)
+        os.replace(temporary, path)
+
+
+def load_program(
+    source: Source,
+    idb_storage: storage.Backend,
+    edb_storage: storage.Backend,
+    cache: Optional[ProgramCache] = None,
+    chunk_size: int = loaders.CHUNK_SIZE,
+    use_mmap: bool = True,
+    **options,
+) -> RulesPlan:
+    # Builds a RulesPlan from program text or a program file in one pass over
+    # the source. Facts of relations without rules never become fact rules:
+    # they are streamed into edb_storage in chunks of store_many, so only the
+    # rules (and the facts of derived relations) are held in memory. Facts
+    # streamed before a rule shows their relation is derived are read back.
+    # With a cache, a source seen before only has its facts parsed.
+    key = cache.key(source) if cache is not None else None
+    program = cache.program(key) if cache is not None and key is not None else None
+    cached = program is not None
+    rules: List[Rule] = [rule for rule in program.rules if rule.body] if program is not None else []
+    heads = {rule.head.relation for rule in rules}
+    arities: Dict[str, int] = {atom.relation: atom.arity for rule in rules for atom in (rule.head, *rule.body)}
+    symbols = options.get("symbols")
+    edb_factory = storage.factory(edb_storage, interned=symbols is not None)
+    relations: Dict[str, storage.Storage] = {}
+    watermarks: Dict[str, int] = {}
+    pending: Dict[str, List[Row]] = {}
+    derived_facts: List[Rule] = []
+
+    with ExitStack() as batches:
+        def flush(relation: str) -> None:
+            rows = pending.pop(relation, [])
+            if rows:
+                relations[relation].store_many(rows if symbols is None else [symbols.encode(row) for row in rows])
+
+        def derive(relation: str) -> None:
+            # the facts streamed so far become fact rules of a derived relation
+            flush(relation)
+            relation_storage = relations.pop(relation)
+            rows = list(relation_storage.load_since(watermarks.pop(relation)))
+            relation_storage.delete_many(rows)
+            decoded: Iterable[Row] = (
+                symbols.decode_all(rows) if symbols is not None else (tuple(map(str, row)) for row in rows)
+            )
+            derived_facts.extend(_fact_rule((relation, row)) for row in decoded)
+
+        for statement in parse_statements(_lines(source, use_mmap), rules=not cached):
+            if isinstance(statement, Rule):
+                for atom in (statement.head, *statement.body):
+                    if arities.setdefault(atom.relation, atom.arity) != atom.arity and atom.relation in relations:
+                        raise ValueError(
+                            f"atom {atom.relation} of a rule does not match the arity {arities[atom.relation]} "
+                            f"of its facts"
+                        )
+                rules.append(statement)
+                heads.add(statement.head.relation)
+                if statement.head.relation in relations:
+                    derive(statement.head.relation)
+                continue
+            relation, row = statement
+            if arities.setdefault(relation, len(row)) != len(row):
+                raise ValueError(f"fact {relation}{row} does not match the arity {arities[relation]} of '{relation}'")
+            if relation in heads:
+                if not cached:
+                    derived_facts.append(_fact_rule(statement))
+                continue
+            if relation not in relations:
+                relations[relation] = edb_factory(relation, len(row))
+                batches.enter_context(relations[relation].batch())
+                watermarks[relation] = relations[relation].watermark()
+            rows = pending.setdefault(relation, [])
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                flush(relation)
+        for relation in list(pending):
+            flush(relation)
+
+    if program is None:
+        program = Program(tuple(rules) + tuple(derived_facts))
+        if cache is not None and key is not None:
+            cache.store_program(key, program)
+    # relations only given by facts are part of the plan even if no rule reads them
+    edb_relations = {relation: arities[relation] for relation in relations}
+    return RulesPlan(program, idb_storage, edb_storage, edb_relations=edb_relations, **options)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from .nodes import Program
+from .printer import print_program
+from .symbols import Value
+
+# bumped whenever what a saved state means changes
+_STATE_FORMAT = 2
+
+
+def fingerprint(program: Program, interned: bool) -> str:
+    # identifies the derived tuples a program produces: its rules and facts,
+    # and whether relations hold symbol ids
+    digest = hashlib.sha256(f"pydatalog-state-{_STATE_FORMAT}\n{'interned' if interned else 'text'}\n".encode())
+    digest.update(print_program(program).encode())
+    return digest.hexdigest()
+
+
+def _row_hash(row: Tuple[Value, ...]) -> int:
+    return int.from_bytes(hashlib.sha256(repr(row).encode()).digest()[:16], "big")
+
+
+def content_digest(rows: Iterable[Tuple[Value, ...]]) -> str:
+    # the same for the same set of rows, whatever order they are read in
+    return f"{sum(_row_hash(row) for row in rows) % (1 << 128):032x}"
+
+
+def update_digest(digest: str, rows: Iterable[Tuple[Value, ...]], removed: bool = False) -> str:
+    # the digest of a relation after `rows`, none of them stored before (or all
+    # of them, when removed), were added to it or removed from it
+    change = sum(_row_hash(row) for row in rows)
+    total = int(digest, 16) + (-change if removed else change)
+    return f"{total % (1 << 128):032x}"
+
+
+"""
+RelationMark is what is remembered of a base relation when the derived
+relations were last complete: its watermark, its cardinality, and either the
+number of rows deleted or updated in it so far (`changes`, counted by
+triggers, for relations in the state's database) or a digest of its content
+(for relations stored anywhere else). A tracked relation whose changes are
+unchanged, and whose cardinality is the remembered one plus the number of
+tuples stored after the watermark, has only been appended to since.
+"""
+@dataclass(frozen=True, slots=True)
+class RelationMark:
+    watermark: int
+    cardinality: int
+    changes: Optional[int] = None
+    digest: Optional[str] = None
+
+
+"""
+Snapshot is a saved plan state: the fingerprint of the program, the derived
+relations that are complete, and the marks of the base relations they are
+complete for.
+"""
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    fingerprint: str
+    complete: FrozenSet[str]
+    marks: Dict[str, RelationMark]
+
+
+"""
+PlanState keeps the state of a RulesPlan in the sqlite3 database holding its
+derived relations, in the `pydatalog_state` and `pydatalog_relations` tables,
+so a plan created over the same database after a restart knows whether the
+derived relations are still complete: RulesPlan(..., state=PlanState(conn)).
+Like SymbolTable, writes are committed with the caller's next commit, which
+makes them atomic with the derived tuples they describe.
+
+Deletions and updates of the base relations in the same database are counted
+in `pydatalog_changes` by triggers installed on first use, so they are noticed
+whoever makes them, even when an insert reuses the rowid of a deleted tuple.
+"""
+class PlanState:
+    connection: sqlite3.Connection
+    _tracked: Set[str]
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.connection = conn
+        self._tracked = set()
+        conn.execute('CREATE TABLE IF NOT EXISTS pydatalog_state (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pydatalog_relations (
+                relation TEXT PRIMARY KEY, complete INTEGER, watermark INTEGER, cardinality INTEGER,
+                changes INTEGER, digest TEXT
+            )
+        ''')
+        # states saved by earlier versions lack the newer columns
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(pydatalog_relations)')}
+        for column, column_type in (('changes', 'INTEGER'), ('digest', 'TEXT')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE pydatalog_relations ADD COLUMN {column} {column_type}')
+        conn.execute('CREATE TABLE IF NOT EXISTS pydatalog_changes (relation TEXT PRIMARY KEY, changes INTEGER)')
+        conn.commit()
+
+    def changes(self, relation: str) -> int:
+        # the rows deleted or updated in a table of this database since it is tracked
+        if relation not in self._tracked:
+            for event in ('DELETE', 'UPDATE'):
+                self.connection.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS pydatalog_{relation}_{event.lower()} AFTER {event} ON {relation}
+                    BEGIN
+                        INSERT INTO pydatalog_changes VALUES ('{relation}', 1)
+                        ON CONFLICT (relation) DO UPDATE SET changes = changes + 1;
+                    END
+                ''')
+            self._tracked.add(relation)
+        row = self.connection.execute('SELECT changes FROM pydatalog_changes WHERE relation = ?', (relation,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def load(self) -> Optional[Snapshot]:
+        row = self.connection.execute("SELECT value FROM pydatalog_state WHERE key = 'fingerprint'").fetchone()
+        if row is None:
+            return None
+        complete = set()
+        marks: Dict[str, RelationMark] = {}
+        rows = self.connection.execute(
+            'SELECT relation, complete, watermark, cardinality, changes, digest FROM pydatalog_relations'
+        )
+        for relation, done, watermark, cardinality, changes, digest in rows:
+            if watermark is not None:
+                marks[relation] = RelationMark(watermark, cardinality, changes, digest)
+            elif done:
+                complete.add(relation)
+        return Snapshot(row[0], frozenset(complete), marks)
+
+    def save(self, fingerprint: str, complete: Iterable[str], marks: Dict[str, RelationMark]) -> Snapshot:
+        # replaces the saved state
+        self.clear()
+        self.connection.execute("INSERT INTO pydatalog_state VALUES ('fingerprint', ?)", (fingerprint,))
+        complete = frozenset(complete)
+        self.connection.executemany(
+            'INSERT INTO pydatalog_relations VALUES (?, 1, NULL, NULL, NULL, NULL)',
+            [(relation,) for relation in sorted(complete)],
+        )
+        self.connection.executemany(
+            'INSERT INTO pydatalog_relations VALUES (?, 1, ?, ?, ?, ?)',
+            [
+                (relation, mark.watermark, mark.cardinality, mark.changes, mark.digest)
+                for relation, mark in sorted(marks.items())
+            ],
+        )
+        return Snapshot(fingerprint, complete, dict(marks))
+
+    def invalidate(self, relations: Iterable[str]) -> None:
+        # derived relations about to be rewritten are no longer complete
+        self.connection.executemany(
+            'UPDATE pydatalog_relations SET complete = 0 WHERE relation = ? AND watermark IS NULL',
+            [(relation,) for relation in relations],
+        )
+
+    def clear(self) -> None:
+        self.connection.execute('DELETE FROM pydatalog_state')
+        self.connection.execute('DELETE FROM pydatalog_relations')
@@ -0,0 +1,113 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .analysis import Adornment, binding_patterns
+from .seminaive import _AtomSpec, _Const
+
+"""
+RelationStats summarises a relation for the join planner: its cardinality
+and the number of distinct values in each column.
+"""
+@dataclass(frozen=True, slots=True)
+class RelationStats:
+    cardinality: int
+    distinct: Tuple[int, ...]
+
+
+"""
+JoinPlan is the chosen join order for one rule. delta_idx is the body
+position driving the join (the delta relation in semi-naive evaluation, the
+triggering tuple in tuple-at-a-time evaluation) or None for a full evaluation.
+patterns and estimates are given per position of order.
+"""
+@dataclass(frozen=True, slots=True)
+class JoinPlan:
+    head_relation: str
+    rule_idx: int
+    delta_idx: Optional[int]
+    order: Tuple[int, ...]
+    patterns: Tuple[Adornment, ...]
+    estimates: Tuple[float, ...]
+
+
+def estimate(stats: RelationStats, pattern: Adornment) -> float:
+    rows = float(stats.cardinality)
+    for col in pattern:
+        rows /= max(stats.distinct[col], 1)
+    return rows
+
+
+def _pattern(atom: _AtomSpec, bound: Set[int]) -> Adornment:
+    return tuple(col for col, column in enumerate(atom.columns) if isinstance(column, _Const) or column in bound)
+
+
+def _known(stats: Dict[str, RelationStats], body: Sequence[_AtomSpec]) -> Dict[str, RelationStats]:
+    # relations without statistics (typically IDB relations not derived yet) are
+    # assumed to be as large as the largest known relation, with unique values
+    largest = max((s.cardinality for s in stats.values()), default=1) or 1
+    known = dict(stats)
+    for atom in body:
+        s = known.get(atom.relation)
+        if s is None or s.cardinality == 0:
+            known[atom.relation] = RelationStats(largest, (largest,) * len(atom.columns))
+    return known
+
+
+def order_body(
+    body: Sequence[_AtomSpec],
+    stats: Dict[str, RelationStats],
+    first: Optional[int] = None,
+) -> Tuple[int, ...]:
+    known = _known(stats, body)
+    order: List[int] = []
+    bound: Set[int] = set()
+    if first is not None:
+        order.append(first)
+        bound.update(c for c in body[first].columns if isinstance(c, int))
+    remaining = [i for i in range(len(body)) if i != first and not body[i].negated]
+    while remaining:
+        # greedily join the atom expected to produce the fewest rows per binding
+        best = min(remaining, key=lambda i: (estimate(known[body[i].relation], _pattern(body[i], bound)), i))
+        remaining.remove(best)
+        order.append(best)
+        bound.update(c for c in body[best].columns if isinstance(c, int))
+    # negated atoms only filter, so they go last with every variable bound
+    order.extend(i for i in range(len(body)) if i != first and body[i].negated)
+    return tuple(order)
+
+
+def plan_body(
+    head_relation: str,
+    rule_idx: int,
+    body: Sequence[_AtomSpec],
+    stats: Dict[str, RelationStats],
+    first: Optional[int] = None,
+) -> JoinPlan:
+    known = _known(stats, body)
+    return plan_order(head_relation, rule_idx, body, known, order_body(body, known, first), first)
+
+
+def source_order(body: Sequence[_AtomSpec], first: Optional[int] = None) -> Tuple[int, ...]:
+    # the order joins take without planning: source order, negated atoms last
+    rest = sorted((i for i in range(len(body)) if i != first), key=lambda i: body[i].negated)
+    return ((first,) if first is not None else ()) + tuple(rest)
+
+
+def plan_order(
+    head_relation: str,
+    rule_idx: int,
+    body: Sequence[_AtomSpec],
+    stats: Dict[str, RelationStats],
+    order: Sequence[int],
+    first: Optional[int] = None,
+) -> JoinPlan:
+    # the JoinPlan of a given order, with its binding patterns and estimates
+    known = _known(stats, body)
+    order = tuple(order)
+    rest = order if first is None else order[1:]
+    bound = [] if first is None else [c for c in body[first].columns if isinstance(c, int)]
+    patterns = [] if first is None else [_pattern(body[first], set())]
+    patterns.extend(pattern for _, pattern in binding_patterns(body, rest, bound))
+    estimates = tuple(estimate(known[body[i].relation], p) for i, p in zip(order, patterns))
+    return JoinPlan(head_relation, rule_idx, first, order, tuple(patterns), estimates)
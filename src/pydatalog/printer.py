@@ -1,6 +1,11 @@
 from __future__ import annotations
+import json
+import re
 
-from .nodes import Program, Rule, Atom, Term, Variable, Constant
+from .nodes import Program, Rule, Atom, Term, Variable, Constant, Aggregate
+
+# constants printed as they are: lowercase identifiers and numbers
+_BARE = re.compile(r"[a-z0-9][A-Za-z0-9_]*|-?[0-9]+(?:\.[0-9]+)?")
 
 
 def print_program(p: Program) -> str:
@@ -16,10 +21,11 @@ def print_rule(r: Rule) -> str:
 
 
 def print_atom(a: Atom) -> str:
+    prefix = "not " if a.negated else ""
     if a.terms:
         args = ", ".join(print_term(t) for t in a.terms)
-        return f"{a.relation}({args})"
-    return a.relation
+        return f"{prefix}{a.relation}({args})"
+    return f"{prefix}{a.relation}"
 
 
 def print_term(t: Term) -> str:
@@ -27,5 +33,8 @@ def print_term(t: Term) -> str:
         case Variable():
             return t.name
         case Constant():
-            return t.value
+            # constants that would read back as something else are quoted
+            return t.value if _BARE.fullmatch(t.value) else json.dumps(t.value, ensure_ascii=False)
+        case Aggregate():
+            return f"{t.function}({t.variable.name})"
 
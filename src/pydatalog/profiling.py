@@ -0,0 +1,217 @@
+from __future__ import annotations
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, TypeVar
+
+from .symbols import Value
+
+Row = Tuple[Value, ...]
+T = TypeVar("T")
+
+"""
+RuleProfile counts the work done for one rule: evaluations of its body
+(firings; one per driving tuple in the tuple strategy, one per delta
+position and iteration set-at-a-time), probes into a body relation, head
+tuples produced and, of those, the duplicates that were already stored or
+already produced in the same round.
+"""
+@dataclass(slots=True)
+class RuleProfile:
+    firings: int = 0
+    probes: int = 0
+    produced: int = 0
+    duplicates: int = 0
+
+
+"""
+RelationProfile counts the reads (load and select calls, rows read) and
+writes (store, store_many and delete_many calls, rows added and removed) of
+one relation, with the seconds spent in each. Reading time is the time spent
+producing rows, not the time the caller spends consuming them.
+"""
+@dataclass(slots=True)
+class RelationProfile:
+    loads: int = 0
+    rows_loaded: int = 0
+    load_seconds: float = 0.0
+    stores: int = 0
+    rows_stored: int = 0
+    rows_deleted: int = 0
+    store_seconds: float = 0.0
+
+
+"""
+Iteration is one round of a fixpoint computation: the number of new tuples
+of every relation that grew in that round. Rounds are numbered from 0 in the
+order they ran, across strata and incremental updates.
+"""
+@dataclass(frozen=True, slots=True)
+class Iteration:
+    index: int
+    delta: Dict[str, int]
+
+
+"""
+ProfileStats is a snapshot of a Profiler: counters per rule index and per
+relation, and every fixpoint iteration recorded so far.
+"""
+@dataclass(frozen=True, slots=True)
+class ProfileStats:
+    rules: Dict[int, RuleProfile]
+    relations: Dict[str, RelationProfile]
+    iterations: List[Iteration] = field(default_factory=list)
+
+
+LoadHook = Callable[[str, int, float], None]
+StoreHook = Callable[[str, int, int, float], None]
+IterationHook = Callable[[Iteration], None]
+
+
+"""
+Profiler collects the counters of a RulesPlan created with
+RulesPlan(..., profiler=Profiler()). Without a profiler nothing is counted:
+storage methods are not wrapped and the rule engines skip every counter.
+
+Hooks are called as events happen, e.g. to feed a metrics pipeline:
+on_load(relation, rows, seconds) once a read is exhausted or abandoned,
+on_store(relation, added, deleted, seconds) after every write and
+on_iteration(iteration) after every fixpoint round.
+"""
+class Profiler:
+    rules: Dict[int, RuleProfile]
+    relations: Dict[str, RelationProfile]
+    iterations: List[Iteration]
+
+    def __init__(
+        self,
+        on_load: Optional[LoadHook] = None,
+        on_store: Optional[StoreHook] = None,
+        on_iteration: Optional[IterationHook] = None,
+    ) -> None:
+        self.rules = {}
+        self.relations = {}
+        self.iterations = []
+        self._on_load = on_load
+        self._on_store = on_store
+        self._on_iteration = on_iteration
+
+    def rule(self, rule_idx: int) -> RuleProfile:
+        profile = self.rules.get(rule_idx)
+        if profile is None:
+            profile = self.rules[rule_idx] = RuleProfile()
+        return profile
+
+    def relation(self, relation: str) -> RelationProfile:
+        profile = self.relations.get(relation)
+        if profile is None:
+            profile = self.relations[relation] = RelationProfile()
+        return profile
+
+    def produced(self, rule_idx: int, rows: Collection[Row], *existing: Collection[Row]) -> None:
+        # rows derived by one evaluation of a rule; those in any of `existing`
+        # are duplicates
+        profile = self.rule(rule_idx)
+        profile.firings += 1
+        profile.produced += len(rows)
+        profile.duplicates += sum(1 for row in rows if any(row in seen for seen in existing))
+
+    def iteration(self, delta: Mapping[str, int]) -> None:
+        # the number of new tuples per relation in one fixpoint round
+        iteration = Iteration(len(self.iterations), {relation: size for relation, size in delta.items() if size})
+        self.iterations.append(iteration)
+        if self._on_iteration is not None:
+            self._on_iteration(iteration)
+
+    def loaded(self, relation: str, rows: int, seconds: float) -> None:
+        profile = self.relation(relation)
+        profile.rows_loaded += rows
+        profile.load_seconds += seconds
+        if self._on_load is not None:
+            self._on_load(relation, rows, seconds)
+
+    def stored(self, relation: str, added: int, deleted: int, seconds: float) -> None:
+        profile = self.relation(relation)
+        profile.stores += 1
+        profile.rows_stored += added
+        profile.rows_deleted += deleted
+        profile.store_seconds += seconds
+        if self._on_store is not None:
+            self._on_store(relation, added, deleted, seconds)
+
+    def stats(self) -> ProfileStats:
+        return ProfileStats(
+            {rule_idx: replace(profile) for rule_idx, profile in self.rules.items()},
+            {relation: replace(profile) for relation, profile in self.relations.items()},
+            list(self.iterations),
+        )
+
+    def reset(self) -> None:
+        self.rules.clear()
+        self.relations.clear()
+        self.iterations.clear()
+
+
+def instrumented(factory: Callable[[str, int], T], profiler: Profiler) -> Callable[[str, int], T]:
+    # a storage factory whose relations are instrumented
+    return lambda relation, arity: instrument(factory(relation, arity), profiler)
+
+
+def instrument(storage: T, profiler: Profiler) -> T:
+    # Wraps the reads and writes of one storage object, in place, so the
+    # object keeps its type (the sql strategy checks for Db). A write made by
+    # another write of the same object (store_many calling store) counts once.
+    relation: str = storage.relation  # type: ignore[attr-defined]
+    profiler.relation(relation)
+    for name in ("load", "select"):
+        setattr(storage, name, _reader(getattr(storage, name), relation, profiler))
+    writing = [0]
+    for name, deleting in (("store", False), ("store_many", False), ("delete_many", True)):
+        setattr(storage, name, _writer(getattr(storage, name), relation, profiler, deleting, writing))
+    return storage
+
+
+def _reader(method: Callable[..., Iterable[Row]], relation: str, profiler: Profiler) -> Callable[..., Iterator[Row]]:
+    def read(*args, **kwargs) -> Iterator[Row]:
+        profiler.relation(relation).loads += 1
+        return _timed(method(*args, **kwargs), relation, profiler)
+    return read
+
+
+def _timed(rows: Iterable[Row], relation: str, profiler: Profiler) -> Iterator[Row]:
+    count = 0
+    elapsed = 0.0
+    iterator = iter(rows)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                return
+            elapsed += time.perf_counter() - started
+            count += 1
+            yield row
+    finally:
+        profiler.loaded(relation, count, elapsed)
+
+
+def _writer(
+    method: Callable[..., object],
+    relation: str,
+    profiler: Profiler,
+    deleting: bool,
+    writing: List[int],
+) -> Callable[..., object]:
+    def write(*args, **kwargs):
+        writing[0] += 1
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            writing[0] -= 1
+        if writing[0] == 0:
+            changed = int(result)  # type: ignore[call-overload]
+            profiler.stored(relation, 0 if deleting else changed, changed if deleting else 0, time.perf_counter() - started)
+        return result
+    return write
@@ -0,0 +1,487 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import aggregates
+from .symbols import Value
+
+if TYPE_CHECKING:
+    from .analysis import Stratum
+    from .execution import _RuleBodyPlan, _RuleHeadPlan
+    from .profiling import Profiler, RuleProfile
+
+Row = Tuple[Value, ...]
+Binding = Tuple[Optional[Value], ...]
+
+"""
+Const is a constant column of a compiled rule. It holds the value as stored:
+the string itself, or its symbol id when the plan interns values.
+"""
+@dataclass(frozen=True, slots=True)
+class _Const:
+    value: Value
+
+
+"""
+AtomSpec describes one body atom of a compiled rule: every column is either a
+constant (_Const) or a canonical variable slot (int), as in _RuleBodyPlan._mapping_from_idx.
+A negated atom never binds a slot; it filters out bindings whose ground tuple
+is present in its relation.
+"""
+@dataclass(frozen=True, slots=True)
+class _AtomSpec:
+    relation: str
+    columns: Tuple[int | _Const, ...]
+    negated: bool = False
+
+
+"""
+RuleSpec is the set-at-a-time view of a _RuleBodyPlan. aggregates lists the
+(head position, function) pairs of an aggregating rule; the head column at
+such a position is the slot of the aggregated variable.
+"""
+@dataclass(frozen=True, slots=True)
+class _RuleSpec:
+    head_relation: str
+    head_columns: Tuple[int | _Const, ...]
+    body: Tuple[_AtomSpec, ...]
+    slots: int
+    aggregates: Tuple[Tuple[int, str], ...] = ()
+
+
+def _body_specs(body_plan: _RuleBodyPlan) -> Tuple[_AtomSpec, ...]:
+    return tuple(
+        _AtomSpec(
+            atom._storage.relation,
+            tuple(body_plan._mapping_from_idx[(atom_idx, col)] for col in range(atom._storage.arity)),
+            atom_idx in body_plan._negated,
+        )
+        for atom_idx, atom in enumerate(body_plan._lower)
+    )
+
+
+def _rule_spec(body_plan: _RuleBodyPlan) -> _RuleSpec:
+    body = _body_specs(body_plan)
+    slots = body_plan._upper._storage.arity
+    bound: Set[int] = set()
+    for atom in body:
+        if atom.negated:
+            continue
+        for c in atom.columns:
+            if isinstance(c, int):
+                bound.add(c)
+                slots = max(slots, c + 1)
+    head_columns: List[int | _Const] = []
+    for k in range(body_plan._upper._storage.arity):
+        if k in body_plan._head_spec:
+            head_columns.append(_Const(body_plan._head_spec[k]))
+        elif k in bound:
+            head_columns.append(k)
+        else:
+            raise ValueError(
+                f"head position {k} of relation '{body_plan._upper._storage.relation}' is not bound by the rule body"
+            )
+    return _RuleSpec(
+        body_plan._upper._storage.relation,
+        tuple(head_columns),
+        body,
+        slots,
+        tuple(sorted(body_plan._aggregates.items())),
+    )
+
+
+"""
+RelationIndex holds the full contents of a relation in memory together with
+hash indexes keyed by the columns a join probes it on.
+"""
+class _RelationIndex:
+    rows: Set[Row]
+    _indexes: Dict[Tuple[int, ...], Dict[Row, Dict[Row, None]]]
+
+    def __init__(self, rows: Iterable[Row] = ()) -> None:
+        self.rows = set(rows)
+        self._indexes = {}
+
+    def add(self, rows: Iterable[Row]) -> Set[Row]:
+        added = {row for row in rows if row not in self.rows}
+        if not added:
+            return added
+        self.rows |= added
+        for key_cols, index in self._indexes.items():
+            for row in added:
+                index.setdefault(tuple(row[c] for c in key_cols), {})[row] = None
+        return added
+
+    def remove(self, rows: Iterable[Row]) -> Set[Row]:
+        removed = {row for row in rows if row in self.rows}
+        if not removed:
+            return removed
+        self.rows -= removed
+        for key_cols, index in self._indexes.items():
+            for row in removed:
+                key = tuple(row[c] for c in key_cols)
+                del index[key][row]
+                if not index[key]:
+                    del index[key]
+        return removed
+
+    def lookup(self, key_cols: Tuple[int, ...], key: Row) -> Iterable[Row]:
+        index = self._indexes.get(key_cols)
+        if index is None:
+            index = {}
+            for row in self.rows:
+                index.setdefault(tuple(row[c] for c in key_cols), {})[row] = None
+            self._indexes[key_cols] = index
+        return index.get(key, ())
+
+
+def _unify(atom: _AtomSpec, row: Row, binding: Binding) -> Optional[Binding]:
+    result = list(binding)
+    for value, column in zip(row, atom.columns):
+        match column:
+            case _Const(value=const_val):
+                if value != const_val:
+                    return None
+            case int() as slot:
+                bound = result[slot]
+                if bound is None:
+                    result[slot] = value
+                elif bound != value:
+                    return None
+    return tuple(result)
+
+
+def _join(
+    spec: _RuleSpec,
+    order: Iterable[int],
+    bindings: Iterable[Binding],
+    relations: Dict[str, _RelationIndex],
+    bound: Set[int],
+    profile: Optional[RuleProfile] = None,
+) -> List[Binding]:
+    current = list(bindings)
+    bound = set(bound)
+    # negated atoms are checked once every slot they mention is bound
+    for atom_idx in sorted(order, key=lambda i: spec.body[i].negated):
+        if not current:
+            break
+        atom = spec.body[atom_idx]
+        if atom.negated:
+            rows = relations[atom.relation].rows
+            current = [b for b in current if _ground(atom, b) not in rows]
+            continue
+        key_cols: List[int] = []
+        key_terms: List[int | _Const] = []
+        for col, column in enumerate(atom.columns):
+            if isinstance(column, _Const) or column in bound:
+                key_cols.append(col)
+                key_terms.append(column)
+        relation = relations[atom.relation]
+        key_cols_t = tuple(key_cols)
+        if profile is not None:
+            profile.probes += len(current)
+        extended: List[Binding] = []
+        for binding in current:
+            key = tuple(t.value if isinstance(t, _Const) else binding[t] for t in key_terms)
+            for row in relation.lookup(key_cols_t, key):  # type: ignore[arg-type]
+                unified = _unify(atom, row, binding)
+                if unified is not None:
+                    extended.append(unified)
+        current = extended
+        bound.update(c for c in atom.columns if isinstance(c, int))
+    return current
+
+
+def _ground(atom: _AtomSpec, binding: Binding) -> Row:
+    return tuple(c.value if isinstance(c, _Const) else binding[c] for c in atom.columns)  # type: ignore[misc]
+
+
+def _unify_head(spec: _RuleSpec, row: Row) -> Optional[Binding]:
+    return _unify(_AtomSpec(spec.head_relation, spec.head_columns), row, (None,) * spec.slots)
+
+
+def _project(spec: _RuleSpec, binding: Binding) -> Row:
+    return _ground(_AtomSpec(spec.head_relation, spec.head_columns), binding)
+
+
+def _aggregate(parts: Iterable[Tuple[_RuleSpec, Iterable[Binding]]]) -> Set[Row]:
+    # One row per group of the non-aggregate head columns, aggregating over the
+    # distinct bindings of every rule body in `parts`.
+    groups: Dict[Row, List[List[Value]]] = {}
+    functions: Dict[int, str] = {}
+    arity = 0
+    for spec, bindings in parts:
+        functions = dict(spec.aggregates)
+        arity = len(spec.head_columns)
+        for binding in set(bindings):
+            row = _project(spec, binding)
+            key = tuple(value for k, value in enumerate(row) if k not in functions)
+            values = groups.get(key)
+            if values is None:
+                values = groups[key] = [[] for _ in functions]
+            for collected, k in zip(values, functions):
+                collected.append(row[k])
+    rows: Set[Row] = set()
+    for key, values in groups.items():
+        grouped = iter(key)
+        results = iter(aggregates.aggregate(f, collected) for f, collected in zip(functions.values(), values))
+        rows.add(tuple(next(results) if k in functions else next(grouped) for k in range(arity)))
+    return rows
+
+
+Orders = Dict[Tuple[int, Optional[int]], Tuple[int, ...]]
+
+
+def _evaluate_full(
+    rule_idx: int,
+    spec: _RuleSpec,
+    orders: Orders,
+    relations: Dict[str, _RelationIndex],
+    profile: Optional[RuleProfile] = None,
+) -> Set[Row]:
+    order = orders.get((rule_idx, None), range(len(spec.body)))
+    bindings = _join(spec, order, [(None,) * spec.slots], relations, set(), profile)
+    return {_project(spec, b) for b in bindings}
+
+
+def _delta_seeds(spec: _RuleSpec, delta_idx: int, rows: Iterable[Row]) -> List[Binding]:
+    empty: Binding = (None,) * spec.slots
+    return [b for b in (_unify(spec.body[delta_idx], row, empty) for row in rows) if b is not None]
+
+
+def _delta_order(rule_idx: int, spec: _RuleSpec, orders: Orders, delta_idx: int) -> List[int]:
+    planned = orders.get((rule_idx, delta_idx))
+    return list(planned[1:]) if planned else [i for i in range(len(spec.body)) if i != delta_idx]
+
+
+def _evaluate_delta(
+    rule_idx: int,
+    spec: _RuleSpec,
+    orders: Orders,
+    relations: Dict[str, _RelationIndex],
+    delta: Dict[str, Set[Row]],
+    profile: Optional[RuleProfile] = None,
+) -> Iterator[Set[Row]]:
+    for delta_idx, atom in enumerate(spec.body):
+        delta_rows = delta.get(atom.relation)
+        if not delta_rows or atom.negated:
+            continue
+        seeds = _delta_seeds(spec, delta_idx, delta_rows)
+        bound = {c for c in atom.columns if isinstance(c, int)}
+        bindings = _join(spec, _delta_order(rule_idx, spec, orders, delta_idx), seeds, relations, bound, profile)
+        yield {_project(spec, b) for b in bindings}
+
+
+"""
+SemiNaiveEvaluator computes the fixpoint of a RulesPlan set-at-a-time: every
+iteration evaluates each rule once per body position holding a delta relation,
+joining that delta against the full relations of the other positions. Join
+orders come from the planner, keyed by (rule index, delta position) with None
+for the naive first iteration; rules without a planned order use source order.
+
+Rules are evaluated stratum by stratum, so a negated relation is complete
+before any rule reads it. Non-recursive strata take a single pass; only
+recursive strata iterate to a fixpoint.
+
+Aggregating rules are evaluated over all bindings of their bodies at once.
+Relations aggregating only with min/max keep one tuple per group: a derived
+tuple is merged into its group's tuple and replaces it when that improves
+it, so they can be computed through recursion.
+
+After run() the evaluator keeps its in-memory relations, so insert() and
+retract() maintain the derived relations incrementally. Retraction uses DRed:
+over-delete everything derivable from the removed tuples, then re-derive the
+over-deleted tuples that still have a derivation and propagate them.
+
+Given a Profiler, every rule evaluation records its probes, the tuples it
+produced and how many of them were duplicates, and every round of new
+tuples is recorded as a fixpoint iteration.
+"""
+class SemiNaiveEvaluator:
+    _heads: Dict[str, _RuleHeadPlan]
+    _rules: List[Tuple[int, _RuleSpec]]
+    _orders: Orders
+    _relations: Dict[str, _RelationIndex]
+    _strata: Optional[List[Stratum]]
+    # min/max relation -> (group columns, aggregates)
+    _lattices: Dict[str, Tuple[Tuple[int, ...], Tuple[Tuple[int, str], ...]]]
+    _profiler: Optional[Profiler]
+
+    def __init__(
+        self,
+        heads: Dict[str, _RuleHeadPlan],
+        orders: Optional[Orders] = None,
+        strata: Optional[List[Stratum]] = None,
+        profiler: Optional[Profiler] = None,
+    ) -> None:
+        self._heads = heads
+        self._rules = [(body._rule_idx, _rule_spec(body)) for head in heads.values() for body in head._lower]
+        self._orders = orders or {}
+        self._relations = {}
+        self._strata = strata
+        self._lattices = {}
+        self._profiler = profiler
+        for _, spec in self._rules:
+            if spec.aggregates and all(f in aggregates.LATTICE for _, f in spec.aggregates):
+                positions = dict(spec.aggregates)
+                group = tuple(k for k in range(len(spec.head_columns)) if k not in positions)
+                self._lattices[spec.head_relation] = (group, spec.aggregates)
+
+    def load(self) -> None:
+        for relation, head_plan in self._heads.items():
+            self._relations[relation] = _RelationIndex(head_plan._storage.load())
+
+    def run(self) -> None:
+        self.load()
+        if self._strata is None:
+            self._evaluate_stratum(self._rules, True)
+            return
+        for stratum in self._strata:
+            self._evaluate_stratum(self._stratum_rules(stratum), stratum.recursive)
+
+    def _stratum_rules(self, stratum: Stratum) -> List[Tuple[int, _RuleSpec]]:
+        return [(rule_idx, spec) for rule_idx, spec in self._rules if spec.head_relation in stratum.relations]
+
+    def _evaluate_stratum(self, rules: List[Tuple[int, _RuleSpec]], recursive: bool) -> None:
+        # The first iteration is naive: every rule sees the full relations.
+        derived: Dict[str, Set[Row]] = {}
+        aggregating: Dict[str, List[Tuple[_RuleSpec, List[Binding]]]] = {}
+        for rule_idx, spec in rules:
+            if spec.aggregates:
+                order = self._orders.get((rule_idx, None), range(len(spec.body)))
+                bindings = _join(spec, order, [(None,) * spec.slots], self._relations, set(), self._profile(rule_idx))
+                aggregating.setdefault(spec.head_relation, []).append((spec, bindings))
+                continue
+            rows = _evaluate_full(rule_idx, spec, self._orders, self._relations, self._profile(rule_idx))
+            self._collect(derived, rule_idx, spec, rows)
+        for relation, parts in aggregating.items():
+            derived[relation] = _aggregate(parts)
+        delta = self._store(derived)
+        self._iteration(delta)
+        if recursive:
+            self._fixpoint(delta, rules)
+
+    def observe(self, stored: Dict[str, Iterable[Row]]) -> None:
+        # tuples stored by someone else that already agree with the rules
+        for relation, rows in stored.items():
+            self._relations[relation].add(rows)
+
+    def insert(self, relation: str, rows: Iterable[Row]) -> int:
+        delta = self._store({relation: set(rows)})
+        self._iteration(delta)
+        self._fixpoint(delta)
+        return len(delta.get(relation, ()))
+
+    def catch_up(self, appended: Dict[str, List[Row]]) -> None:
+        # propagates tuples already stored, but not yet seen by the rules, as
+        # if they had just been inserted
+        for relation, rows in appended.items():
+            self._relations[relation].remove(rows)
+        delta = self._store({relation: set(rows) for relation, rows in appended.items()})
+        self._iteration(delta)
+        self._fixpoint(delta)
+
+    def retract(self, relation: str, rows: Iterable[Row], facts: Set[Tuple[str, Row]]) -> int:
+        removed = {row for row in rows if row in self._relations[relation].rows}
+        if not removed:
+            return 0
+        # over-delete: everything with a derivation using a removed tuple
+        over_deleted: Dict[str, Set[Row]] = {relation: set(removed)}
+        delta: Dict[str, Set[Row]] = {relation: set(removed)}
+        while delta:
+            derived: Dict[str, Set[Row]] = {}
+            for rule_idx, spec in self._rules:
+                for head_rows in _evaluate_delta(rule_idx, spec, self._orders, self._relations, delta):
+                    derived.setdefault(spec.head_relation, set()).update(head_rows)
+            delta = {}
+            for head_relation, head_rows in derived.items():
+                present = self._relations[head_relation].rows
+                seen = over_deleted.setdefault(head_relation, set())
+                new = {row for row in head_rows if row in present and row not in seen}
+                if new:
+                    seen |= new
+                    delta[head_relation] = new
+        for head_relation, head_rows in over_deleted.items():
+            self._relations[head_relation].remove(head_rows)
+            self._heads[head_relation]._storage.delete_many(head_rows)
+        # re-derive: over-deleted tuples that are facts or still have a derivation
+        rederived: Dict[str, Set[Row]] = {}
+        for head_relation, head_rows in over_deleted.items():
+            candidates = head_rows - removed if head_relation == relation else head_rows
+            for row in candidates:
+                if (head_relation, row) in facts or self._derivable(head_relation, row):
+                    rederived.setdefault(head_relation, set()).add(row)
+        self._fixpoint(self._store(rederived))
+        return len(removed - self._relations[relation].rows)
+
+    def _derivable(self, relation: str, row: Row) -> bool:
+        for rule_idx, spec in self._rules:
+            if spec.head_relation != relation:
+                continue
+            seed = _unify_head(spec, row)
+            if seed is None:
+                continue
+            bound = {c for c in spec.head_columns if isinstance(c, int)}
+            order = self._orders.get((rule_idx, None), range(len(spec.body)))
+            if _join(spec, order, [seed], self._relations, bound):
+                return True
+        return False
+
+    def _fixpoint(self, delta: Dict[str, Set[Row]], rules: Optional[List[Tuple[int, _RuleSpec]]] = None) -> None:
+        while delta:
+            derived: Dict[str, Set[Row]] = {}
+            for rule_idx, spec in self._rules if rules is None else rules:
+                for rows in _evaluate_delta(rule_idx, spec, self._orders, self._relations, delta, self._profile(rule_idx)):
+                    self._collect(derived, rule_idx, spec, rows)
+            delta = self._store(derived)
+            self._iteration(delta)
+
+    def _profile(self, rule_idx: int) -> Optional[RuleProfile]:
+        return self._profiler.rule(rule_idx) if self._profiler is not None else None
+
+    def _collect(self, derived: Dict[str, Set[Row]], rule_idx: int, spec: _RuleSpec, rows: Set[Row]) -> None:
+        pending = derived.setdefault(spec.head_relation, set())
+        if self._profiler is not None:
+            self._profiler.produced(rule_idx, rows, self._relations[spec.head_relation].rows, pending)
+        pending.update(rows)
+
+    def _iteration(self, delta: Dict[str, Set[Row]]) -> None:
+        if self._profiler is not None and delta:
+            self._profiler.iteration({relation: len(rows) for relation, rows in delta.items()})
+
+    def _store(self, derived: Dict[str, Set[Row]]) -> Dict[str, Set[Row]]:
+        delta: Dict[str, Set[Row]] = {}
+        for relation, rows in derived.items():
+            if relation in self._lattices:
+                rows = self._merge(relation, rows)
+            added = self._relations[relation].add(rows)
+            if not added:
+                continue
+            self._heads[relation]._storage.store_many(added)
+            delta[relation] = added
+        return delta
+
+    def _merge(self, relation: str, rows: Iterable[Row]) -> Set[Row]:
+        # Merges derived tuples into the tuple of their group, removing the
+        # tuples they improve on; returns the improved tuples to store.
+        group, functions = self._lattices[relation]
+        index = self._relations[relation]
+        best: Dict[Row, Row] = {}
+        for row in rows:
+            key = tuple(row[c] for c in group)
+            current = best.get(key)
+            if current is None:
+                current = next(iter(index.lookup(group, key)), None)
+            best[key] = row if current is None else aggregates.combine(functions, current, row)
+        replaced: Set[Row] = set()
+        improved: Set[Row] = set()
+        for key, row in best.items():
+            existing = list(index.lookup(group, key))
+            if existing == [row]:
+                continue
+            replaced.update(existing)
+            improved.add(row)
+        if replaced:
+            index.remove(replaced)
+            self._heads[relation]._storage.delete_many(replaced)
+        return improved
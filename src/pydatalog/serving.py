@@ -0,0 +1,141 @@
+from __future__ import annotations
+import sqlite3
+import threading
+from pathlib import Path as FilePath
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from . import db
+from . import memory
+from .symbols import Value
+
+if TYPE_CHECKING:
+    from .execution import RulesPlan
+
+Row = Tuple[Value, ...]
+Relation = Union[db.Db, memory.MemoryDb]
+
+
+def _database_file(conn: sqlite3.Connection) -> Optional[str]:
+    # the file of the main database, None for in-memory databases
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path or None
+    return None
+
+
+"""
+QueryServer answers queries of a frozen RulesPlan from any number of threads
+at once; create one with RulesPlan.serve(). Relations stored in a SQLite
+file are read through read-only connections, one per serving thread, with
+the database switched to WAL mode so readers never block each other or a
+writer. Every other relation (in memory, or in an in-memory database) is
+copied into an immutable snapshot when the server is created. The read path
+takes no lock and never writes: there is no subgoal table and no derivation.
+
+query() and count() take the arguments of RulesPlan.query and RulesPlan.count.
+Rows are read while the caller iterates, so an iterator is to be consumed by
+the thread that created it. close() closes the connections and unfreezes the
+plan; the server can also be used as a context manager.
+"""
+class QueryServer:
+    _plan: RulesPlan
+    _files: Dict[str, Tuple[str, int, str]]
+    _snapshots: Dict[str, memory.MemoryDb]
+    _local: threading.local
+    _connections: List[sqlite3.Connection]
+    _closed: bool
+
+    def __init__(self, plan: RulesPlan) -> None:
+        self._plan = plan
+        self._files = {}
+        self._snapshots = {}
+        self._local = threading.local()
+        self._connections = []
+        self._closed = False
+        store = memory.MemoryStore()
+        wal: Dict[int, sqlite3.Connection] = {}
+        for relation, head in plan._heads.items():
+            relation_storage = head._storage
+            path = _database_file(relation_storage._db_connection) if isinstance(relation_storage, db.Db) else None
+            if path is None:
+                snapshot = self._snapshots[relation] = memory.MemoryDb(store, relation, relation_storage.arity)
+                snapshot.store_many(relation_storage.load())
+                continue
+            assert isinstance(relation_storage, db.Db)
+            self._files[relation] = (path, relation_storage.arity, relation_storage.column_type)
+            wal[id(relation_storage._db_connection)] = relation_storage._db_connection
+        for conn in wal.values():
+            # journal_mode cannot change inside a transaction
+            conn.commit()
+            conn.execute("PRAGMA journal_mode=WAL")
+
+    def __enter__(self) -> QueryServer:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def query(
+        self,
+        relation: str,
+        *keys: Tuple[int, str],
+        columns: Optional[Sequence[int]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Tuple[str, ...]] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Tuple[str, ...]]:
+        relation_storage = self._relation(relation)
+        if relation_storage is None:
+            return
+        encoded = self._plan._encode_keys(keys)
+        if encoded is None:
+            return
+        after_row = self._plan._encode_after(relation, after)
+        yield from self._plan._decode(relation_storage.select(encoded, columns, distinct, limit, offset, after_row, batch_size))
+
+    def count(self, relation: str, *keys: Tuple[int, str], columns: Optional[Sequence[int]] = None) -> int:
+        relation_storage = self._relation(relation)
+        if relation_storage is None:
+            return 0
+        encoded = self._plan._encode_keys(keys)
+        if encoded is None:
+            return 0
+        return relation_storage.count(*encoded, columns=columns)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for conn in self._connections:
+            conn.close()
+        self._plan._frozen = False
+
+    def _relation(self, relation: str) -> Optional[Relation]:
+        if self._closed:
+            raise ValueError("the query server is closed")
+        snapshot = self._snapshots.get(relation)
+        if snapshot is not None:
+            return snapshot
+        if relation not in self._files:
+            return None
+        # every thread opens its own connection, and its own Db objects on it
+        readers: Optional[Dict[str, db.Db]] = getattr(self._local, "readers", None)
+        if readers is None:
+            readers = self._local.readers = {}
+            self._local.connections = {}
+        reader = readers.get(relation)
+        if reader is None:
+            path, arity, column_type = self._files[relation]
+            conn = self._local.connections.get(path)
+            if conn is None:
+                conn = self._local.connections[path] = self._connect(path)
+            reader = readers[relation] = db.Db(conn, relation, arity, column_type, create=False)
+        return reader
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        # opened read-only; close() may run on another thread than the reader
+        conn = sqlite3.connect(f"{FilePath(path).as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        self._connections.append(conn)
+        return conn
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import sqlite3
+from functools import partial
+from typing import Callable, ContextManager, Iterable, Iterator, Optional, Protocol, Sequence, Tuple, Union
+
+from . import db
+from . import memory
+from .planner import RelationStats
+from .symbols import Value
+
+Row = Tuple[Value, ...]
+
+"""
+Storage is the protocol every relation backend implements. RulesPlan only
+talks to relations through it, so backends can be mixed per plan (for
+example IDB relations in memory while EDB relations stay in SQLite).
+
+Rows hold strings, or symbol ids (see pydatalog.symbols) for the relations of
+an interned plan.
+
+select() is load() with the query options pushed down: projection onto
+`columns`, DISTINCT, and pages of `limit` rows after skipping `offset` rows
+or, for keyset pagination, after the row `after`. Pages are ordered by the
+selected columns. Rows are fetched `batch_size` at a time.
+
+Delta handling: watermark() returns a position in the relation's insertion
+order and load_since(mark) yields the tuples stored after that position.
+
+explain(columns) describes how a load() bound on `columns` is answered, in
+the words of SQLite's EXPLAIN QUERY PLAN (e.g. which index it searches).
+
+version() changes whenever tuples are stored into or deleted from the
+relation through any storage object of the same backend; plans use it to
+notice writes they did not make themselves.
+"""
+class Storage(Protocol):
+    relation: str
+    arity: int
+
+    def store(self, tuple_data: Row) -> bool: ...
+
+    def store_many(self, tuples: Iterable[Row]) -> int: ...
+
+    def delete_many(self, tuples: Iterable[Row]) -> int: ...
+
+    def load(self, *keys: Tuple[int, Value]) -> Iterator[Row]: ...
+
+    def select(
+        self,
+        keys: Sequence[Tuple[int, Value]] = (),
+        columns: Optional[Sequence[int]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        after: Optional[Row] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[Row]: ...
+
+    def count(self, *keys: Tuple[int, Value], columns: Optional[Sequence[int]] = None) -> int: ...
+
+    def ensure_index(self, columns: Iterable[int]) -> bool: ...
+
+    def explain(self, columns: Iterable[int]) -> str: ...
+
+    def statistics(self) -> RelationStats: ...
+
+    def batch(self) -> ContextManager[None]: ...
+
+    def watermark(self) -> int: ...
+
+    def load_since(self, watermark: int) -> Iterator[Row]: ...
+
+    def version(self) -> int: ...
+
+
+# A factory creates (or opens) the relation with the given name and arity.
+StorageFactory = Callable[[str, int], Storage]
+Backend = Union[sqlite3.Connection, memory.MemoryStore, StorageFactory]
+
+
+def factory(backend: Backend, interned: bool = False) -> StorageFactory:
+    # sqlite3.Connection is itself callable, so it has to be recognised first
+    if isinstance(backend, sqlite3.Connection):
+        return partial(db.Db, backend, column_type="INTEGER" if interned else "TEXT")
+    if isinstance(backend, memory.MemoryStore):
+        return partial(memory.MemoryDb, backend)
+    if callable(backend):
+        return backend
+    raise TypeError(f"unsupported storage backend {backend!r}")
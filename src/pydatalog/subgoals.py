@@ -0,0 +1,140 @@
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .symbols import Value
+
+Row = Tuple[Value, ...]
+# bound (column, value) pairs of a subgoal, ordered by column
+Keys = Tuple[Tuple[int, Value], ...]
+Subgoal = Tuple[str, Keys]
+
+"""
+SubgoalStats counts how a SubgoalTable was used: lookups that found a
+subgoal (hits) or not (misses), subgoals dropped to stay within the limits
+(evictions) or because a relation they depend on was written
+(invalidations), answers too large to be kept (oversized), the number of
+subgoals currently held and the answer rows they hold.
+"""
+@dataclass(frozen=True, slots=True)
+class SubgoalStats:
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    oversized: int
+    size: int
+    rows: int
+
+
+"""
+SubgoalTable remembers the subgoals of a plan: a relation with bound keys
+that was explored, and the complete answers of those that were queried.
+Entries are kept in least-recently-used order. Explored subgoals are never
+evicted while a propagation is running, as forgetting one could make it
+explore forever; trim() brings the table back within max_size subgoals and
+max_rows answer rows in all once it is done. Answers of more than
+max_answer_rows rows are not kept at all. A limit of None means no limit.
+"""
+class SubgoalTable:
+    max_size: Optional[int]
+    max_rows: Optional[int]
+    max_answer_rows: Optional[int]
+    _entries: OrderedDict[Subgoal, Optional[List[Row]]]
+    _by_relation: Dict[str, Set[Keys]]
+    _rows: int
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        max_rows: Optional[int] = None,
+        max_answer_rows: Optional[int] = None,
+    ) -> None:
+        for name, limit in (("max_size", max_size), ("max_rows", max_rows), ("max_answer_rows", max_answer_rows)):
+            if limit is not None and limit < 0:
+                raise ValueError(f"{name} must not be negative, got {limit}")
+        self.max_size = max_size
+        self.max_rows = max_rows
+        self.max_answer_rows = max_answer_rows
+        self._entries = OrderedDict()
+        self._by_relation = {}
+        self._rows = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._oversized = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def explore(self, relation: str, keys: Keys) -> bool:
+        # marks the subgoal explored, returning whether it already was
+        subgoal = (relation, keys)
+        if subgoal in self._entries:
+            self._entries.move_to_end(subgoal)
+            self._hits += 1
+            return True
+        self._misses += 1
+        self._entries[subgoal] = None
+        self._by_relation.setdefault(relation, set()).add(keys)
+        return False
+
+    def answers(self, relation: str, keys: Keys) -> Optional[List[Row]]:
+        subgoal = (relation, keys)
+        rows = self._entries.get(subgoal)
+        if rows is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(subgoal)
+        self._hits += 1
+        return rows
+
+    def complete(self, relation: str, keys: Keys, rows: List[Row]) -> bool:
+        # keeps the answers of the subgoal, returning whether they were small enough
+        if self.max_answer_rows is not None and len(rows) > self.max_answer_rows:
+            self._oversized += 1
+            return False
+        subgoal = (relation, keys)
+        self._rows += len(rows) - len(self._entries.get(subgoal) or ())
+        self._entries[subgoal] = rows
+        self._entries.move_to_end(subgoal)
+        self._by_relation.setdefault(relation, set()).add(keys)
+        return True
+
+    def trim(self) -> None:
+        while (
+            self.max_size is not None and len(self._entries) > self.max_size
+            or self.max_rows is not None and self._rows > self.max_rows
+        ):
+            (relation, keys), rows = self._entries.popitem(last=False)
+            self._rows -= len(rows or ())
+            self._forget(relation, keys)
+            self._evictions += 1
+
+    def invalidate(self, relations: Iterable[str]) -> int:
+        removed = 0
+        for relation in relations:
+            for keys in self._by_relation.pop(relation, ()):
+                self._rows -= len(self._entries.pop((relation, keys)) or ())
+                removed += 1
+        self._invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+        self._by_relation.clear()
+        self._rows = 0
+
+    def stats(self) -> SubgoalStats:
+        return SubgoalStats(
+            self._hits, self._misses, self._evictions, self._invalidations, self._oversized, len(self._entries), self._rows
+        )
+
+    def _forget(self, relation: str, keys: Keys) -> None:
+        remaining = self._by_relation[relation]
+        remaining.discard(keys)
+        if not remaining:
+            del self._by_relation[relation]
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# A stored value: the constant itself, or its symbol id in an interned plan.
+Value = Union[str, int]
+
+"""
+SymbolTable interns constant values as dense integer ids, so relations can
+hold fixed-width integer rows and joins compare integers. Given a connection,
+the table is kept in its `symbols` relation, so integer rows stored in that
+database stay decodable when it is reopened; new symbols are written as they
+are interned and committed with the caller's next commit.
+"""
+class SymbolTable:
+    _ids: Dict[str, int]
+    _values: List[str]
+    _conn: Optional[sqlite3.Connection]
+
+    def __init__(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        self._ids = {}
+        self._values = []
+        self._conn = conn
+        if conn is not None:
+            conn.execute('CREATE TABLE IF NOT EXISTS symbols (id INTEGER PRIMARY KEY, value TEXT UNIQUE)')
+            for symbol_id, value in conn.execute('SELECT id, value FROM symbols ORDER BY id'):
+                assert symbol_id == len(self._values)
+                self._ids[value] = symbol_id
+                self._values.append(value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def intern(self, value: str) -> int:
+        symbol_id = self._ids.get(value)
+        if symbol_id is None:
+            symbol_id = len(self._values)
+            self._ids[value] = symbol_id
+            self._values.append(value)
+            if self._conn is not None:
+                self._conn.execute('INSERT INTO symbols VALUES (?, ?)', (symbol_id, value))
+        return symbol_id
+
+    def lookup(self, value: str) -> Optional[int]:
+        return self._ids.get(value)
+
+    def value(self, symbol_id: int) -> str:
+        return self._values[symbol_id]
+
+    def encode(self, row: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.intern(value) for value in row)
+
+    def decode(self, row: Iterable[int]) -> Tuple[str, ...]:
+        values = self._values
+        return tuple(values[symbol_id] for symbol_id in row)
+
+    def decode_all(self, rows: Iterable[Iterable[int]]) -> Iterator[Tuple[str, ...]]:
+        values = self._values
+        for row in rows:
+            yield tuple(values[symbol_id] for symbol_id in row)
@@ -0,0 +1,133 @@
+import sqlite3
+
+import pytest
+
+from pydatalog import aggregates
+from pydatalog.analysis import stratify
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.nodes import Rule, Atom, Variable, Constant, aggregate, program
+from pydatalog.symbols import SymbolTable
+
+X, Y, D, N, S, L = (Variable(name) for name in ("X", "Y", "D", "N", "S", "L"))
+
+_EMPLOYEES = [
+    ("ann", "eng", "120"), ("bob", "eng", "95"), ("cid", "eng", "95"),
+    ("dee", "ops", "9"), ("eve", "ops", "10"), ("fay", "ops", "n/a"),
+]
+
+
+def _payroll_rules():
+    return program(
+        Rule(Atom("headcount", (D, aggregate("count", N))), (Atom("emp", (N, D, S)),)),
+        Rule(Atom("payroll", (D, aggregate("sum", S))), (Atom("emp", (N, D, S)),)),
+        Rule(Atom("band", (D, aggregate("min", S), aggregate("max", N))), (Atom("emp", (N, D, S)),)),
+        Rule(Atom("staff", (aggregate("count", N),)), (Atom("emp", (N, D, S)),)),
+        Rule(Atom("staff", (aggregate("count", N),)), (Atom("contractor", (N,)),)),
+    )
+
+
+def _components_rules():
+    # every node is labelled with the smallest node of its component
+    return program(
+        Rule(Atom("cc", (X, aggregate("min", L))), (Atom("node", (X, L)),)),
+        Rule(Atom("cc", (Y, aggregate("min", L))), (Atom("edge", (X, Y)), Atom("cc", (X, L)))),
+        Rule(Atom("size", (L, aggregate("count", X))), (Atom("cc", (X, L)),)),
+    )
+
+
+def _plan(rules, strategy, **tables):
+    conn = sqlite3.connect(":memory:")
+    for relation, rows in tables.items():
+        Db(conn, relation, len(rows[0])).store_many(rows)
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy=strategy)
+    plan.execute()
+    return plan
+
+
+def test_numeric_values_aggregate_as_numbers():
+    assert aggregates.numeric("10") == 10 and aggregates.numeric("2.5") == 2.5
+    assert aggregates.numeric("007") == "007" and aggregates.numeric("inf") == "inf"
+    assert aggregates.aggregate("min", ["9", "10", "abc"]) == "9"
+    assert aggregates.aggregate("max", ["9", "10", "abc"]) == "abc"
+    assert aggregates.aggregate("sum", ["1", "2.5", "x"]) == "3.5"
+    assert aggregates.combine([(1, "min"), (2, "max")], ("g", "3", "4"), ("g", "1", "2")) == ("g", "1", "4")
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_grouped_aggregates(strategy):
+    plan = _plan(_payroll_rules(), strategy, emp=_EMPLOYEES, contractor=[("gus",), ("ann",)])
+    assert set(plan.query("headcount")) == {("eng", "3"), ("ops", "3")}
+    # bob and cid earn the same, both count
+    assert set(plan.query("payroll")) == {("eng", "310"), ("ops", "19")}
+    assert set(plan.query("band")) == {("eng", "95", "cid"), ("ops", "9", "fay")}
+    # each rule counts its own bindings
+    assert set(plan.query("staff")) == {("8",)}
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_min_through_recursion(strategy):
+    nodes = [("1", "1"), ("2", "2"), ("10", "10"), ("7", "7"), ("30", "30")]
+    edges = [("10", "2"), ("2", "10"), ("10", "7"), ("7", "10"), ("30", "1"), ("1", "30")]
+    plan = _plan(_components_rules(), strategy, node=nodes, edge=edges)
+    assert set(plan.query("cc")) == {("1", "1"), ("30", "1"), ("2", "2"), ("10", "2"), ("7", "2")}
+    assert set(plan.query("size")) == {("1", "2"), ("2", "3")}
+    # updates reaching an aggregate re-evaluate the affected strata
+    plan.insert_facts("edge", [("30", "7")])
+    assert set(plan.query("size")) == {("1", "5")}
+    plan.retract_facts("edge", [("30", "7")])
+    assert set(plan.query("size")) == {("1", "2"), ("2", "3")}
+
+
+def test_parallel_workers_evaluate_aggregates():
+    nodes = [(str(i), str(i)) for i in range(20)]
+    edges = [(str(i), str(i + 1)) for i in range(19) if i != 9]
+    serial = _plan(_components_rules(), "seminaive", node=nodes, edge=edges)
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "node", 2).store_many(nodes)
+    Db(conn, "edge", 2).store_many(edges)
+    parallel = RulesPlan(_components_rules(), idb_storage=conn, edb_storage=conn, strategy="seminaive", workers=2)
+    parallel.execute()
+    assert set(parallel.query("size")) == set(serial.query("size")) == {("0", "10"), ("10", "10")}
+
+
+def test_aggregates_are_validated():
+    with pytest.raises(ValueError, match="through recursion"):
+        stratify(program(
+            Rule(Atom("n", (X, aggregate("count", Y))), (Atom("e", (X, Y)),)),
+            Rule(Atom("e", (X, Y)), (Atom("n", (X, Y)),)),
+        ))
+    with pytest.raises(ValueError, match="aggregates nothing"):
+        stratify(program(
+            Rule(Atom("best", (X, aggregate("min", Y))), (Atom("p", (X, Y)),)),
+            Rule(Atom("p", (X, Y)), (Atom("best", (X, Y)),)),
+        ))
+    with pytest.raises(ValueError, match="only appear in heads"):
+        program(Rule(Atom("p", (X,)), (Atom("q", (X, aggregate("count", Y))),)))
+    with pytest.raises(ValueError, match="fact"):
+        program(Rule(Atom("p", (aggregate("count", X),)), ()))
+    with pytest.raises(ValueError, match="do not agree"):
+        program(
+            Rule(Atom("p", (X, aggregate("count", Y))), (Atom("q", (X, Y)),)),
+            Rule(Atom("p", (X, aggregate("sum", Y))), (Atom("q", (X, Y)),)),
+        )
+    with pytest.raises(ValueError, match="own variable"):
+        program(Rule(Atom("p", (X, aggregate("count", X))), (Atom("q", (X, Y)),)))
+    with pytest.raises(ValueError, match="unknown aggregate"):
+        program(Rule(Atom("p", (aggregate("avg", X),)), (Atom("q", (X, Y)),)))
+    conn = sqlite3.connect(":memory:")
+    with pytest.raises(ValueError, match="tuple strategy"):
+        RulesPlan(_payroll_rules(), idb_storage=conn, edb_storage=conn)
+    with pytest.raises(ValueError, match="interned"):
+        RulesPlan(_payroll_rules(), idb_storage=conn, edb_storage=conn, strategy="sql", symbols=SymbolTable())
+    conn.close()
+
+
+def test_bound_query_on_aggregate_skips_magic_sets():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "emp", 3).store_many(_EMPLOYEES)
+    rules = program(*_payroll_rules().rules[:1], Rule(Atom("big", (D,)), (Atom("headcount", (D, Constant("3"))),)))
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy="seminaive")
+    assert list(plan.query("headcount", (0, "ops"))) == [("ops", "3")]
+    assert set(plan.query("big")) == {("eng",), ("ops",)}
+    conn.close()
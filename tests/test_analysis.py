@@ -0,0 +1,76 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.analysis import Stratum, stratify, dependents
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, negate, program
+
+
+def _reach_rules():
+    return program(
+        Rule(Atom("reach", (Constant("a"),)), ()),
+        Rule(Atom("reach", (Variable("Y"),)), (
+            Atom("reach", (Variable("X"),)),
+            Atom("edge", (Variable("X"), Variable("Y"))),
+        )),
+        Rule(Atom("node", (Variable("X"),)), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("node", (Variable("Y"),)), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("unreached", (Variable("X"),)), (
+            Atom("node", (Variable("X"),)),
+            negate(Atom("reach", (Variable("X"),))),
+        )),
+    )
+
+
+def test_stratify_orders_negated_dependencies_first():
+    strata = stratify(_reach_rules())
+    positions = {relation: i for i, stratum in enumerate(strata) for relation in stratum.relations}
+    assert positions["reach"] < positions["unreached"]
+    assert positions["node"] < positions["unreached"]
+    by_relation = {relation: stratum for stratum in strata for relation in stratum.relations}
+    assert by_relation["reach"] == Stratum(frozenset({"reach"}), True, 0)
+    assert by_relation["node"] == Stratum(frozenset({"node"}), False, 0)
+    assert by_relation["unreached"] == Stratum(frozenset({"unreached"}), False, 1)
+    assert dependents(_reach_rules(), "edge") == ({"reach", "node", "unreached"}, True)
+    assert dependents(_reach_rules(), "node") == ({"unreached"}, False)
+
+
+def test_stratify_rejects_negation_through_recursion():
+    rules = program(
+        Rule(Atom("p", (Variable("X"),)), (
+            Atom("d", (Variable("X"),)),
+            negate(Atom("q", (Variable("X"),))),
+        )),
+        Rule(Atom("q", (Variable("X"),)), (Atom("p", (Variable("X"),)),)),
+    )
+    with pytest.raises(ValueError):
+        stratify(rules)
+
+
+def test_plan_rejects_unsafe_negation_and_tuple_strategy():
+    unsafe = program(Rule(Atom("p", (Variable("X"),)), (
+        Atom("d", (Variable("X"),)),
+        negate(Atom("q", (Variable("X"), Variable("Y")))),
+    )))
+    with pytest.raises(ValueError):
+        RulesPlan(unsafe, idb_storage=MemoryStore(), edb_storage=MemoryStore(), strategy="seminaive")
+    with pytest.raises(ValueError):
+        RulesPlan(_reach_rules(), idb_storage=MemoryStore(), edb_storage=MemoryStore())
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_negation_evaluates_by_stratum_and_maintains_updates(strategy):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b"), ("b", "c"), ("d", "e")])
+    plan = RulesPlan(_reach_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    assert set(plan.query("unreached", (0, "d"))) == {("d",)}
+    assert set(plan.query("unreached")) == {("d",), ("e",)}
+    assert plan.insert_facts("edge", [("c", "d")]) == 1
+    assert set(plan.query("unreached")) == set()
+    assert plan.retract_facts("edge", [("a", "b")]) == 1
+    assert set(plan.query("reach")) == {("a",)}
+    assert set(plan.query("unreached")) == {("b",), ("c",), ("d",), ("e",)}
+    conn.close()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from pydatalog import benchmarks
+
+
+def test_generators():
+    assert benchmarks.chain(3).facts == {"edge": [("n0", "n1"), ("n1", "n2"), ("n2", "n3")]}
+    assert len(benchmarks.grid(3).facts["edge"]) == 12
+    assert len(benchmarks.random_graph(10, degree=3).facts["edge"]) == 30
+    assert benchmarks.random_graph(10).facts == benchmarks.random_graph(10).facts
+    assert len(benchmarks.same_generation(7).facts["parent"]) == 6
+    assert set(benchmarks.points_to(20).facts) == {"address_of", "assign", "load", "store"}
+    assert set(benchmarks.multi_join(20).facts) == {"r1", "r2", "r3", "r4"}
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql", "columnar"])
+def test_strategies_derive_the_same_tuples(strategy):
+    workload = benchmarks.chain(10)
+    result = benchmarks.run_benchmark(workload, strategy)
+    assert result.derived_tuples == 55
+    assert result.base_tuples == 10
+    assert result.statements > 0
+    assert result.peak_memory > 0
+
+
+def test_memory_backend_issues_no_statements():
+    result = benchmarks.run_benchmark(benchmarks.same_generation(15), "seminaive", backend="memory")
+    # pairs of nodes sharing a depth: 2 * 2 + 4 * 4 + 8 * 8
+    assert result.derived_tuples == 84
+    assert result.statements is None
+
+
+def test_main_writes_json(tmp_path):
+    output = tmp_path / "results.json"
+    benchmarks.main([
+        "--workloads", "tc_grid", "multi_join", "--strategies", "seminaive", "sql",
+        "--scales", "1", "--repeat", "1", "--output", str(output),
+    ])
+    report = json.loads(output.read_text())
+    assert report["pydatalog"]
+    results = report["results"]
+    assert [(r["workload"], r["strategy"]) for r in results] == [
+        ("tc_grid", "seminaive"), ("tc_grid", "sql"), ("multi_join", "seminaive"), ("multi_join", "sql"),
+    ]
+    assert results[0]["derived_tuples"] == results[1]["derived_tuples"]
+
+
+def test_unknown_workload():
+    with pytest.raises(ValueError, match="unknown workload"):
+        benchmarks.run_suite(["nope"])
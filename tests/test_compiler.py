@@ -0,0 +1,112 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.compiler import SqlEvaluator, compile_rule
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+
+
+def _path_rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+def _recursive_spec(plan):
+    from pydatalog.seminaive import _rule_spec
+    return _rule_spec(plan._heads["path"]._lower[1])
+
+
+def test_compile_rule_single_insert_select():
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_path_rules(), idb_storage=conn, edb_storage=conn, strategy="sql")
+    compiled = compile_rule(_recursive_spec(plan))
+    assert compiled.sql == (
+        "INSERT INTO path SELECT t0.col0, t1.col1 FROM edge AS t0 JOIN path AS t1 ON t1.col0 = t0.col1 "
+        "WHERE 1 ON CONFLICT DO NOTHING"
+    )
+    delta = compile_rule(_recursive_spec(plan), 1)
+    assert "t1.rowid > :lo AND t1.rowid <= :hi" in delta.sql
+    conn.close()
+
+
+def test_compile_rule_constants_are_parameters():
+    conn = sqlite3.connect(":memory:")
+    rules = program(
+        Rule(Atom("s", (Constant("tag"), Variable("X"))), (Atom("k2", (Constant("it's"), Variable("X"))),)),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy="sql")
+    from pydatalog.seminaive import _rule_spec
+    compiled = compile_rule(_rule_spec(plan._heads["s"]._lower[0]))
+    assert "it's" not in compiled.sql
+    assert set(compiled.params.values()) == {"tag", "it's"}
+    conn.close()
+
+
+def test_sql_strategy_matches_seminaive():
+    results = []
+    for strategy in ("seminaive", "sql"):
+        conn = sqlite3.connect(":memory:")
+        edge = Db(conn, "edge", 2)
+        for e in [("a", "b"), ("b", "c"), ("c", "d"), ("d", "b"), ("x", "y")]:
+            edge.store(e)
+        plan = RulesPlan(_path_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+        plan.execute()
+        results.append(set(plan.query("path")))
+        conn.close()
+    assert results[0] == results[1]
+    assert len(results[1]) == 13
+
+
+def test_sql_strategy_facts_and_multi_way_join():
+    conn = sqlite3.connect(":memory:")
+    a = Db(conn, "a", 2)
+    b = Db(conn, "b", 2)
+    a.store(("a", "b")); a.store(("a", "x"))
+    b.store(("b", "c")); b.store(("x", "y"))
+    rules = program(
+        Rule(Atom("c", (Constant("c"), Constant("d"))), ()),
+        Rule(Atom("r", (Variable("X"), Variable("Z"), Variable("W"))), (
+            Atom("a", (Variable("X"), Variable("Y"))),
+            Atom("b", (Variable("Y"), Variable("Z"))),
+            Atom("c", (Variable("Z"), Variable("W"))),
+        )),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy="sql")
+    assert set(plan.query("r")) == {("a", "c", "d")}
+    conn.close()
+
+
+def test_sql_strategy_requires_shared_connection():
+    idb = sqlite3.connect(":memory:")
+    edb = sqlite3.connect(":memory:")
+    plan = RulesPlan(_path_rules(), idb_storage=idb, edb_storage=edb, strategy="sql")
+    with pytest.raises(ValueError):
+        plan.execute()
+    idb.close()
+    edb.close()
+
+
+def test_sql_evaluator_leaves_the_commit_to_the_caller():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([(f"n{i}", f"n{i + 1}") for i in range(10)])
+    plan = RulesPlan(_path_rules(), conn, conn, strategy="sql")
+    SqlEvaluator(plan._heads).run()
+    assert conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM path").fetchone()[0] == 55
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM path").fetchone()[0] == 0
+
+    # execute() commits once, when its batch exits
+    statements = []
+    conn.set_trace_callback(statements.append)
+    plan.execute()
+    conn.set_trace_callback(None)
+    assert [s for s in statements if s.startswith("COMMIT")] == ["COMMIT"]
+    assert not conn.in_transaction
@@ -0,0 +1,117 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+
+
+def test_store_many_counts_only_new_rows():
+    conn = sqlite3.connect(":memory:")
+    q = Db(conn, "q", 2)
+    q.store(("a", "b"))
+    assert q.store_many([("a", "b"), ("c", "d"), ("c", "d"), ("e", "f")]) == 2
+    assert set(q.load()) == {("a", "b"), ("c", "d"), ("e", "f")}
+    assert q.store_many([]) == 0
+    conn.close()
+
+
+def test_store_many_checks_arity():
+    conn = sqlite3.connect(":memory:")
+    q = Db(conn, "q", 2)
+    with pytest.raises(ValueError):
+        q.store_many([("a", "b"), ("c",)])
+    conn.close()
+
+
+def test_batch_defers_commit_until_exit():
+    conn = sqlite3.connect(":memory:")
+    q = Db(conn, "q", 1)
+    with q.batch():
+        q.store(("a",))
+        with q.batch():
+            q.store_many([("b",), ("c",)])
+        assert conn.in_transaction
+    assert not conn.in_transaction
+    assert len(list(q.load())) == 3
+    conn.close()
+
+
+def test_batch_rolls_back_on_error():
+    conn = sqlite3.connect(":memory:")
+    q = Db(conn, "q", 1)
+    q.store(("a",))
+    with pytest.raises(RuntimeError):
+        with q.batch():
+            q.store(("b",))
+            raise RuntimeError("boom")
+    assert list(q.load()) == [("a",)]
+    conn.close()
+
+
+def test_execute_commits_once_per_run(tmp_path):
+    conn = sqlite3.connect(tmp_path / "facts.db")
+    commits = []
+    conn.set_trace_callback(lambda stmt: commits.append(stmt) if stmt.strip() == "COMMIT" else None)
+    rules = program(*(Rule(Atom("n", (Constant(str(i)),)), ()) for i in range(50)),
+                    Rule(Atom("m", (Variable("X"),)), (Atom("n", (Variable("X"),)),)))
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn)
+    commits.clear()
+    plan.execute()
+    assert len(commits) == 1
+    assert len(set(plan.query("m"))) == 50
+    conn.close()
+
+
+def _index_names(conn, table):
+    return {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+    )}
+
+
+def test_ensure_index_creates_non_prefix_indexes_once():
+    conn = sqlite3.connect(":memory:")
+    q = Db(conn, "q", 3)
+    assert q.ensure_index([2, 1]) is True
+    assert q.ensure_index((1, 2)) is False
+    # prefixes of the unique index and empty patterns need no extra index
+    assert q.ensure_index([0]) is False
+    assert q.ensure_index([1, 0]) is False
+    assert q.ensure_index([]) is False
+    assert _index_names(conn, "q") == {"q_idx_1_2"}
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM q WHERE col1 = ? AND col2 = ?", ("a", "b")).fetchall()
+    assert "q_idx_1_2" in " ".join(str(row[-1]) for row in plan)
+    with pytest.raises(ValueError):
+        q.ensure_index([3])
+    conn.close()
+
+
+def test_select_pushes_projection_distinct_and_pages_down():
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    edge.store_many([("a", "b"), ("a", "c"), ("b", "c"), ("c", "d"), ("a", "d")])
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert list(edge.select(columns=[1], distinct=True, limit=2)) == [("b",), ("c",)]
+    assert "SELECT DISTINCT col1 FROM edge" in statements[-1] and "LIMIT" in statements[-1]
+    assert list(edge.select([(0, "a")], limit=2, offset=1, batch_size=1)) == [("a", "c"), ("a", "d")]
+    assert list(edge.select(after=("a", "d"))) == [("b", "c"), ("c", "d")]
+    assert list(edge.select(columns=[0], distinct=True, after=("a",))) == [("b",), ("c",)]
+    assert edge.count(columns=[0]) == 3
+    assert edge.count((1, "c"), columns=[1]) == 1
+    with pytest.raises(ValueError):
+        list(edge.select(columns=[0], after=("a",)))
+    with pytest.raises(ValueError):
+        edge.count(columns=[2])
+    conn.close()
+
+
+def test_explain_reports_the_index_used():
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    assert edge.explain([]) == "SCAN edge"
+    assert "sqlite_autoindex_edge_1" in edge.explain([0])
+    edge.ensure_index([1])
+    assert "edge_idx_1" in edge.explain([1])
+    conn.close()
@@ -1,6 +1,8 @@
-from pydatalog.execution import RulesPlan, _union
+import pytest
+from pydatalog.execution import RulesPlan
 from pydatalog.nodes import Rule, Atom, Variable, Constant, program
 from pydatalog.db import Db
+from pydatalog.symbols import SymbolTable
 import sqlite3
 
 
@@ -220,28 +222,6 @@ def test_varying_arities_and_multi_row():
     assert rows == {("x", "z"), ("y", "z")}
     conn.close()
 
-# ---- merged from test_execution_union.py ----
-
-def test_union_disjoint_merges():
-    left = {0: "a", 2: "c"}
-    right = {1: "b"}
-    result = _union(left, right)
-    assert result == {0: "a", 1: "b", 2: "c"}
-
-
-def test_union_overlapping_same_values_keeps():
-    left = {0: "a", 1: "b"}
-    right = {1: "b", 2: "c"}
-    result = _union(left, right)
-    assert result == {0: "a", 1: "b", 2: "c"}
-
-
-def test_union_conflict_returns_none():
-    left = {0: "a", 1: "b"}
-    right = {1: "x", 2: "c"}
-    result = _union(left, right)
-    assert result is None
-
 def test_query_unknown_relation_returns_empty():
     conn = sqlite3.connect(":memory:")
     # minimal plan with unrelated rule
@@ -314,16 +294,6 @@ def test_edb_head_propagates_to_uppers_on_query():
     conn.close()
 
 
-def test_union_empty_right_left():
-    assert _union({0: "a"}, {}) == {0: "a"}
-    assert _union({}, {1: "b"}) == {1: "b"}
-
-
-def test_union_multiple_key_overlap_and_conflict():
-    assert _union({0: "a", 1: "b"}, {0: "a", 1: "b"}) == {0: "a", 1: "b"}
-    assert _union({0: "a", 1: "b"}, {0: "x", 1: "b"}) is None
-
-
 def test_query_unknown_with_keys_returns_empty():
     conn = sqlite3.connect(":memory:")
     rules = program()
@@ -380,6 +350,111 @@ def test_to_lower_mapping_omits_unbound_canonicals():
     conn.close()
 
 
+def test_plan_creates_indexes_for_binding_patterns():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2)
+    rules = program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn)
+    # a new path(Y, Z) probes edge on its second column, a new edge(X, Y) probes path on its first
+    assert plan.adornments() == {"edge": {(1,)}, "path": {(0,)}}
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+    assert indexes == {"edge_idx_1"}
+    conn.close()
+
+
+def test_deep_recursion_does_not_exhaust_the_stack():
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    edge.store_many([(f"n{i}", f"n{i + 1}") for i in range(5000)])
+    rules = program(
+        Rule(Atom("reach", (Constant("n0"),)), ()),
+        Rule(Atom("reach", (Variable("Y"),)), (
+            Atom("reach", (Variable("X"),)),
+            Atom("edge", (Variable("X"), Variable("Y"))),
+        )),
+        Rule(Atom("last", (Variable("X"),)), (Atom("reach", (Variable("X"),)), Atom("edge", (Variable("X"), Constant("n5000"))))),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn)
+    plan.execute()
+    assert len(set(plan.query("reach"))) == 5001
+    assert list(plan.query("last")) == [("n4999",)]
+    conn.close()
+
+
+def test_compiled_join_checks_constants_and_repeated_variables():
+    conn = sqlite3.connect(":memory:")
+    e = Db(conn, "e", 2)
+    e.store_many([("a", "b"), ("b", "b"), ("a", "c"), ("c", "d")])
+    f = Db(conn, "f", 3)
+    f.store_many([("b", "c", "z1"), ("b", "x", "z2"), ("c", "c", "z3")])
+    rules = program(
+        Rule(Atom("t", (Variable("X"), Constant("k"), Variable("Z"))), (
+            Atom("e", (Variable("X"), Variable("Y"))),
+            Atom("e", (Variable("Y"), Variable("Y"))),
+            Atom("f", (Variable("Y"), Constant("c"), Variable("Z"))),
+        )),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn)
+    # only Y = b has the self loop e(b, b) and an f(b, c, _) fact
+    assert set(plan.query("t")) == {("a", "k", "z1"), ("b", "k", "z1")}
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_paginated_query_and_count(strategy):
+    conn = sqlite3.connect(":memory:")
+    nodes = [f"n{i:02}" for i in range(12)]
+    Db(conn, "e", 2).store_many(zip(nodes, nodes[1:]))
+    rules = program(
+        Rule(Atom("p", (Variable("X"), Variable("Y"))), (Atom("e", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("p", (Variable("X"), Variable("Z"))), (
+            Atom("e", (Variable("X"), Variable("Y"))),
+            Atom("p", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy=strategy)
+    # before execute, bottom-up strategies answer this through magic sets
+    first = list(plan.query("p", (0, "n00"), columns=[1], limit=3))
+    assert first == [("n01",), ("n02",), ("n03",)]
+    assert list(plan.query("p", (0, "n00"), columns=[1], distinct=True, after=first[-1], limit=2)) == [("n04",), ("n05",)]
+    assert plan.count("p", (0, "n00")) == 11
+    expected = sorted((a, b) for i, a in enumerate(nodes) for b in nodes[i + 1:])
+    assert list(plan.query("p", limit=5, offset=10, batch_size=2)) == expected[10:15]
+    assert plan.count("p") == len(expected)
+    assert plan.count("p", columns=[0]) == 11
+    assert list(plan.query("p", columns=[0], distinct=True, after=("n09",))) == [("n10",)]
+    with pytest.raises(ValueError):
+        list(plan.query("p", columns=[0], after=("n00",)))
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql", "columnar"])
+def test_bound_query_through_a_repeated_variable_falls_back_to_full_evaluation(strategy):
+    conn = sqlite3.connect(":memory:")
+    rules = program(
+        Rule(Atom("r", (Variable("X"),)), (
+            Atom("e", (Variable("X"), Variable("Y"))),
+            Atom("q", (Variable("Y"), Variable("Y"))),
+        )),
+        Rule(Atom("q", (Variable("X"), Variable("Y"))), (Atom("f", (Variable("X"), Variable("Y"))),)),
+    )
+    symbols = SymbolTable() if strategy == "columnar" else None
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy=strategy, symbols=symbols)
+    plan.load_facts("e", [("a", "b"), ("c", "d")])
+    plan.load_facts("f", [("b", "b"), ("d", "e")])
+    # magic sets cannot pass the bindings of q(Y, Y) on
+    assert list(plan.query("r", (0, "a"))) == [("a",)]
+    assert plan.count("r", (0, "c")) == 0
+    assert plan._executed
+    conn.close()
+
+
 if __name__ == "__main__":
     print("Running tests...")
     test_simple_projection_from_edb()
@@ -392,17 +467,15 @@ if __name__ == "__main__":
     test_head_multiple_rules_and_constants()
     test_mutual_recursion_even_odd()
     test_varying_arities_and_multi_row()
-    test_union_disjoint_merges()
-    test_union_overlapping_same_values_keeps()
-    test_union_conflict_returns_none()
     test_query_unknown_relation_returns_empty()
     test_duplicate_fact_does_not_propagate_twice()
     test_explored_mapping_prevents_rework()
     test_body_constant_mismatch_blocks_propagation()
     test_edb_head_propagates_to_uppers_on_query()
-    test_union_empty_right_left()
-    test_union_multiple_key_overlap_and_conflict()
     test_query_unknown_with_keys_returns_empty()
     test_head_constant_applied_in_result()
     test_insufficient_body_mapping_prevents_derivation()
     test_to_lower_mapping_omits_unbound_canonicals()
+    test_plan_creates_indexes_for_binding_patterns()
+    test_deep_recursion_does_not_exhaust_the_stack()
+    test_compiled_join_checks_constants_and_repeated_variables()
@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, negate, program
+
+X, Y, Z = Variable("X"), Variable("Y"), Variable("Z")
+
+
+def _rules(negation=True):
+    rules = [
+        Rule(Atom("path", (X, Y)), (Atom("edge", (X, Y)),)),
+        Rule(Atom("path", (X, Z)), (Atom("edge", (X, Y)), Atom("path", (Y, Z)))),
+    ]
+    if negation:
+        rules.append(Rule(Atom("acyclic", (X,)), (Atom("edge", (X, Y)), negate(Atom("path", (X, X))))))
+    return program(*rules)
+
+
+def _plan(strategy, **options):
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_rules(strategy != "tuple"), conn, conn, strategy=strategy, **options)
+    plan.load_facts("edge", [("a", "b"), ("b", "c"), ("c", "a"), ("c", "d")])
+    return plan
+
+
+def test_graph_strata_and_cardinalities():
+    explanation = _plan("seminaive").explain()
+    assert explanation.dependencies["acyclic"] == (("edge", False), ("path", True))
+    assert [(set(s.relations), s.recursive) for s in explanation.strata] == [({"path"}, True), ({"acyclic"}, False)]
+    assert explanation.cardinalities == {"path": 0, "acyclic": 0, "edge": 4}
+    assert [rule.rule_idx for rule in explanation.rules] == [0, 1, 2]
+    assert explanation.rules[1].rule == "path(X, Z) :- edge(X, Y), path(Y, Z) ."
+
+
+def test_joins_show_order_bindings_and_estimates():
+    rule = _plan("seminaive").explain().rules[1]
+    full, by_edge, by_path = rule.joins
+    assert (full.delta_idx, by_edge.delta_idx, by_path.delta_idx) == (None, 0, 1)
+    assert [(step.relation, step.binding) for step in by_path.steps] == [("path", "ff"), ("edge", "fb")]
+    assert by_path.steps[0].access == "delta of the previous iteration"
+    assert by_path.steps[1].access == "in-memory hash index on (col1)"
+    # four edges with four distinct targets: one row per probe on col1
+    assert by_path.steps[1].estimate == 1.0
+    assert by_path.estimate == 1.0
+
+
+def test_tuple_strategy_probes_use_sqlite_indexes():
+    rule = _plan("tuple").explain().rules[1]
+    by_path = next(join for join in rule.joins if join.delta_idx == 1)
+    assert by_path.steps[0].access == "driving tuple"
+    assert by_path.steps[1].access == "SEARCH edge USING INDEX edge_idx_1 (col1=?)"
+
+
+def test_sql_strategy_explains_statements():
+    explanation = _plan("sql").explain()
+    negated = explanation.rules[2].joins[0]
+    assert negated.steps[-1].negated and negated.steps[-1].access.startswith("NOT EXISTS: SEARCH path")
+    assert any("USING INTEGER PRIMARY KEY" in detail for detail in explanation.rules[1].joins[1].sql)
+    text = str(explanation)
+    assert "path <- edge, path" in text
+    assert "acyclic <- edge, not path" in text
+    assert "1. path (recursive)" in text
+    assert "sql: " in text
+
+
+@pytest.mark.parametrize("reorder", [True, False])
+def test_explained_orders_match_the_plan(reorder):
+    store = MemoryStore()
+    plan = RulesPlan(_rules(False), store, store, strategy="tuple", reorder_joins=reorder)
+    joins = plan.explain().rules[1].joins
+    assert [join.steps[0].atom_idx for join in joins] == [0, 1]
+    assert "HASH INDEX" in joins[0].steps[1].access
+    plan.execute()
+    # executing does not change the explained orders
+    assert plan.explain().rules[1].joins == joins
+
+
+def test_tuple_strategy_indexes_the_planned_probes():
+    conn = sqlite3.connect(":memory:")
+    rules = program(Rule(Atom("r", (X, Z)), (Atom("a", (X, Y)), Atom("b", (Y, Z)), Atom("c", (Z,)))))
+    Db(conn, "a", 2).store_many([(f"x{i}", f"y{i % 10}") for i in range(100)])
+    Db(conn, "b", 2).store_many([(f"y{i % 10}", f"z{i}") for i in range(100)])
+    Db(conn, "c", 1).store_many([("z1",)])
+    plan = RulesPlan(rules, conn, conn, strategy="tuple")
+    by_c = next(join for join in plan.explain().rules[0].joins if join.delta_idx == 2)
+    assert [(step.relation, step.binding) for step in by_c.steps[:2]] == [("c", "f"), ("b", "fb")]
+    for step in by_c.steps[1:]:
+        assert step.access.startswith("SEARCH"), step.access
@@ -0,0 +1,126 @@
+import random
+import sqlite3
+
+import pytest
+
+from pydatalog import seminaive
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+
+
+def _rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+        Rule(Atom("reach", (Constant("a"),)), ()),
+        Rule(Atom("reach", (Variable("Y"),)), (
+            Atom("reach", (Variable("X"),)),
+            Atom("edge", (Variable("X"), Variable("Y"))),
+        )),
+    )
+
+
+def _recomputed(edges):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many(edges)
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy="seminaive")
+    plan.execute()
+    result = set(plan.query("path")), set(plan.query("reach"))
+    conn.close()
+    return result
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_insert_and_retract_match_recomputation(strategy):
+    rng = random.Random(7)
+    nodes = ["a"] + [f"n{i}" for i in range(12)]
+    edges = {(rng.choice(nodes), rng.choice(nodes)) for _ in range(15)}
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many(edges)
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    plan.execute()
+    for step in range(12):
+        if step % 3 == 2 and edges:
+            batch = set(rng.sample(sorted(edges), min(3, len(edges))))
+            assert plan.retract_facts("edge", batch) == len(batch)
+            edges -= batch
+        else:
+            batch = {(rng.choice(nodes), rng.choice(nodes)) for _ in range(3)}
+            assert plan.insert_facts("edge", batch) == len(batch - edges)
+            edges |= batch
+        assert (set(plan.query("path")), set(plan.query("reach"))) == _recomputed(edges)
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_retract_keeps_facts_and_alternative_derivations(strategy):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b"), ("b", "a"), ("a", "c"), ("b", "c")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    plan.execute()
+    assert plan.retract_facts("edge", [("a", "c"), ("x", "y")]) == 1
+    assert ("a", "c") in set(plan.query("path"))  # still derivable through b
+    assert plan.retract_facts("edge", [("b", "a")]) == 1
+    # reach(a) is a program fact and survives losing its cyclic derivation
+    assert set(plan.query("reach")) == {("a",), ("b",), ("c",)}
+    assert set(plan.query("path")) == {("a", "b"), ("a", "c"), ("b", "c")}
+    conn.close()
+
+
+def test_tuple_strategy_insert_propagates_and_retract_rederives():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn)
+    plan.execute()
+    assert plan.insert_facts("edge", [("b", "c"), ("a", "b")]) == 1
+    assert set(Db(conn, "reach", 1).load()) == {("a",), ("b",), ("c",)}
+    assert plan.retract_facts("edge", [("b", "c")]) == 1
+    assert set(Db(conn, "reach", 1).load()) == {("a",), ("b",)}
+    conn.close()
+
+
+def test_sql_retraction_runs_in_sqlite(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([(f"n{i}", f"n{i + 1}") for i in range(10)])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy="sql")
+    plan.execute()
+    monkeypatch.setattr(seminaive.SemiNaiveEvaluator, "load", None)
+    assert plan.retract_facts("edge", [("n4", "n5"), ("x", "y")]) == 1
+    assert plan.count("path") == 5 * 4 // 2 + 6 * 5 // 2
+    tables = conn.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'").fetchall()
+    assert tables == []
+    conn.close()
+
+
+def test_tuple_strategy_keeps_its_retraction_evaluator(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b"), ("b", "c")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn)
+    plan.execute()
+    loads = []
+    load = seminaive.SemiNaiveEvaluator.load
+    monkeypatch.setattr(seminaive.SemiNaiveEvaluator, "load", lambda self: loads.append(load(self)))
+    assert plan.retract_facts("edge", [("b", "c")]) == 1
+    # tuples derived after the first retraction are seen by the next one
+    assert plan.insert_facts("edge", [("b", "d"), ("d", "e")]) == 2
+    assert plan.retract_facts("edge", [("b", "d")]) == 1
+    assert set(Db(conn, "reach", 1).load()) == {("a",), ("b",)}
+    assert len(loads) == 1
+    conn.close()
+
+
+def test_insert_before_execute_only_stores():
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy="seminaive")
+    assert plan.insert_facts("edge", [("a", "b")]) == 1
+    assert list(Db(conn, "path", 2).load()) == []
+    assert set(plan.query("path")) == {("a", "b")}
+    with pytest.raises(ValueError):
+        plan.insert_facts("unknown", [("a",)])
+    with pytest.raises(ValueError):
+        plan.insert_facts("edge", [("a",)])
+    conn.close()
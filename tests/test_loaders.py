@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from pydatalog import loaders
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, program
+from pydatalog.symbols import SymbolTable
+
+
+def _rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_read_csv_streams_rows(tmp_path, use_mmap):
+    path = tmp_path / "edges.csv"
+    path.write_text('src,dst,weight\na,b,1\n"c,d",e,2\n\nf,g,3\n')
+    rows = loaders.read_csv(path, header=True, columns=[1, 0], use_mmap=use_mmap)
+    assert list(rows) == [("b", "a"), ("e", "c,d"), ("g", "f")]
+    empty = tmp_path / "empty.csv"
+    empty.write_text("")
+    assert list(loaders.read_csv(empty, use_mmap=use_mmap)) == []
+
+
+def test_load_tsv_in_chunks(tmp_path):
+    path = tmp_path / "edges.tsv"
+    path.write_text("".join(f"n{i}\tn{i + 1}\n" for i in range(10)) + "n0\tn1\n")
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    assert loaders.load_tsv(edge, path, chunk_size=3) == 10
+    assert edge.count() == 10
+    with pytest.raises(ValueError):
+        loaders.load_csv(MemoryDb(MemoryStore(), "node", 1), path, delimiter="\t")
+    with pytest.raises(ValueError):
+        list(loaders.chunked([], 0))
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_rules_plan_loads_csv_before_and_after_execute(tmp_path, strategy):
+    first = tmp_path / "first.csv"
+    first.write_text("a,b\nb,c\n")
+    second = tmp_path / "second.csv"
+    second.write_text("c,d\n")
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    assert plan.load_csv("edge", first) == 2
+    plan.execute()
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c")}
+    # loaded after execute, maintained like insert_facts
+    assert plan.load_csv("edge", second, chunk_size=1) == 1
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c"), ("a", "d")}
+    with pytest.raises(ValueError):
+        plan.load_facts("unknown", [("a",)])
+    conn.close()
+
+
+def test_interned_plan_encodes_loaded_rows():
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy="seminaive", symbols=SymbolTable())
+    assert plan.load_facts("edge", iter([("a", "b"), ("b", "c")]), chunk_size=1) == 2
+    assert set(Db(conn, "edge", 2, column_type="INTEGER").load()) == {(0, 1), (1, 2)}
+    assert set(plan.query("path")) == {("a", "b"), ("b", "c"), ("a", "c")}
+    conn.close()
+
+
+def test_load_parquet(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "edges.parquet"
+    pq.write_table(pa.table({"src": ["a", "b", None], "dst": ["b", "c", "d"], "w": [1, 2, 3]}), path)
+    store = MemoryStore()
+    assert loaders.load_parquet(MemoryDb(store, "edge", 2), path, columns=["src", "dst"], chunk_size=1) == 2
+    assert set(MemoryDb(store, "edge", 2).load()) == {("a", "b"), ("b", "c")}
@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+
+from pydatalog import print_program, seminaive
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.magic import magic_program
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+
+
+def _path_rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+def test_magic_rewrite_of_bound_first_argument():
+    rewritten = magic_program(_path_rules(), "path", [(0, "a")])
+    assert rewritten.answer == "path__bf"
+    assert print_program(rewritten.program) == "\n".join([
+        "path__bf(X, Y) :- magic__path__bf(X), edge(X, Y) .",
+        "magic__path__bf(Y) :- magic__path__bf(X), edge(X, Y) .",
+        "path__bf(X, Z) :- magic__path__bf(X), edge(X, Y), path__bf(Y, Z) .",
+        "magic__path__bf(a) :- .",
+    ])
+
+
+def test_magic_rewrite_rejects_underived_relation():
+    with pytest.raises(ValueError):
+        magic_program(_path_rules(), "edge", [(0, "a")])
+
+
+def test_magic_rewrite_rejects_repeated_bound_variables():
+    rules = program(
+        Rule(Atom("r", (Variable("X"),)), (
+            Atom("e", (Variable("X"), Variable("Y"))),
+            Atom("q", (Variable("Y"), Variable("Y"))),
+        )),
+        Rule(Atom("q", (Variable("X"), Variable("Y"))), (Atom("f", (Variable("X"), Variable("Y"))),)),
+    )
+    with pytest.raises(ValueError, match="repeats a bound variable"):
+        magic_program(rules, "r", [(0, "a")])
+
+
+def test_magic_evaluation_derives_only_relevant_facts():
+    store = MemoryStore()
+    edge = MemoryDb(store, "edge", 2)
+    edge.store_many([(f"a{i}", f"a{i + 1}") for i in range(5)])
+    edge.store_many([(f"u{i}", f"u{i + 1}") for i in range(50)])
+    rewritten = magic_program(_path_rules(), "path", [(0, "a2")])
+    idb = MemoryStore()
+    plan = RulesPlan(rewritten.program, idb_storage=idb, edb_storage=store, strategy="seminaive")
+    plan.execute()
+    derived = set(MemoryDb(idb, "path__bf", 2).load())
+    # only paths starting from nodes reachable from a2 are derived
+    assert derived == {(f"a{i}", f"a{j}") for i in range(2, 6) for j in range(i + 1, 6)}
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_bound_query_before_execute_is_goal_directed(strategy):
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    edge.store_many([("a", "b"), ("b", "c"), ("c", "d"), ("x", "y")])
+    plan = RulesPlan(_path_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    assert set(plan.query("path", (0, "b"))) == {("b", "c"), ("b", "d")}
+    assert set(plan.query("path", (1, "d"))) == {("a", "d"), ("b", "d"), ("c", "d")}
+    # the full closure was never materialized
+    assert list(Db(conn, "path", 2).load()) == []
+    plan.execute()
+    assert len(set(plan.query("path"))) == 7
+    conn.close()
+
+
+def test_sql_magic_query_runs_in_sqlite(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([(f"n{i}", f"n{i + 1}") for i in range(20)])
+    plan = RulesPlan(_path_rules(), idb_storage=conn, edb_storage=conn, strategy="sql")
+    monkeypatch.setattr(seminaive.SemiNaiveEvaluator, "load", None)
+    assert plan.count("path", (0, "n15")) == 5
+    # the rewritten relations lived in temporary tables, dropped since
+    assert conn.execute("SELECT name FROM sqlite_temp_master").fetchall() == []
+    assert list(Db(conn, "path", 2).load()) == []
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_magic_query_with_facts_and_mutual_recursion(strategy):
+    conn = sqlite3.connect(":memory:")
+    succ = Db(conn, "succ", 2)
+    succ.store_many([(str(i), str(i + 1)) for i in range(6)])
+    rules = program(
+        Rule(Atom("even", (Constant("0"),)), ()),
+        Rule(Atom("odd", (Variable("Y"),)), (
+            Atom("succ", (Variable("X"), Variable("Y"))),
+            Atom("even", (Variable("X"),)),
+        )),
+        Rule(Atom("even", (Variable("Y"),)), (
+            Atom("succ", (Variable("X"), Variable("Y"))),
+            Atom("odd", (Variable("X"),)),
+        )),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy=strategy)
+    assert list(plan.query("even", (0, "4"))) == [("4",)]
+    assert list(plan.query("odd", (0, "4"))) == []
+    conn.close()
@@ -0,0 +1,123 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+
+
+def _path_rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+def test_memory_db_store_and_indexed_load():
+    store = MemoryStore()
+    q = MemoryDb(store, "q", 2)
+    assert q.store(("a", "b")) is True
+    assert q.store(("a", "b")) is False
+    assert q.store_many([("a", "c"), ("d", "c"), ("a", "c")]) == 2
+    assert list(q.load()) == [("a", "b"), ("a", "c"), ("d", "c")]
+    assert set(q.load((0, "a"))) == {("a", "b"), ("a", "c")}
+    assert set(q.load((1, "c"))) == {("a", "c"), ("d", "c")}
+    assert list(q.load((0, "a"), (1, "c"))) == [("a", "c")]
+    assert list(q.load((0, "a"), (0, "d"))) == []
+    # indexes built on demand stay up to date with later writes
+    q.store(("e", "c"))
+    assert set(q.load((1, "c"))) == {("a", "c"), ("d", "c"), ("e", "c")}
+    with pytest.raises(ValueError):
+        q.store(("a",))
+
+
+def test_memory_db_log_only_holds_present_rows():
+    q = MemoryDb(MemoryStore(), "q", 1)
+    q.store_many([("a",), ("b",)])
+    mark = q.watermark()
+    for i in range(100):
+        q.store((f"x{i}",))
+        q.delete_many([(f"x{i}",)])
+    q.store(("c",))
+    assert len(q._data.log) == 3
+    assert list(q.load_since(mark)) == [("c",)]
+    assert list(q.load_since(0)) == [("a",), ("b",), ("c",)]
+
+
+def test_memory_db_instances_share_store():
+    store = MemoryStore()
+    MemoryDb(store, "q", 1).store(("x",))
+    assert list(MemoryDb(store, "q", 1).load()) == [("x",)]
+    assert list(MemoryDb(MemoryStore(), "q", 1).load()) == []
+    with pytest.raises(ValueError):
+        MemoryDb(store, "q", 2)
+
+
+def test_memory_db_select_matches_db():
+    conn = sqlite3.connect(":memory:")
+    rows = [("a", "b"), ("a", "c"), ("b", "c"), ("c", "d"), ("a", "d")]
+    memory_db, db = MemoryDb(MemoryStore(), "edge", 2), Db(conn, "edge", 2)
+    for relation in (memory_db, db):
+        relation.store_many(rows)
+    for options in [
+        {"columns": [1], "distinct": True, "limit": 2},
+        {"keys": [(0, "a")], "limit": 2, "offset": 1},
+        {"after": ("a", "d")},
+        {"columns": [1, 0], "distinct": True, "after": ("c", "a")},
+    ]:
+        assert list(memory_db.select(**options)) == list(db.select(**options))
+    assert sorted(memory_db.select(columns=[0])) == sorted(db.select(columns=[0]))
+    assert memory_db.count(columns=[1]) == db.count(columns=[1]) == 3
+    conn.close()
+
+
+def test_memory_db_ensure_index():
+    q = MemoryDb(MemoryStore(), "q", 2)
+    assert q.ensure_index([1]) is True
+    assert q.ensure_index([1]) is False
+    with pytest.raises(ValueError):
+        q.ensure_index([2])
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive"])
+def test_rules_plan_on_memory_store(strategy):
+    store = MemoryStore()
+    edge = MemoryDb(store, "edge", 2)
+    for e in [("a", "b"), ("b", "c"), ("c", "d")]:
+        edge.store(e)
+    plan = RulesPlan(_path_rules(), idb_storage=store, edb_storage=store, strategy=strategy)
+    plan.execute()
+    assert set(plan.query("path")) == {("a", "b"), ("b", "c"), ("c", "d"), ("a", "c"), ("b", "d"), ("a", "d")}
+    assert set(plan.query("path", (0, "c"))) == {("c", "d")}
+
+
+def test_memory_idb_over_sqlite_edb():
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    edge.store(("a", "b"))
+    edge.store(("b", "c"))
+    store = MemoryStore()
+    plan = RulesPlan(_path_rules(), idb_storage=store, edb_storage=conn, strategy="seminaive")
+    plan.execute()
+    assert set(MemoryDb(store, "path", 2).load()) == {("a", "b"), ("b", "c"), ("a", "c")}
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'path'").fetchall() == []
+    conn.close()
+
+
+def test_sql_strategy_rejects_memory_store():
+    store = MemoryStore()
+    rules = program(Rule(Atom("p", (Constant("x"),)), ()), Rule(Atom("q", (Variable("X"),)), (Atom("p", (Variable("X"),)),)))
+    plan = RulesPlan(rules, idb_storage=store, edb_storage=store, strategy="sql")
+    with pytest.raises(ValueError):
+        plan.execute()
+
+
+def test_explain():
+    edge = MemoryDb(MemoryStore(), "edge", 2)
+    assert edge.explain([]) == "SCAN edge"
+    assert edge.explain([1, 0]) == "SEARCH edge USING HASH INDEX (col0=? AND col1=?)"
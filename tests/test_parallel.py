@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from pydatalog import parallel
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, negate, program
+
+
+def _rules():
+    X, Y, Z = Variable("X"), Variable("Y"), Variable("Z")
+    return program(
+        Rule(Atom("path", (X, Y)), (Atom("edge", (X, Y)),)),
+        Rule(Atom("path", (X, Z)), (Atom("path", (X, Y)), Atom("edge", (Y, Z)))),
+        # independent of path: solved concurrently with it
+        Rule(Atom("sym", (X, Y)), (Atom("link", (X, Y)),)),
+        Rule(Atom("sym", (Y, X)), (Atom("link", (X, Y)),)),
+        Rule(Atom("node", (X,)), (Atom("edge", (X, Y)),)),
+        Rule(Atom("cut", (X, Y)), (Atom("sym", (X, Y)), negate(Atom("path", (X, Y))))),
+        Rule(Atom("loop", (X,)), (Atom("path", (X, X)), Atom("node", (X,)))),
+        Rule(Atom("root", (Constant("n0"),)), ()),
+    )
+
+
+def _evaluate(edges, links, workers):
+    edb = MemoryStore()
+    MemoryDb(edb, "edge", 2).store_many(edges)
+    MemoryDb(edb, "link", 2).store_many(links)
+    plan = RulesPlan(_rules(), idb_storage=MemoryStore(), edb_storage=edb, strategy="seminaive", workers=workers)
+    plan.execute()
+    return {relation: set(plan.query(relation)) for relation in ("path", "sym", "node", "cut", "loop", "root")}
+
+
+def test_parallel_matches_serial(monkeypatch):
+    monkeypatch.setattr(parallel, "_MIN_ROWS", 1)
+    rng = random.Random(3)
+    nodes = [f"n{i}" for i in range(30)]
+    edges = {(rng.choice(nodes), rng.choice(nodes)) for _ in range(60)}
+    links = {(rng.choice(nodes), rng.choice(nodes)) for _ in range(20)}
+    serial = _evaluate(edges, links, 1)
+    assert serial["path"] and serial["cut"]
+    assert _evaluate(edges, links, 3) == serial
+
+
+def test_workers_option_is_validated():
+    with pytest.raises(ValueError):
+        RulesPlan(_rules(), idb_storage=MemoryStore(), edb_storage=MemoryStore(), strategy="seminaive", workers=0)
+    with pytest.raises(ValueError):
+        RulesPlan(_rules(), idb_storage=MemoryStore(), edb_storage=MemoryStore(), strategy="sql", workers=2)
+
+
+def test_single_stratum_partitions_deltas(monkeypatch):
+    monkeypatch.setattr(parallel, "_MIN_ROWS", 1)
+    partitions = []
+    partition = parallel.ParallelEvaluator._partition
+
+    def spy(self, *args):
+        tasks = partition(self, *args)
+        partitions.append(len(tasks))
+        return tasks
+
+    monkeypatch.setattr(parallel.ParallelEvaluator, "_partition", spy)
+    X, Y, Z = Variable("X"), Variable("Y"), Variable("Z")
+    rules = program(
+        Rule(Atom("path", (X, Y)), (Atom("edge", (X, Y)),)),
+        Rule(Atom("path", (X, Z)), (Atom("path", (X, Y)), Atom("edge", (Y, Z)))),
+    )
+    results = []
+    for workers in (1, 2):
+        edb = MemoryStore()
+        MemoryDb(edb, "edge", 2).store_many([(f"n{i}", f"n{i + 1}") for i in range(40)])
+        plan = RulesPlan(rules, idb_storage=MemoryStore(), edb_storage=edb, strategy="seminaive", workers=workers)
+        plan.execute()
+        results.append(set(plan.query("path")))
+    assert max(partitions) == 2
+    assert results[0] == results[1]
+    assert len(results[0]) == 40 * 41 // 2
+
+
+def test_tasks_ship_only_the_rows_their_seeds_reach():
+    from pydatalog.seminaive import _AtomSpec, _Const, _RelationIndex, _RuleSpec
+
+    # path(X, Z) :- edge(X, Y), path(Y, Z), not blocked(Z), driven by new edges
+    spec = _RuleSpec("path", (0, 2), (
+        _AtomSpec("edge", (0, 1)),
+        _AtomSpec("path", (1, 2)),
+        _AtomSpec("blocked", (2,), negated=True),
+        _AtomSpec("kind", (_Const("road"), 0)),
+    ), 3)
+    chain = [(f"n{i}", f"n{i + 1}") for i in range(100)]
+    relations = {
+        "edge": _RelationIndex(chain),
+        "path": _RelationIndex(chain),
+        "blocked": _RelationIndex([("n7",), ("n50",)]),
+        "kind": _RelationIndex([("road", "n5"), ("rail", "n5"), ("road", "n9")]),
+    }
+    seeds = [("n5", "n6", None)]
+    shipped = parallel._reduce(spec, [1, 2, 3], seeds, {0, 1}, relations)
+    assert shipped == {"path": {("n6", "n7")}, "blocked": {("n7",)}, "kind": {("road", "n5")}}
@@ -0,0 +1,147 @@
+import json
+import sqlite3
+
+import pytest
+
+from pydatalog import print_program
+from pydatalog.db import Db
+from pydatalog.memory import MemoryStore
+from pydatalog.nodes import Rule, Atom, Constant, Variable, aggregate, negate, program
+from pydatalog.parser import ProgramCache, load_program, parse_program, parse_statements
+from pydatalog.symbols import SymbolTable
+
+_SOURCE = """% transitive closure
+path(X, Y) :- edge(X, Y) .
+path(X,
+     Z) :- edge(X, Y), path(Y, Z) .
+edge(a, b) :- .
+edge(b, c) :- .
+edge(c, d) :- .
+path(z, z) :- .
+"""
+
+
+def test_round_trip_through_printer():
+    X, Y = Variable("X"), Variable("Y")
+    p = program(
+        Rule(Atom("edge", (Constant("a"), Constant("Big City"))), ()),
+        Rule(Atom("edge", (Constant('say "hi"'), Constant("2.5"))), ()),
+        Rule(Atom("edge", (Constant("-3"), Constant(""))), ()),
+        Rule(Atom("flag", ()), ()),
+        Rule(Atom("node", (X,)), (Atom("edge", (X, Y)),)),
+        Rule(Atom("lonely", (X,)), (Atom("node", (X,)), negate(Atom("edge", (X, Y))), Atom("flag", ()))),
+        Rule(Atom("degree", (X, aggregate("count", Y))), (Atom("edge", (X, Y)),)),
+    )
+    assert parse_program(print_program(p)) == p
+
+
+def test_parse_statements_and_comments():
+    statements = list(parse_statements(_SOURCE.splitlines()))
+    assert statements[2:] == [("edge", ("a", "b")), ("edge", ("b", "c")), ("edge", ("c", "d")), ("path", ("z", "z"))]
+    assert isinstance(statements[1], Rule) and len(statements[1].body) == 2
+    # `not` alone is a relation; facts may also be written without `:-`
+    assert parse_program("p :- not . q(a).") == program(
+        Rule(Atom("p", ()), (Atom("not", ()),)),
+        Rule(Atom("q", (Constant("a"),)), ()),
+    )
+
+
+@pytest.mark.parametrize("text, message", [
+    ("p(a) :- .\nq(X) :- r(X)", "line 2: expected '.', found 'end of input'"),
+    ("p(a) :- .\n\nq(X) :- r(X) ; .", "line 3: unexpected character ';'"),
+    ("p(X) :- .", "line 1: fact 'p' must only hold constants"),
+    ("p(X) :- q(count(X)) .", "line 1: aggregate 'count' outside a rule head"),
+    ("p(a) :- . q(a b) :- .", r"line 1: expected '\)'"),
+])
+def test_errors_report_lines(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_program(text)
+
+
+def test_load_program_streams_edb_facts(tmp_path):
+    path = tmp_path / "tc.dl"
+    path.write_text(_SOURCE)
+    conn = sqlite3.connect(":memory:")
+    plan = load_program(path, conn, conn, strategy="seminaive", chunk_size=2)
+    # only the rules and the facts of derived relations became fact rules
+    assert len(plan._program.rules) == 3
+    assert Db(conn, "edge", 2).count() == 3
+    plan.execute()
+    assert sorted(plan.query("path", (0, "a"))) == [("a", "b"), ("a", "c"), ("a", "d")]
+    assert ("z", "z") in set(plan.query("path"))
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_load_program_queries_relations_only_given_by_facts(strategy):
+    conn = sqlite3.connect(":memory:")
+    plan = load_program("edge(a, b).\nnode(c).\n", conn, conn, strategy=strategy)
+    plan.execute()
+    assert list(plan.query("edge")) == [("a", "b")]
+    assert plan.count("node") == 1
+
+
+def test_load_program_reads_back_facts_streamed_before_their_rules():
+    source = "edge(a, b).\npath(z, z).\npath(y, z).\n" + _SOURCE.split("\n", 1)[1]
+    conn = sqlite3.connect(":memory:")
+    plan = load_program(source, conn, MemoryStore(), strategy="seminaive", chunk_size=1)
+    assert sorted(rule.head.relation for rule in plan._program.rules if not rule.body) == ["path", "path", "path"]
+    plan.execute()
+    assert set(plan.query("path", (1, "z"))) == {("z", "z"), ("y", "z")}
+    assert plan.count("path") == 8
+    with pytest.raises(ValueError, match="arity 1 of its facts"):
+        load_program("edge(a).\n" + _SOURCE, MemoryStore(), MemoryStore())
+
+
+def test_load_program_parses_the_source_once(monkeypatch):
+    from pydatalog import parser
+    calls = []
+    monkeypatch.setattr(parser, "_lines", lambda source, use_mmap: calls.append(source) or iter(source.splitlines()))
+    load_program(_SOURCE, MemoryStore(), MemoryStore())
+    assert len(calls) == 1
+
+
+def test_load_program_interned():
+    symbols = SymbolTable()
+    plan = load_program(_SOURCE, MemoryStore(), MemoryStore(), strategy="columnar", symbols=symbols)
+    plan.execute()
+    assert len(list(plan.query("path"))) == 7
+
+
+def test_load_program_arity_mismatch():
+    with pytest.raises(ValueError, match="arity 2"):
+        load_program(_SOURCE + "edge(a) :- .\n", MemoryStore(), MemoryStore())
+
+
+def test_program_cache(tmp_path, monkeypatch):
+    cache = ProgramCache(tmp_path / "cache")
+    first = load_program(_SOURCE, MemoryStore(), MemoryStore(), cache=cache, strategy="seminaive")
+    key = ProgramCache.key(_SOURCE)
+    assert cache.program(key) == first._program
+    # entries are plain data, never code to unpickle
+    json.loads((tmp_path / "cache" / f"{key}.program.json").read_text())
+
+    # a cache hit does not parse the rules again, but still plans its joins
+    from pydatalog import parser
+    monkeypatch.setattr(parser, "_fact_rule", None)
+    monkeypatch.setattr(parser._Statement, "parse", None)
+    edb = MemoryStore()
+    second = load_program(_SOURCE, MemoryStore(), edb, cache=cache, strategy="seminaive")
+    assert second._program == first._program
+    second.execute()
+    assert len(list(second.query("path"))) == 7
+    assert second.join_plans()
+
+    (tmp_path / "cache" / f"{key}.program.json").write_bytes(b"garbage")
+    assert cache.program(key) is None
+
+
+def test_program_cache_round_trips_negation_and_aggregates(tmp_path):
+    X, Y = Variable("X"), Variable("Y")
+    p = program(
+        Rule(Atom("degree", (X, aggregate("count", Y))), (Atom("edge", (X, Y)),)),
+        Rule(Atom("leaf", (X,)), (Atom("node", (X,)), negate(Atom("edge", (X, Y))))),
+        Rule(Atom("node", (Constant("a b"),)), ()),
+    )
+    cache = ProgramCache(tmp_path)
+    cache.store_program("k", p)
+    assert cache.program("k") == p
@@ -0,0 +1,325 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, negate, program
+from pydatalog.persistence import PlanState, RelationMark, fingerprint
+from pydatalog.profiling import Profiler
+from pydatalog.symbols import SymbolTable
+
+STRATEGIES = ["seminaive", "sql", "columnar"]
+
+
+def _rules(*extra):
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+        Rule(Atom("reach", (Constant("a"),)), ()),
+        Rule(Atom("reach", (Variable("Y"),)), (
+            Atom("reach", (Variable("X"),)),
+            Atom("edge", (Variable("X"), Variable("Y"))),
+        )),
+        *extra,
+    )
+
+
+def _closure(edges):
+    paths = set(edges)
+    while True:
+        new = {(x, w) for x, y in paths for z, w in edges if y == z} - paths
+        if not new:
+            return paths
+        paths |= new
+
+
+def _plan(path, strategy, rules=None, profiler=None):
+    conn = sqlite3.connect(path)
+    symbols = SymbolTable(conn) if strategy == "columnar" else None
+    plan = RulesPlan(
+        rules or _rules(), conn, conn, strategy=strategy, symbols=symbols, profiler=profiler, state=PlanState(conn)
+    )
+    return plan, conn
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_restart_over_unchanged_base_relations_skips_evaluation(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    conn.close()
+
+    profiler = Profiler()
+    plan, conn = _plan(path, strategy, profiler=profiler)
+    assert set(plan.query("path")) == {("a", "b"), ("b", "c"), ("a", "c")}
+    plan.execute()
+    assert set(plan.query("reach")) == {("a",), ("b",), ("c",)}
+    stats = plan.profile_stats()
+    assert stats.iterations == []
+    assert all(profile.firings == 0 for profile in stats.rules.values())
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_restart_after_appends_catches_up(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    conn.close()
+
+    # another process appends to the base relation
+    conn = sqlite3.connect(path)
+    encode = SymbolTable(conn).encode if strategy == "columnar" else tuple
+    Db(conn, "edge", 2, "INTEGER" if strategy == "columnar" else "TEXT").store_many(
+        [encode(("c", "d")), encode(("x", "a"))]
+    )
+    conn.close()
+
+    plan, conn = _plan(path, strategy)
+    assert set(plan.query("path")) == _closure({("a", "b"), ("b", "c"), ("c", "d"), ("x", "a")})
+    assert set(plan.query("reach")) == {("a",), ("b",), ("c",), ("d",)}
+    conn.close()
+
+    # the catch-up was saved: the next restart starts out executed
+    plan, conn = _plan(path, strategy)
+    assert plan._executed
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_catch_up_only_propagates_the_appended_tuples(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    edges = [(f"n{i}", f"n{i + 1}") for i in range(30)]
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", edges)
+    plan.execute()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    Db(conn, "edge", 2).store_many([("n30", "n31")])
+    conn.close()
+
+    profiler = Profiler()
+    plan, conn = _plan(path, strategy, profiler=profiler)
+    plan.execute()
+    assert plan.count("path") == 32 * 31 // 2
+    # one round per new path length ending at n31, not the 30 of a full evaluation
+    delta = sum(sum(iteration.delta.values()) for iteration in plan.profile_stats().iterations)
+    assert delta <= 1 + 31 + 1
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_restart_after_deletions_evaluates_again(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c"), ("c", "d")])
+    plan.execute()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    value = SymbolTable(conn).lookup("c") if strategy == "columnar" else "c"
+    conn.execute("DELETE FROM edge WHERE col0 = ?", (value,))
+    conn.commit()
+    conn.close()
+
+    plan, conn = _plan(path, strategy)
+    assert set(plan.query("path")) == {("a", "b"), ("b", "c"), ("a", "c")}
+    assert set(plan.query("reach")) == {("a",), ("b",), ("c",)}
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_restart_after_a_delete_and_an_insert_reusing_its_rowid_evaluates_again(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c"), ("c", "d")])
+    plan.execute()
+    conn.close()
+
+    # the watermark and the cardinality are what they were
+    conn = sqlite3.connect(path)
+    symbols = SymbolTable(conn) if strategy == "columnar" else None
+    encode = symbols.encode if symbols is not None else tuple
+    value = symbols.lookup("c") if symbols is not None else "c"
+    watermark = conn.execute("SELECT max(rowid) FROM edge").fetchone()
+    conn.execute("DELETE FROM edge WHERE col0 = ?", (value,))
+    Db(conn, "edge", 2, "INTEGER" if strategy == "columnar" else "TEXT").store_many([encode(("x", "a"))])
+    assert conn.execute("SELECT max(rowid) FROM edge").fetchone() == watermark
+    conn.commit()
+    conn.close()
+
+    plan, conn = _plan(path, strategy)
+    assert set(plan.query("path")) == _closure({("a", "b"), ("b", "c"), ("x", "a")})
+    assert set(plan.query("reach")) == {("a",), ("b",), ("c",)}
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_restart_after_an_update_in_place_evaluates_again(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c"), ("c", "d")])
+    plan.execute()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    symbols = SymbolTable(conn) if strategy == "columnar" else None
+    old, new = (symbols.lookup("b"), symbols.encode(("e",))[0]) if symbols is not None else ("b", "e")
+    conn.execute("UPDATE edge SET col1 = ? WHERE col1 = ?", (new, old))
+    conn.commit()
+    conn.close()
+
+    plan, conn = _plan(path, strategy)
+    assert set(plan.query("path")) == {("a", "e"), ("b", "c"), ("c", "d"), ("b", "d")}
+    assert set(plan.query("reach")) == {("a",), ("e",)}
+    conn.close()
+
+
+def test_base_relations_elsewhere_are_compared_by_content(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plan.db")
+    store = MemoryStore()
+    plan = RulesPlan(_rules(), conn, store, strategy="seminaive", state=PlanState(conn))
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    mark = plan._marks()["edge"]
+    assert mark.changes is None and mark.digest is not None
+    assert plan._marks() == {"edge": mark}
+    conn.close()
+
+
+def test_maintenance_updates_digests_without_scanning(tmp_path, monkeypatch):
+    from pydatalog import persistence
+    conn = sqlite3.connect(tmp_path / "plan.db")
+    plan = RulesPlan(_rules(), conn, MemoryStore(), strategy="seminaive", state=PlanState(conn))
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    scan = persistence.content_digest
+    monkeypatch.setattr(persistence, "content_digest", None)
+    plan.insert_facts("edge", [("c", "d"), ("c", "d")])
+    plan.retract_facts("edge", [("a", "b")])
+    digest = plan._snapshot.marks["edge"].digest
+    assert digest == scan([("b", "c"), ("c", "d")])
+    # a row already stored leaves the digest of its relation to a scan
+    monkeypatch.setattr(persistence, "content_digest", scan)
+    plan.insert_facts("edge", [("b", "c"), ("d", "e")])
+    assert plan._snapshot.marks["edge"].digest == scan([("b", "c"), ("c", "d"), ("d", "e")])
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_negation_downstream_of_appends_is_evaluated_again(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    unreached = Rule(Atom("unreached", (Variable("X"),)), (
+        Atom("node", (Variable("X"),)), negate(Atom("reach", (Variable("X"),))),
+    ))
+    plan, conn = _plan(path, strategy, _rules(unreached))
+    plan.load_facts("edge", [("a", "b")])
+    plan.load_facts("node", [("a",), ("b",), ("c",)])
+    plan.execute()
+    assert set(plan.query("unreached")) == {("c",)}
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    Db(conn, "edge", 2).store_many([("b", "c")])
+    conn.close()
+
+    plan, conn = _plan(path, strategy, _rules(unreached))
+    assert set(plan.query("unreached")) == set()
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_changed_program_discards_derived_tuples(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    conn.close()
+
+    # only direct edges are paths now
+    rules = program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("reach", (Constant("b"),)), ()),
+    )
+    plan, conn = _plan(path, strategy, rules)
+    assert not plan._executed
+    assert set(plan.query("path")) == {("a", "b"), ("b", "c")}
+    assert set(plan.query("reach")) == {("b",)}
+    conn.close()
+
+
+def test_incomplete_state_evaluates_again(tmp_path):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, "sql")
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    # as left by a process that stopped while rewriting path
+    conn.execute("DELETE FROM path WHERE col0 = 'a'")
+    PlanState(conn).invalidate(["path"])
+    conn.commit()
+    conn.close()
+
+    plan, conn = _plan(path, "sql")
+    assert not plan._executed
+    assert set(plan.query("path")) == {("a", "b"), ("b", "c"), ("a", "c")}
+    conn.close()
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_maintenance_keeps_the_state_current(tmp_path, strategy):
+    path = tmp_path / "plan.db"
+    plan, conn = _plan(path, strategy)
+    plan.load_facts("edge", [("a", "b"), ("b", "c")])
+    plan.execute()
+    plan.insert_facts("edge", [("c", "d")])
+    plan.retract_facts("edge", [("a", "b")])
+    conn.close()
+
+    profiler = Profiler()
+    plan, conn = _plan(path, strategy, profiler=profiler)
+    assert plan._executed
+    assert set(plan.query("path")) == {("b", "c"), ("c", "d"), ("b", "d")}
+    # a restored seminaive plan maintains its relations like an executed one
+    plan.insert_facts("edge", [("a", "c")])
+    assert set(plan.query("reach")) == {("a",), ("c",), ("d",)}
+    assert plan.profile_stats().iterations
+    conn.close()
+
+
+def test_state_round_trip():
+    conn = sqlite3.connect(":memory:")
+    state = PlanState(conn)
+    assert state.load() is None
+    saved = state.save("f", {"path", "reach"}, {"edge": RelationMark(3, 2, 0)})
+    assert state.load() == saved
+    state.invalidate(["path", "edge"])
+    snapshot = state.load()
+    assert snapshot.complete == {"reach"}
+    assert snapshot.marks == {"edge": RelationMark(3, 2, 0)}
+    state.clear()
+    assert state.load() is None
+
+
+def test_fingerprint_depends_on_program_and_interning():
+    assert fingerprint(_rules(), False) == fingerprint(_rules(), False)
+    assert fingerprint(_rules(), False) != fingerprint(_rules(), True)
+    fact = Rule(Atom("reach", (Constant("z"),)), ())
+    assert fingerprint(_rules(), False) != fingerprint(_rules(fact), False)
+
+
+def test_state_requires_a_bottom_up_strategy_and_sqlite_idb():
+    conn = sqlite3.connect(":memory:")
+    with pytest.raises(ValueError, match="bottom-up strategy"):
+        RulesPlan(_rules(), conn, conn, state=PlanState(conn))
+    with pytest.raises(ValueError, match="connection holding the idb relations"):
+        RulesPlan(_rules(), MemoryStore(), conn, strategy="seminaive", state=PlanState(conn))
+    with pytest.raises(ValueError, match="SymbolTable"):
+        RulesPlan(_rules(), conn, conn, strategy="columnar", symbols=SymbolTable(), state=PlanState(conn))
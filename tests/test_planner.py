@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+from pydatalog.planner import RelationStats, order_body
+from pydatalog.seminaive import _AtomSpec, _Const
+
+
+@pytest.mark.parametrize("make", [
+    lambda: Db(sqlite3.connect(":memory:"), "q", 2),
+    lambda: MemoryDb(MemoryStore(), "q", 2),
+], ids=["sqlite", "memory"])
+def test_statistics_track_writes(make):
+    q = make()
+    assert q.statistics() == RelationStats(0, (0, 0))
+    q.store_many([("a", "x"), ("a", "y"), ("b", "x")])
+    assert q.statistics() == RelationStats(3, (2, 2))
+    q.store(("c", "z"))
+    assert q.statistics() == RelationStats(4, (3, 3))
+
+
+def test_order_body_prefers_selective_bound_atoms():
+    body = [
+        _AtomSpec("big", (0, 1)),
+        _AtomSpec("small", (1, 2)),
+        _AtomSpec("tag", (_Const("t"), 2)),
+    ]
+    stats = {
+        "big": RelationStats(10000, (100, 100)),
+        "small": RelationStats(50, (50, 10)),
+        "tag": RelationStats(20, (2, 20)),
+    }
+    # tag has a constant column, then small joins on it, big joins last on a bound column
+    assert order_body(body, stats) == (2, 1, 0)
+    # a driving delta atom always comes first
+    assert order_body(body, stats, first=0) == (0, 1, 2)
+
+
+def _selective_rules():
+    return program(
+        Rule(Atom("r", (Variable("X"), Variable("Z"))), (
+            Atom("big", (Variable("X"), Variable("Y"))),
+            Atom("big", (Variable("Y"), Variable("Z"))),
+            Atom("pick", (Variable("X"),)),
+        )),
+    )
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_join_plans_reorder_and_preserve_results(strategy):
+    results = []
+    for reorder in (False, True):
+        conn = sqlite3.connect(":memory:")
+        big = Db(conn, "big", 2)
+        big.store_many([(f"n{i}", f"n{(i * 7) % 40}") for i in range(40)])
+        pick = Db(conn, "pick", 1)
+        pick.store(("n1",))
+        plan = RulesPlan(_selective_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy, reorder_joins=reorder)
+        plan.execute()
+        results.append(set(plan.query("r")))
+        if reorder:
+            plans = {p.delta_idx: p for p in plan.join_plans()}
+            if strategy != "tuple":
+                assert plans[None].order[0] == 2
+                assert plans[None].patterns == ((), (0,), (0,))
+            assert plans[0].order[0] == 0
+            assert plans[1].order[:2] == (1, 0)
+        conn.close()
+    assert results[0] == results[1] == {("n1", "n9")}
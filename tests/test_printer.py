@@ -28,3 +28,24 @@ def test_print_zero_arity_atom():
     # A zero-arity atom prints as just the relation name
     prog = Program(rules=(Rule(Atom("start"), ()),))
     assert print_program(prog) == "start :- ."
+
+
+def test_print_negated_atom():
+    prog = Program(rules=(
+        Rule(Atom("unreached", (Variable("X"),)), (
+            Atom("node", (Variable("X"),)),
+            Atom("reach", (Variable("X"),), negated=True),
+        )),
+    ))
+    assert print_program(prog) == "unreached(X) :- node(X), not reach(X) ."
+
+
+def test_print_aggregate_head():
+    from pydatalog import aggregate
+
+    prog = Program(rules=(
+        Rule(Atom("degree", (Variable("X"), aggregate("count", Variable("Y")))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+        )),
+    ))
+    assert print_program(prog) == "degree(X, count(Y)) :- edge(X, Y) ."
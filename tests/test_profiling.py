@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, program
+from pydatalog.profiling import Profiler
+from pydatalog.symbols import SymbolTable
+
+
+def _tc():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+_EDGES = [("a", "b"), ("b", "c"), ("c", "d"), ("a", "c")]
+_PATHS = 6
+
+
+def test_disabled_by_default():
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_tc(), conn, conn, strategy="seminaive")
+    assert plan.profile_stats() is None
+    # storage methods are the class's own, not wrappers
+    assert "load" not in vars(plan._heads["edge"]._storage)
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql", "columnar"])
+def test_rule_and_relation_counters(strategy):
+    conn = sqlite3.connect(":memory:")
+    profiler = Profiler()
+    symbols = SymbolTable() if strategy == "columnar" else None
+    plan = RulesPlan(_tc(), conn, conn, strategy=strategy, symbols=symbols, profiler=profiler)
+    plan.load_facts("edge", _EDGES)
+    plan.execute()
+    assert len(list(plan.query("path"))) == _PATHS
+
+    stats = plan.profile_stats()
+    assert set(stats.rules) == {0, 1}
+    assert all(rule.firings > 0 for rule in stats.rules.values())
+    # every path tuple was produced once without being a duplicate
+    assert sum(rule.produced - rule.duplicates for rule in stats.rules.values()) == _PATHS
+    assert stats.relations["edge"].rows_stored == len(_EDGES)
+    assert stats.relations["path"].rows_stored == _PATHS
+    assert stats.relations["path"].loads > 0
+    if strategy != "sql":
+        assert stats.rules[1].probes > 0
+    if strategy != "tuple":
+        assert sum(sum(iteration.delta.values()) for iteration in stats.iterations) == _PATHS
+        assert [iteration.index for iteration in stats.iterations] == list(range(len(stats.iterations)))
+
+
+def test_hooks_and_incremental_iterations():
+    loads, stores, iterations = [], [], []
+    profiler = Profiler(
+        on_load=lambda relation, rows, seconds: loads.append((relation, rows)),
+        on_store=lambda relation, added, deleted, seconds: stores.append((relation, added, deleted)),
+        on_iteration=iterations.append,
+    )
+    store = MemoryStore()
+    plan = RulesPlan(_tc(), store, store, strategy="seminaive", profiler=profiler)
+    plan.load_facts("edge", _EDGES)
+    assert stores == [("edge", len(_EDGES), 0)]
+    plan.execute()
+    assert ("edge", len(_EDGES)) in loads
+    assert iterations == profiler.iterations
+    before = len(iterations)
+    plan.insert_facts("edge", [("d", "e")])
+    assert sum(sum(i.delta.values()) for i in iterations[before:]) == 5
+    plan.retract_facts("edge", [("d", "e")])
+    assert profiler.relations["path"].rows_deleted == 4
+
+    snapshot = profiler.stats()
+    profiler.reset()
+    assert profiler.rules == {} and snapshot.rules[1].produced > 0
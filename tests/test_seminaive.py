@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.execution import RulesPlan
+from pydatalog.db import Db
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+
+
+def _path_rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+def test_seminaive_transitive_closure_matches_tuple_strategy():
+    results = []
+    for strategy in ("tuple", "seminaive"):
+        conn = sqlite3.connect(":memory:")
+        edge = Db(conn, "edge", 2)
+        for e in [("a", "b"), ("b", "c"), ("c", "d"), ("d", "b")]:
+            edge.store(e)
+        plan = RulesPlan(_path_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+        plan.execute()
+        results.append(set(plan.query("path")))
+        conn.close()
+    assert results[0] == results[1]
+    assert ("a", "d") in results[1] and ("d", "d") in results[1]
+
+
+def test_seminaive_long_chain():
+    conn = sqlite3.connect(":memory:")
+    edge = Db(conn, "edge", 2)
+    n = 60
+    for i in range(n):
+        edge.store((f"n{i}", f"n{i + 1}"))
+    plan = RulesPlan(_path_rules(), idb_storage=conn, edb_storage=conn, strategy="seminaive")
+    plan.execute()
+    assert len(set(plan.query("path"))) == n * (n + 1) // 2
+    assert set(plan.query("path", (0, f"n{n - 1}"))) == {(f"n{n - 1}", f"n{n}")}
+    conn.close()
+
+
+def test_seminaive_facts_constants_and_mutual_recursion():
+    conn = sqlite3.connect(":memory:")
+    succ = Db(conn, "succ", 2)
+    for i in range(0, 6):
+        succ.store((str(i), str(i + 1)))
+    rules = program(
+        Rule(Atom("even", (Constant("0"),)), ()),
+        Rule(Atom("odd", (Variable("Y"),)), (
+            Atom("succ", (Variable("X"), Variable("Y"))),
+            Atom("even", (Variable("X"),)),
+        )),
+        Rule(Atom("even", (Variable("Y"),)), (
+            Atom("succ", (Variable("X"), Variable("Y"))),
+            Atom("odd", (Variable("X"),)),
+        )),
+        Rule(Atom("tagged", (Constant("odd"), Variable("X"))), (Atom("odd", (Variable("X"),)),)),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy="seminaive")
+    plan.execute()
+    assert set(plan.query("even")) == {("0",), ("2",), ("4",), ("6",)}
+    assert set(plan.query("odd")) == {("1",), ("3",), ("5",)}
+    assert set(plan.query("tagged", (1, "3"))) == {("odd", "3")}
+    conn.close()
+
+
+def test_seminaive_query_executes_on_demand():
+    conn = sqlite3.connect(":memory:")
+    a = Db(conn, "a", 2)
+    a.store(("x", "c"))
+    a.store(("y", "d"))
+    rules = program(
+        Rule(Atom("r", (Variable("X"),)), (Atom("a", (Variable("X"), Constant("c"))),)),
+    )
+    plan = RulesPlan(rules, idb_storage=conn, edb_storage=conn, strategy="seminaive")
+    assert list(plan.query("r")) == [("x",)]
+    conn.close()
+
+
+def test_unknown_strategy_rejected():
+    conn = sqlite3.connect(":memory:")
+    with pytest.raises(ValueError):
+        RulesPlan(program(), idb_storage=conn, edb_storage=conn, strategy="magic")
+    conn.close()
@@ -0,0 +1,112 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, program
+from pydatalog.symbols import SymbolTable
+
+
+def _rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+EDGES = [(f"n{i}", f"n{i + 1}") for i in range(20)]
+
+
+def _paths_from(i):
+    return {(f"n{i}", f"n{j}") for j in range(i + 1, 21)}
+
+
+def _serve_concurrently(server, threads=8, rounds=40):
+    def work(n):
+        i = n % 20
+        rows = set(server.query("path", (0, f"n{i}")))
+        assert rows == _paths_from(i)
+        assert server.count("path", (0, f"n{i}")) == 20 - i
+        return len(rows)
+
+    with ThreadPoolExecutor(threads) as pool:
+        return sum(pool.map(work, range(rounds)))
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_file_backed_plan_serves_from_read_only_connections(tmp_path, strategy):
+    conn = sqlite3.connect(tmp_path / "plan.db")
+    plan = RulesPlan(_rules(), conn, conn, strategy=strategy)
+    plan.load_facts("edge", EDGES)
+    with plan.serve() as server:
+        assert _serve_concurrently(server) == sum(20 - n % 20 for n in range(40))
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        reader = server._relation("path")
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            reader._db_connection.execute("INSERT INTO path VALUES ('x', 'y')")
+    conn.close()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_in_memory_plan_serves_from_snapshots(backend):
+    store = MemoryStore() if backend == "memory" else sqlite3.connect(":memory:")
+    plan = RulesPlan(_rules(), store, store, strategy="seminaive")
+    plan.load_facts("edge", EDGES)
+    server = plan.serve()
+    assert not server._files
+    _serve_concurrently(server)
+    server.close()
+
+
+def test_interned_plan_decodes_served_rows(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plan.db")
+    plan = RulesPlan(_rules(), conn, conn, strategy="columnar", symbols=SymbolTable(conn))
+    plan.load_facts("edge", EDGES)
+    with plan.serve() as server:
+        _serve_concurrently(server)
+        assert list(server.query("path", (0, "unknown"))) == []
+        assert server.count("path", (0, "unknown")) == 0
+    conn.close()
+
+
+def test_served_queries_push_down_pagination(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plan.db")
+    plan = RulesPlan(_rules(), conn, conn, strategy="sql")
+    plan.load_facts("edge", EDGES)
+    with plan.serve() as server:
+        page = list(server.query("path", (0, "n0"), columns=[1], distinct=True, limit=3))
+        assert page == [("n1",), ("n10",), ("n11",)]
+        rest = list(server.query("path", (0, "n0"), columns=[1], distinct=True, after=page[-1]))
+        assert len(rest) == 17
+        assert server.count("path", columns=[0]) == 20
+        assert list(server.query("missing")) == []
+    conn.close()
+
+
+def test_frozen_plan_refuses_writes_until_the_server_is_closed():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many(EDGES)
+    plan = RulesPlan(_rules(), conn, conn, strategy="seminaive")
+    server = plan.serve()
+    for write in (
+        lambda: plan.insert_facts("edge", [("n20", "n21")]),
+        lambda: plan.retract_facts("edge", [("n0", "n1")]),
+        lambda: plan.load_facts("edge", [("n20", "n21")]),
+        plan.execute,
+        plan.serve,
+    ):
+        with pytest.raises(ValueError, match="frozen"):
+            write()
+    server.close()
+    with pytest.raises(ValueError, match="closed"):
+        list(server.query("path"))
+    plan.insert_facts("edge", [("n20", "n21")])
+    # the snapshot of a new server holds the update
+    with plan.serve() as server:
+        assert server.count("path", (1, "n21")) == 21
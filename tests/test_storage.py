@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from pydatalog import storage
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, program
+
+
+def _backends():
+    return [sqlite3.connect(":memory:"), MemoryStore()]
+
+
+@pytest.mark.parametrize("backend", _backends(), ids=["sqlite", "memory"])
+def test_backends_implement_storage_protocol(backend):
+    relation = storage.factory(backend)("q", 2)
+    assert (relation.relation, relation.arity) == ("q", 2)
+    mark = relation.watermark()
+    assert relation.store_many([("a", "b"), ("a", "c")]) == 2
+    second = relation.watermark()
+    with relation.batch():
+        relation.store(("d", "c"))
+        relation.store(("a", "b"))
+    assert relation.count() == 3
+    assert relation.count((0, "a")) == 2
+    assert relation.count((1, "c"), (0, "d")) == 1
+    assert list(relation.load_since(mark)) == [("a", "b"), ("a", "c"), ("d", "c")]
+    assert list(relation.load_since(second)) == [("d", "c")]
+    assert list(relation.load_since(relation.watermark())) == []
+    version = relation.version()
+    assert relation.store(("a", "b")) is False
+    assert relation.version() == version
+    assert storage.factory(backend)("q", 2).delete_many([("d", "c")]) == 1
+    assert relation.version() > version
+
+
+def test_sqlite_versions_follow_the_connection():
+    conn = sqlite3.connect(":memory:")
+    relation = Db(conn, "q", 2)
+    version = relation.version()
+    conn.execute("INSERT INTO q VALUES ('a', 'b')")
+    assert relation.version() > version
+    # counters belong to the connection, a new one starts afresh
+    assert Db(sqlite3.connect(":memory:"), "q", 2).version() == 0
+
+
+def test_factory_resolution():
+    conn = sqlite3.connect(":memory:")
+    assert isinstance(storage.factory(conn)("q", 1), Db)
+    assert isinstance(storage.factory(MemoryStore())("q", 1), MemoryDb)
+    custom = lambda relation, arity: MemoryDb(MemoryStore(), relation, arity)
+    assert storage.factory(custom) is custom
+    with pytest.raises(TypeError):
+        storage.factory(42)
+    conn.close()
+
+
+def test_rules_plan_with_routing_factory():
+    conn = sqlite3.connect(":memory:")
+    store = MemoryStore()
+    edge = Db(conn, "edge", 2)
+    edge.store_many([("a", "b"), ("b", "c")])
+    opened = []
+
+    def idb(relation, arity):
+        opened.append(relation)
+        # keep the hot recursive relation in memory, everything else on sqlite
+        if relation == "path":
+            return MemoryDb(store, relation, arity)
+        return Db(conn, relation, arity)
+
+    rules = program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+        Rule(Atom("start", (Variable("X"),)), (Atom("path", (Variable("X"), Variable("Y"))),)),
+    )
+    plan = RulesPlan(rules, idb_storage=idb, edb_storage=conn, strategy="seminaive")
+    plan.execute()
+    assert opened == ["path", "start"]
+    assert set(MemoryDb(store, "path", 2).load()) == {("a", "b"), ("b", "c"), ("a", "c")}
+    assert set(Db(conn, "start", 1).load()) == {("a",), ("b",)}
+    conn.close()
@@ -0,0 +1,166 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, program
+from pydatalog.subgoals import SubgoalStats, SubgoalTable
+
+
+def _rules():
+    return program(
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+    )
+
+
+class _CountingDb(MemoryDb):
+    loads = 0
+
+    def load(self, *keys):
+        _CountingDb.loads += 1
+        return super().load(*keys)
+
+
+def test_table_evicts_least_recently_used_and_counts():
+    table = SubgoalTable(max_size=2)
+    assert table.explore("p", ((0, "a"),)) is False
+    assert table.explore("p", ((0, "b"),)) is False
+    table.complete("q", (), [("x",)])
+    # explored subgoals are only evicted by trim()
+    assert len(table) == 3
+    assert table.explore("p", ((0, "a"),)) is True
+    table.trim()
+    assert table.answers("q", ()) == [("x",)]
+    assert table.explore("p", ((0, "b"),)) is False
+    assert table.invalidate(["q", "r"]) == 1
+    assert table.answers("q", ()) is None
+    assert table.stats() == SubgoalStats(
+        hits=2, misses=4, evictions=1, invalidations=1, oversized=0, size=2, rows=0
+    )
+    with pytest.raises(ValueError):
+        SubgoalTable(max_size=-1)
+
+
+def test_table_bounds_the_rows_it_keeps():
+    table = SubgoalTable(max_rows=5, max_answer_rows=3)
+    assert table.complete("p", ((0, "a"),), [("a", "1"), ("a", "2")]) is True
+    assert table.complete("p", ((0, "b"),), [("b", "1"), ("b", "2"), ("b", "3")]) is True
+    assert table.complete("p", ((0, "c"),), [("c", str(i)) for i in range(4)]) is False
+    assert table.answers("p", ((0, "c"),)) is None
+    assert table.answers("p", ((0, "a"),)) is not None
+    # the least recently used answers go first once there are too many rows
+    table.complete("p", ((0, "d"),), [("d", "1")])
+    table.trim()
+    assert table.answers("p", ((0, "b"),)) is None
+    assert table.stats().rows == 3
+    assert table.stats().oversized == 1
+    assert table.invalidate(["p"]) == 2
+    assert table.stats().rows == 0
+
+
+def test_plan_keeps_only_small_goal_directed_answers():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b"), ("b", "c")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy="seminaive", max_answer_rows=1)
+    assert len(set(plan.query("path", (0, "a")))) == 2
+    assert set(plan.query("path", (0, "b"))) == {("b", "c")}
+    stats = plan.subgoal_stats()
+    assert (stats.size, stats.rows, stats.oversized) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_goal_directed_query_reuses_completed_answers(strategy):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b"), ("b", "c"), ("c", "d")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    expected = {("a", "b"), ("a", "c"), ("a", "d")}
+    assert set(plan.query("path", (0, "a"))) == expected
+    hits = plan.subgoal_stats().hits
+    assert set(plan.query("path", (0, "a"))) == expected
+    assert plan.subgoal_stats().hits == hits + 1
+    conn.close()
+
+
+def test_explored_subgoals_skip_derivation():
+    store = MemoryStore()
+    MemoryDb(store, "edge", 2).store_many([("a", "b"), ("b", "c")])
+    factory = lambda relation, arity: _CountingDb(store, relation, arity)
+    plan = RulesPlan(_rules(), idb_storage=factory, edb_storage=factory)
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c")}
+    loads = _CountingDb.loads
+    hits = plan.subgoal_stats().hits
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c")}
+    # the answers are read once more, without exploring the subgoal again
+    assert _CountingDb.loads == loads + 1
+    assert plan.subgoal_stats().hits == hits + 1
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_queries_stream_in_batches(strategy):
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([(f"n{i}", f"n{i + 1}") for i in range(30)])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy)
+    plan.execute()
+    path = plan._heads["path"]._storage
+    calls = []
+    select = path.select
+    path.select = lambda *args: calls.append(args) or select(*args)
+    rows = plan.query("path", (0, "n0"), batch_size=7)
+    assert next(rows) is not None
+    assert len(list(rows)) == 29
+    assert [args[-1] for args in calls] == [7]
+    # no answers were kept on the way
+    assert plan.subgoal_stats().rows == 0
+
+
+@pytest.mark.parametrize("backend", [sqlite3.connect, lambda _: MemoryStore()], ids=["sqlite", "memory"])
+def test_writes_to_base_relations_invalidate_subgoals(backend):
+    conn = backend(":memory:")
+    edge = Db(conn, "edge", 2) if isinstance(conn, sqlite3.Connection) else MemoryDb(conn, "edge", 2)
+    edge.store_many([("a", "b")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn)
+    assert set(plan.query("path", (0, "a"))) == {("a", "b")}
+    # written behind the plan's back, through another storage object
+    other = Db(conn, "edge", 2) if isinstance(conn, sqlite3.Connection) else MemoryDb(conn, "edge", 2)
+    other.store(("b", "c"))
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c")}
+    assert plan.subgoal_stats().invalidations > 0
+    plan.insert_facts("edge", [("c", "d")])
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c"), ("a", "d")}
+    plan.retract_facts("edge", [("b", "c")])
+    assert set(plan.query("path", (0, "a"))) == {("a", "b")}
+
+
+def test_sqlite_subgoals_survive_the_plans_own_writes():
+    conn = sqlite3.connect(":memory:")
+    Db(conn, "edge", 2).store_many([("a", "b"), ("b", "c")])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn)
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c")}
+    hits = plan.subgoal_stats().hits
+    # deriving path wrote to the connection, yet the subgoal is still explored
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c")}
+    assert plan.subgoal_stats().hits == hits + 1
+    assert plan.subgoal_stats().invalidations == 0
+    # raw SQL on the connection is noticed too
+    conn.execute("INSERT INTO edge VALUES ('c', 'd')")
+    assert set(plan.query("path", (0, "a"))) == {("a", "b"), ("a", "c"), ("a", "d")}
+    conn.close()
+
+
+def test_table_size_is_bounded():
+    conn = sqlite3.connect(":memory:")
+    nodes = [f"n{i}" for i in range(30)]
+    Db(conn, "edge", 2).store_many(zip(nodes, nodes[1:]))
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, max_subgoals=8)
+    for start in reversed(nodes):
+        assert len(set(plan.query("path", (0, start)))) == len(nodes) - 1 - nodes.index(start)
+    stats = plan.subgoal_stats()
+    assert stats.size <= 8
+    assert stats.evictions > 0
+    conn.close()
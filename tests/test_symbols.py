@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from pydatalog.db import Db
+from pydatalog.execution import RulesPlan
+from pydatalog.memory import MemoryDb, MemoryStore
+from pydatalog.nodes import Rule, Atom, Variable, Constant, program
+from pydatalog.symbols import SymbolTable
+
+
+def _rules(*facts):
+    return program(
+        *facts,
+        Rule(Atom("path", (Variable("X"), Variable("Y"))), (Atom("edge", (Variable("X"), Variable("Y"))),)),
+        Rule(Atom("path", (Variable("X"), Variable("Z"))), (
+            Atom("edge", (Variable("X"), Variable("Y"))),
+            Atom("path", (Variable("Y"), Variable("Z"))),
+        )),
+        Rule(Atom("from_b", (Variable("Y"),)), (Atom("path", (Constant("b"), Variable("Y"))),)),
+    )
+
+
+def test_symbol_table_interns_and_persists():
+    conn = sqlite3.connect(":memory:")
+    symbols = SymbolTable(conn)
+    assert symbols.encode(("a", "b", "a")) == (0, 1, 0)
+    assert symbols.decode((1, 0)) == ("b", "a")
+    assert symbols.lookup("c") is None
+    reopened = SymbolTable(conn)
+    assert len(reopened) == 2
+    assert reopened.intern("b") == 1
+    assert reopened.intern("c") == 2
+
+
+@pytest.mark.parametrize("strategy", ["tuple", "seminaive", "sql"])
+def test_interned_plan_matches_plain_plan(strategy):
+    results = []
+    for symbols in (None, SymbolTable()):
+        conn = sqlite3.connect(":memory:")
+        fact = Rule(Atom("edge", (Constant("a"), Constant("b"))), ())
+        plan = RulesPlan(_rules(fact), idb_storage=conn, edb_storage=conn, strategy=strategy, symbols=symbols)
+        plan.insert_facts("edge", [("b", "c"), ("c", "d")])
+        plan.execute()
+        results.append((
+            set(plan.query("path")),
+            set(plan.query("path", (0, "b"))),
+            set(plan.query("from_b")),
+            list(plan.query("path", (0, "unknown"))),
+        ))
+        if symbols is not None:
+            # relations hold integer symbol ids
+            assert {row[0] for row in conn.execute("SELECT DISTINCT typeof(col0) FROM path")} == {"integer"}
+            assert set(Db(conn, "edge", 2, column_type="INTEGER").load()) == {
+                symbols.encode(row) for row in [("a", "b"), ("b", "c"), ("c", "d")]
+            }
+        conn.close()
+    assert results[0] == results[1]
+    assert results[0][2] == {("c",), ("d",)}
+
+
+@pytest.mark.parametrize("strategy", ["seminaive", "sql"])
+def test_interned_updates_and_goal_directed_query(strategy):
+    conn = sqlite3.connect(":memory:")
+    symbols = SymbolTable(conn)
+    Db(conn, "edge", 2, column_type="INTEGER").store_many([symbols.encode(("x", "y"))])
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, strategy=strategy, symbols=symbols)
+    assert set(plan.query("path", (0, "x"))) == {("x", "y")}
+    plan.execute()
+    assert plan.insert_facts("edge", [("y", "z")]) == 1
+    assert ("x", "z") in set(plan.query("path"))
+    assert plan.retract_facts("edge", [("y", "z"), ("never", "seen")]) == 1
+    assert set(plan.query("path")) == {("x", "y")}
+    conn.close()
+
+
+def test_interned_memory_backend():
+    symbols = SymbolTable()
+    edb = MemoryStore()
+    MemoryDb(edb, "edge", 2).store_many([symbols.encode(("b", "c"))])
+    plan = RulesPlan(_rules(), idb_storage=MemoryStore(), edb_storage=edb, strategy="seminaive", symbols=symbols)
+    assert set(plan.query("from_b")) == {("c",)}
+
+
+def test_interned_pages_follow_symbol_ids():
+    symbols = SymbolTable()
+    conn = sqlite3.connect(":memory:")
+    plan = RulesPlan(_rules(), idb_storage=conn, edb_storage=conn, symbols=symbols)
+    plan.load_facts("edge", [("z", "y"), ("y", "x"), ("x", "w")])
+    # pages are ordered by symbol id, i.e. by first appearance here
+    first = list(plan.query("path", columns=[0], distinct=True, limit=2))
+    assert first == [("z",), ("y",)]
+    assert list(plan.query("path", columns=[0], distinct=True, after=first[-1])) == [("x",)]
+    assert plan.count("path", (0, "z")) == 3
+    assert plan.count("path", (0, "never")) == 0
+    with pytest.raises(ValueError):
+        list(plan.query("path", after=("z", "never")))
+    conn.close()